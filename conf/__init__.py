@@ -1,5 +1,15 @@
 from conf.base.config import Config
 from conf.base.logger import Logger
-from conf.base.loguru_logger import LoguruLogger
+from conf.base.tracer import Tracer
 
-loguru_logger = LoguruLogger.make_logger()
+
+def __getattr__(name):
+    # The loguru logger (and its uvicorn handler setup) is only built when first imported, e.g. by the API
+    if name == 'LoguruLogger':
+        from conf.base.loguru_logger import LoguruLogger
+        return LoguruLogger
+    if name == 'loguru_logger':
+        from conf.base.loguru_logger import LoguruLogger
+        globals()['loguru_logger'] = LoguruLogger.make_logger()
+        return globals()['loguru_logger']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from collections import OrderedDict
 from datetime import timedelta
@@ -27,8 +28,99 @@ class Config(object):
         REPORTING=Path('data', '08_reporting'),
     )
 
-    for file, file_path in FILES.items():
-        Path(file_path).mkdir(parents=True, exist_ok=True)
+    # ================================================================================
+    # Logging Settings (conf.Logger)
+    # ================================================================================
+    LOGGING = dict(
+        LEVEL=7,  # 7 (START) logs everything, 20 (INFO) skips debug messages before they are formatted
+        SINK='logging',  # 'logging': console + rotating file handlers, 'loguru': forward to the LoguruLogger sinks
+    )
+
+    # ================================================================================
+    # Tracing Settings (conf.Tracer)
+    # View exported traces with `python -m conf.base.trace_viewer [--trace-id <id>]`
+    # ================================================================================
+    TRACING = dict(
+        ENABLED=True,
+        EXPORT_PATH=Path('logs', 'traces.jsonl'),  # Spans are appended as one JSON object per line
+    )
+
+    # ================================================================================
+    # Data Loading
+    # ================================================================================
+    DATA_LOADING = dict(
+        COMPACT_DTYPES=False,  # Downcast numerics and convert repeated strings to categoricals when loading inputs
+        CATEGORICAL_MAX_UNIQUE_RATIO=0.5,  # Maximum unique values/rows ratio for a string column to become categorical
+        STRING_DTYPE=None,  # Dtype for the remaining string columns, e.g. 'string[pyarrow]' on pandas>=1.3
+        PROCESS_POOL_MIN_BYTES=32 * 1024 ** 2,  # Smaller files load on threads, a worker process costs more to start
+        MP_CONTEXT='spawn',  # Not 'fork', the API processes run threads (e.g. the logging queue listener)
+    )
+
+    # ================================================================================
+    # Cloud Object Cache
+    # Read-through cache for AzureBlobStorage/AWSS3Bucket downloads, validated by ETag/Last-Modified
+    # ================================================================================
+    CLOUD_CACHE = dict(
+        DIR=Path('data', '.cloud_cache'),
+        MAX_SIZE_BYTES=5 * 1024 ** 3,  # Least recently used objects are evicted beyond this size
+        EVICT_TO_FRACTION=0.8,  # Eviction goes down to this fraction of MAX_SIZE_BYTES, so it does not run every miss
+        OFFLINE=False,  # Serve only from the cache without contacting the cloud storage
+    )
+
+    # ================================================================================
+    # Model Build Cache (src/optimisation_model/model_cache.py)
+    # Built models are kept per input data, scenario and objective/constraint toggles, and reused with the scalar
+    # coefficients of later runs
+    # ================================================================================
+    MODEL_CACHE = dict(
+        ENABLED=True,
+        MAX_ELEMENTS=5_000_000,  # Least recently used models are evicted beyond this many variables + constraints
+        MAX_MODELS_PER_STRUCTURE=4,  # Idle models kept per structure, for concurrent runs of the same structure
+    )
+
+    # ================================================================================
+    # API Settings
+    # Warm-up loads the inputs once per process; with gunicorn's preload (conf/base/gunicorn_config.py) it runs in
+    # the master process and is shared copy-on-write by the forked workers
+    # ================================================================================
+    API = dict(
+        WARM_UP=True,  # Load the Preprocessing snapshot and distance matrix before reporting ready on /ready
+        BUILD_BASE_MODEL=True,  # Also build a model with default inputs, kept by the ModelCache for later runs
+        COMPRESSION_MIN_BYTES=1024,  # Smaller responses are not compressed, whatever the Accept-Encoding
+        GZIP_LEVEL=6,
+        BROTLI_QUALITY=4,  # 0-11, higher qualities compress large results much slower for a few % smaller bodies
+    )
+
+    # ================================================================================
+    # Solve Scheduler Settings (shared by all API workers on the machine through lock files)
+    # ================================================================================
+    SOLVE_SCHEDULER = dict(
+        ENABLED=True,
+        LOCK_DIR=Path(tempfile.gettempdir(), 'my-law-project', 'solve_scheduler'),
+        MAX_CONCURRENT_SOLVES=None,  # Defaults to number of cores // MIN_THREADS_PER_SOLVE
+        MIN_THREADS_PER_SOLVE=1,  # Solves wait until this many cores are not used by the other running solves
+        MAX_THREADS_PER_SOLVE=4,  # CBC threads are assigned from the cores not used by the other running solves
+        MAX_QUEUE_LENGTH=20,  # Further solves are rejected (HTTP 429) until the queue shortens
+        TICKET_GRACE_SECONDS=5,  # Younger queue tickets are live even if not locked yet by their process
+        QUEUE_TIMEOUT_SECONDS=600,  # Maximum wait for a slot when the request has no deadline
+        POLL_INTERVAL_SECONDS=0.1,
+        DEADLINE_GRACE_SECONDS=10,  # Time allowed past a deadline for the solver to stop at its own time limit
+        DEFAULT_RETRY_AFTER_SECONDS=60,  # Used for Retry-After until solve durations have been observed
+    )
+
+    # ================================================================================
+    # Single-Flight Settings (src/optimisation_model/single_flight.py)
+    # Identical optimisation requests arriving while one is being solved wait for its result instead of solving again,
+    # within a worker and, through lock files, across the workers on the machine
+    # ================================================================================
+    SINGLE_FLIGHT = dict(
+        ENABLED=True,
+        # Results are unpickled from here, so it is private to the user (0o700, checked before use)
+        LOCK_DIR=Path(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                      f"my-law-project-{os.getuid()}" if hasattr(os, 'getuid') else 'my-law-project', 'single_flight'),
+        POLL_INTERVAL_SECONDS=0.1,
+        RESULT_TTL_SECONDS=300,  # Results written for the other workers' waiting requests are removed after this
+    )
 
     # ================================================================================
     # MLFlow Settings
@@ -46,6 +138,9 @@ class Config(object):
     OPTIMISATION_MODEL_CONFIG = dict(
         
         SOLVER_TYPE='cbc',
+        SOLVER_TEE=False,  # Echo the solver output to the console, it is always written to SOLVER_LOG_DIR
+        SOLVER_LOG_DIR=Path('logs', 'solver'),  # One log file per solve, None to keep no solver logs
+        MAX_SOLVER_LOG_FILES=500,  # Oldest solver logs are removed beyond this count
 
         SOLVER_OPTION=dict(
             cbc={
@@ -53,9 +148,54 @@ class Config(object):
                 'nodeStrategy': 'hybrid',
                 'seconds': 600,
             }
-        ),        
+        ),
     )
 
+    # ================================================================================
+    # Solve Profiles (latency tiers selectable per request, see src/optimisation_model/solve_profiles.py)
+    # METHOD: 'lp_rounding' solves the LP relaxation and then the MIP over the warehouses it uses, 'mip' solves the
+    #   full MIP, warm started from the 'lp_rounding' solution if WARM_START, 'lagrangian' loads the best feasible
+    #   solution of the Lagrangian relaxation (Config.LAGRANGIAN) without solving the MIP.
+    # TIME_BUDGET_SECONDS: End-to-end limit (including pre- and postprocessing), RESERVE_SECONDS of which are kept
+    #   for postprocessing when capping the solver time.
+    # SOLVER_OPTION: Overrides OPTIMISATION_MODEL_CONFIG['SOLVER_OPTION'] for the profile.
+    # LAGRANGIAN_BOUND: Also run the Lagrangian relaxation after solving, its bound is reported in the solve summary and
+    #   tightens the gap, and its solution is loaded if better than the solver's.
+    # ================================================================================
+    SOLVE_PROFILES = dict(
+        fast=dict(
+            METHOD='lp_rounding',
+            WARM_START=False,
+            TIME_BUDGET_SECONDS=10,
+            RESERVE_SECONDS=1,
+            ROUNDING_THRESHOLD=1e-6,  # Warehouses with LP values at or below this are closed
+            LAGRANGIAN_BOUND=True,
+            SOLVER_OPTION=dict(cbc={'ratioGap': 0.05, 'seconds': 3}),
+        ),
+        balanced=dict(
+            METHOD='mip',
+            WARM_START=True,
+            TIME_BUDGET_SECONDS=120,
+            RESERVE_SECONDS=5,
+            ROUNDING_THRESHOLD=1e-6,
+            SOLVER_OPTION=dict(cbc={'ratioGap': 0.02, 'seconds': 90}),
+        ),
+        exact=dict(
+            METHOD='mip',
+            WARM_START=False,
+            TIME_BUDGET_SECONDS=12 * 3600,
+            RESERVE_SECONDS=60,
+            ROUNDING_THRESHOLD=1e-6,
+            SOLVER_OPTION=dict(cbc={'ratioGap': 1e-4, 'seconds': 12 * 3600}),
+        ),
+        lagrangian=dict(
+            METHOD='lagrangian',
+            TIME_BUDGET_SECONDS=30,
+            RESERVE_SECONDS=1,
+        ),
+    )
+    DEFAULT_SOLVE_PROFILE = None  # None solves with OPTIMISATION_MODEL_CONFIG['SOLVER_OPTION'] and no time budget
+
     # ================================================================================
     # High-Level Optimisation Scenario Settings
     # ================================================================================
@@ -73,6 +213,100 @@ class Config(object):
     # Additional Constraints
     ADD_DELIVERY_TIME_CONSTRAINT = False
 
+    # Despatcher formulation: 'per_arc' (integer despatchers per warehouse-township pair), 'per_warehouse' (integer
+    # despatchers per warehouse, continuous per pair, W instead of W x T integers) or 'relaxed' (continuous despatchers
+    # rounded up after solving). The solve summary compares the objective with the rounded per-arc solution.
+    DESPATCHER_FORMULATIONS = ['per_arc', 'per_warehouse', 'relaxed']
+    DESPATCHER_FORMULATION = 'per_arc'
+
+    # ================================================================================
+    # Presolve Settings (src/optimisation_model/presolve.py)
+    # Zero-demand townships and unreachable warehouses are removed and co-located townships merged before building the
+    # model, the results are mapped back to the original warehouses and townships
+    # ================================================================================
+    PRESOLVE = dict(
+        ENABLED=True,
+        MERGE_TOWNSHIPS_WITHIN_KM=0.01,  # None to keep co-located townships apart
+        # Warehouses this close are compared on cost and capacity and the dominated ones removed. Not an exact
+        # reduction (see presolve.py), so None keeps them all
+        DOMINANCE_WITHIN_KM=None,
+    )
+
+    # ================================================================================
+    # Demand Aggregation Settings (src/optimisation_model/aggregation.py)
+    # Townships are clustered into demand nodes with demand-weighted k-means, the model is solved on the nodes and its
+    # supply disaggregated back to the townships with a transportation LP
+    # ================================================================================
+    AGGREGATION = dict(
+        N_NODES=None,  # Default number of demand nodes, None to solve on the townships
+        N_INIT=4,  # k-means runs with different initial centroids, the best is kept
+        RANDOM_STATE=0,  # Fixed, so repeated runs get the same nodes (and hit the ModelCache)
+        MAX_CACHED_CLUSTERINGS=32,
+    )
+
+    # ================================================================================
+    # Decomposition Settings (src/optimisation_model/decomposition.py)
+    # Regions of townships are solved in parallel worker processes, then a repair solve over all townships and the
+    # warehouses the regions selected restores global feasibility
+    # ================================================================================
+    DECOMPOSITION = dict(
+        PARTITIONS=['district', 'kmeans'],
+        PARTITION=None,  # Default partition, None to solve the monolithic model
+        N_REGIONS=8,  # Regions of the 'kmeans' partition
+        BUFFER_KM=20,  # Warehouses this close to any of a region's townships are candidates for the region
+        REPAIR_BOUNDARY_WAREHOUSES=True,  # Also repair over the warehouses that are candidates of several regions
+        MAX_WORKERS=None,  # Defaults to the number of cores, subproblem solves also wait for SolveScheduler slots
+        MP_CONTEXT='spawn',  # See DATA_LOADING['MP_CONTEXT']
+    )
+
+    # ================================================================================
+    # Lagrangian Relaxation Settings (src/optimisation_model/lagrangian.py)
+    # The township constraints are relaxed into per-warehouse subproblems solved with NumPy, giving bounds and
+    # repaired feasible solutions without building or solving the MIP
+    # ================================================================================
+    LAGRANGIAN = dict(
+        MAX_ITERATIONS=500,
+        TARGET_GAP=1e-3,  # Relative gap between the best feasible objective and the bound at which iterations stop
+        STEP_SIZE=2.0,  # Initial Polyak step size, within (0, 2]
+        PATIENCE=20,  # The step size is halved after this many iterations without improving the bound
+        MIN_IMPROVEMENT=1e-6,  # Relative bound improvement resetting the patience
+        MIN_STEP_SIZE=1e-4,  # Iterations stop below this step size
+        CANDIDATES=10,  # Closed warehouses the final local search tries to open, by Lagrangian value
+        LOCAL_SEARCH_SECONDS=10,
+    )
+
+    # ================================================================================
+    # Parametric Sweep Settings (src/optimisation_model/parametric_sweep.py)
+    # One scalar coefficient is swept over a range, bisecting only the intervals whose ends select different
+    # warehouses, down to TOLERANCE of the range
+    # ================================================================================
+    PARAMETRIC_SWEEP = dict(
+        PARAMETERS=[
+            'despatch_hiring_cost', 'delivery_speed', 'despatch_volume_limit', 'cost_of_delivery',
+            'working_hours_per_day', 'maximum_delivery_hrs_constraint', 'profit_per_sales_volume',
+        ],
+        INITIAL_POINTS=5,  # Evenly spaced solves, ends included, before bisecting (catches selections changing back)
+        TOLERANCE=0.01,  # Breakpoints are located within this fraction of the range
+        MAX_SOLVES=40,
+        TARGET_GAP=1e-3,  # Tighter than the default ratioGap, near-optimal alternatives would show as breakpoints
+    )
+
+    # ================================================================================
+    # Demand Scenario Settings (src/optimisation_model/demand_scenarios.py)
+    # A fixed warehouse network is evaluated under sampled township demands, the townships being assigned greedily
+    # for a batch of scenarios at once instead of solving the model per scenario
+    # ================================================================================
+    DEMAND_SCENARIOS = dict(
+        N_SCENARIOS=1000,
+        DEFAULT_CV=0.2,  # Demand coefficient of variation of the townships without forecast stations
+        COMMON_CV=0.05,  # Of a demand factor common to all townships (e.g. the total demand forecast's error)
+        RANDOM_STATE=0,  # Fixed, so repeated evaluations sample the same scenarios
+        BATCH_SIZE=1000,  # Scenarios assigned at once, batches run in parallel worker processes
+        MAX_WORKERS=None,  # Defaults to the number of cores
+        MP_CONTEXT='spawn',  # See DATA_LOADING['MP_CONTEXT']
+        QUANTILES=[0.05, 0.5, 0.95],
+    )
+
     # ================================================================================
     # Optimisation Parameters
     # ================================================================================
@@ -88,3 +322,9 @@ class Config(object):
         profit_per_sales_volume=10,  # RM/ft3
         maximum_delivery_hrs_constraint=3,
     )
+
+    @classmethod
+    def make_dirs(cls):
+        """Create the project data folders (Config.FILES) if they don't exist."""
+        for file_path in cls.FILES.values():
+            Path(file_path).mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for serving the API with a pre-forking master process. Run from the project root:
+
+> gunicorn -c conf/base/gunicorn_config.py src.api.fastapi_main:app
+
+The app is imported and warmed up (see src.api.warmup) in the master before the workers are forked, so every worker
+starts ready and shares the loaded data copy-on-write.
+"""
+
+bind = '0.0.0.0:6128'
+workers = 4
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+timeout = 3600  # Solves can keep a worker busy for a long time
+keepalive = 300
+
+
+def when_ready(server):
+    from conf import Config
+    from src.api.warmup import WarmState
+
+    if Config.API['WARM_UP']:
+        WarmState.warm_up()
@@ -10,17 +10,28 @@ OUT      9
 END      8
 START    7
 NOTSET 	 0
+
+Handlers are configured once per process: the shared logger only holds a QueueHandler, and the console/file
+handlers (or the loguru sink, see Config.LOGGING['SINK']) run on a QueueListener thread, so no I/O happens on the
+calling thread. Use %-style arguments, e.g. `logger.debug("Loaded %s rows", n)`, so that messages below the
+configured level are never formatted.
 """
 
+import os
 import sys
+import queue
+import atexit
 import logging
+import threading
 import logging.config
+import logging.handlers
 from pathlib import Path
 from datetime import datetime, timedelta
+from conf.base.config import Config
+from conf.base.tracer import Tracer
 
 current_time = datetime.now()
 
-Path("logs").mkdir(parents=True, exist_ok=True)
 DEFAULT_LOG_FILEPATH = "./logs/pyopt_logs.log"
 
 logging.config.dictConfig({
@@ -91,14 +102,29 @@ class ErrorCounter(object):
         return self.method(*args, **kwargs)
 
 
+class TraceIdFilter(logging.Filter):
+    """Stamps records with the current trace id on the calling thread, before they are queued"""
+    def filter(self, record):
+        record.request_id = Tracer.current_trace_id()
+        return True
+
+
 class ShutdownHandler(logging.Handler):
     def emit(self, record):
+        # Draining the queue first so that the critical record itself is written out
+        if Logger._queue_listener is not None:
+            Logger._queue_listener.stop()
+            Logger._queue_listener = None
         logging.shutdown()
         sys.exit(1)
 
 
 class Logger(object):
 
+    _configure_lock = threading.Lock()
+    _configured_filepath = None
+    _queue_listener = None
+
     def __init__(self, log_filepath=None):
 
         # Initialisation
@@ -106,53 +132,82 @@ class Logger(object):
             log_filepath = DEFAULT_LOG_FILEPATH
 
         self.logger = logging.getLogger(__name__)
+
+        # Handlers are only (re)configured on first use or when a different log file is requested
+        if Logger._configured_filepath != log_filepath:
+            with Logger._configure_lock:
+                if Logger._configured_filepath != log_filepath:
+                    self.__configure(log_filepath)
+                    Logger._configured_filepath = log_filepath
+
+    def __configure(self, log_filepath):
+
         self.logger.propagate = False
 
         # Clearing existing handlers if it already exists
+        if Logger._queue_listener is not None:
+            Logger._queue_listener.stop()
         if self.logger.hasHandlers():
             self.logger.handlers.clear()
 
-        # add standard output stream
-        stream_handler = logging.StreamHandler(sys.stderr)
-        stream_handler.setFormatter(formatter['brief'])
-        self.logger.addHandler(stream_handler)
-
-        # add output file
-        file_handler = logging.handlers.RotatingFileHandler(
-            filename=log_filepath,
-            maxBytes=10485760,  # 10MB
-            backupCount=20,
-            encoding='utf8',
-            delay=True
-        )
-        file_handler.setFormatter(formatter['precise'])
-        self.logger.addHandler(file_handler)
-
-        self.logger.setLevel(7)
-
-        self.logger.error = ErrorCounter(self.logger.error)
+        if Config.LOGGING['SINK'] == 'loguru':
+            # Forwarding records to the loguru sinks configured by LoguruLogger
+            from conf.base.loguru_logger import LoguruSinkHandler
+            handlers = [LoguruSinkHandler()]
+        else:
+            # add standard output stream
+            stream_handler = logging.StreamHandler(sys.stderr)
+            stream_handler.setFormatter(formatter['brief'])
+
+            # add output file
+            Path(log_filepath).parent.mkdir(parents=True, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                filename=log_filepath,
+                maxBytes=10485760,  # 10MB
+                backupCount=20,
+                encoding='utf8',
+                delay=True
+            )
+            file_handler.setFormatter(formatter['precise'])
+            handlers = [stream_handler, file_handler]
+
+        # Handlers run on the listener thread, the calling thread only enqueues records
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(TraceIdFilter())
+        self.logger.addHandler(queue_handler)
+        Logger._queue_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        Logger._queue_listener.start()
+
+        self.logger.setLevel(Config.LOGGING['LEVEL'])
+
+        if not isinstance(self.logger.error, ErrorCounter):
+            self.logger.error = ErrorCounter(self.logger.error)
 
         self.logger.addHandler(ShutdownHandler(level=50))
 
-    def start(self, message):
+    def start(self, message, *args):
         global current_time
         current_time = datetime.now()
-        self.logger.start(message)
+        self.logger.start(message, *args)
 
-    def info(self, message):
-        self.logger.info(message)
+    def debug(self, message, *args):
+        self.logger.debug(message, *args)
 
-    def output(self, message):
-        self.logger.output(message)
+    def info(self, message, *args):
+        self.logger.info(message, *args)
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def output(self, message, *args):
+        self.logger.output(message, *args)
 
-    def error(self, message):
-        self.logger.error(message)
+    def warning(self, message, *args):
+        self.logger.warning(message, *args)
 
-    def critical(self, message):
-        self.logger.critical(message)
+    def error(self, message, *args):
+        self.logger.error(message, *args)
+
+    def critical(self, message, *args):
+        self.logger.critical(message, *args)
 
     def end(self, args):
         time_delta = datetime.now() - current_time
@@ -164,3 +219,25 @@ class Logger(object):
         self.logger.end("Finished task {} (total time spent: {})".format(
             args.task.title(), time_delta))
 
+
+@atexit.register
+def _stop_queue_listener():
+    # Flushing queued records on interpreter exit
+    if Logger._queue_listener is not None:
+        Logger._queue_listener.stop()
+        Logger._queue_listener = None
+
+
+def _reconfigure_after_fork():
+    # The queue listener thread does not survive a fork (e.g. preloaded gunicorn workers), so forked processes
+    # start their own listener with the same handlers configuration
+    log_filepath = Logger._configured_filepath
+    Logger._configure_lock = threading.Lock()
+    Logger._queue_listener = None
+    Logger._configured_filepath = None
+    if log_filepath is not None:
+        Logger(log_filepath)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reconfigure_after_fork)
@@ -10,6 +10,7 @@ import json
 import logging
 from loguru import logger
 from pathlib import Path
+from conf.base.tracer import Tracer
 
 
 LOGGER_CONFIG_PATH = "./conf/base/loguru_config.json"
@@ -28,21 +29,51 @@ class InterceptHandler(logging.Handler):
     def emit(self, record):
         try:
             level = logger.level(record.levelname).name
-        except AttributeError:
-            level = self.log_level_mapping[record.levelno]
+        except (AttributeError, ValueError):
+            level = self.log_level_mapping.get(record.levelno, record.levelno)
 
         frame, depth = logging.currentframe(), 2
         while frame.f_code.co_filename == logging.__file__:
             frame = frame.f_back
             depth += 1
 
-        log = logger.bind(request_id='app')
+        log = logger.bind(request_id=Tracer.current_trace_id() or 'app')
         log.opt(
             depth=depth,
             exception=record.exc_info
         ).log(level,record.getMessage())
 
 
+class LoguruSinkHandler(logging.Handler):
+    """
+    Forwards records from conf.Logger's queue listener to the loguru sinks, keeping the caller's module and function
+    instead of the listener thread's frames.
+    """
+    custom_levels = {'OUT': 9, 'END': 8, 'START': 7}
+
+    def __init__(self, level=0):
+        super().__init__(level=level)
+        for name, no in self.custom_levels.items():
+            try:
+                logger.level(name, no=no)
+            except (TypeError, ValueError):
+                pass  # Level already registered
+
+    def emit(self, record):
+        try:
+            level = logger.level(record.levelname).name
+        except (AttributeError, ValueError):
+            level = record.levelno
+
+        def patch_caller(loguru_record):
+            loguru_record.update(name=record.module, function=record.funcName, line=record.lineno)
+
+        request_id = getattr(record, 'request_id', None) or 'app'
+        logger.bind(request_id=request_id).patch(patch_caller).opt(exception=record.exc_info).log(
+            level, record.getMessage()
+        )
+
+
 class LoguruLogger:
 
     @classmethod
@@ -0,0 +1,29 @@
+"""
+Offline viewer for spans exported by conf.Tracer. Run from the project root:
+
+> python -m conf.base.trace_viewer                  # slowest traces
+> python -m conf.base.trace_viewer --trace-id <id>  # span tree of a single trace
+"""
+
+import sys
+import argparse
+from conf.base.tracer import Tracer
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Inspect exported trace spans.")
+    parser.add_argument('--trace-id', help="Trace to display. Defaults to listing the slowest traces.")
+    parser.add_argument('--path', default=None, help="Span export file. Defaults to Config.TRACING['EXPORT_PATH'].")
+    parser.add_argument('--top', type=int, default=10, help="Number of slowest traces to list.")
+    args = parser.parse_args()
+
+    all_spans = Tracer.load_spans(args.path, args.trace_id)
+    if args.trace_id is not None:
+        print(Tracer.format_trace(all_spans))
+        sys.exit(0)
+
+    root_spans = [s for s in all_spans if s['parent_span_id'] is None]
+    for root_span in sorted(root_spans, key=lambda x: x['duration_ms'], reverse=True)[:args.top]:
+        print(f"{root_span['trace_id']}  {root_span['name']:<25} {root_span['duration_ms']:>12.1f} ms "
+              f"[{root_span['status']}]")
@@ -0,0 +1,220 @@
+"""
+Lightweight request tracing.
+
+Each API request runs inside a trace (`Tracer.trace`), and each pipeline stage inside a span (`Tracer.span`) recording
+its start/end time, duration, status and attributes (e.g. number of warehouses, solver status). Spans are handed to a
+background thread which appends them to a JSONL file, so exporting never blocks the request.
+
+Exported traces can be inspected offline with `python -m conf.base.trace_viewer`.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+from conf.base.config import Config
+
+_current_trace_id = contextvars.ContextVar('trace_id', default=None)
+_current_span = contextvars.ContextVar('span', default=None)
+_STOP_EXPORTER = object()
+
+
+class Span:
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str = None, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.start_time = time.time()
+        self.end_time = None
+        self._start_counter = time.perf_counter()
+        self.duration_ms = None
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.end_time = time.time()
+        self.duration_ms = (time.perf_counter() - self._start_counter) * 1000
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class Tracer:
+
+    _export_queue = queue.SimpleQueue()
+    _exporter_thread = None
+    _exporter_lock = threading.Lock()
+
+    @staticmethod
+    def new_trace_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def current_trace_id():
+        return _current_trace_id.get()
+
+    @classmethod
+    @contextmanager
+    def trace(cls, trace_id: str = None):
+        """
+        Run the enclosed code within a trace. Spans opened inside, including in threads started with a copy of the
+        current context, belong to this trace.
+
+        Args:
+            trace_id (str, optional): Trace id, e.g. propagated from the caller. Defaults to a new id.
+        """
+        token = _current_trace_id.set(trace_id or cls.new_trace_id())
+        try:
+            yield _current_trace_id.get()
+        finally:
+            _current_trace_id.reset(token)
+
+    @classmethod
+    @contextmanager
+    def span(cls, name: str, **attributes):
+        """
+        Record the enclosed code as a span of the current trace, starting a new trace if there is none.
+
+        Args:
+            name (str): Span name, e.g. the pipeline stage.
+            **attributes: Span attributes, more can be added with `span.set_attributes()`.
+        """
+        if not Config.TRACING['ENABLED']:
+            yield Span(name, trace_id=None, attributes=attributes)
+            return
+
+        trace_token = None
+        if _current_trace_id.get() is None:
+            trace_token = _current_trace_id.set(cls.new_trace_id())
+        parent_span = _current_span.get()
+        span = Span(name, trace_id=_current_trace_id.get(),
+                    parent_span_id=parent_span.span_id if parent_span is not None else None, attributes=attributes)
+        span_token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.status = 'error'
+            span.set_attributes(error=repr(error))
+            raise
+        finally:
+            span.end()
+            _current_span.reset(span_token)
+            if trace_token is not None:
+                _current_trace_id.reset(trace_token)
+            cls._export(span)
+
+    @classmethod
+    def _export(cls, span):
+        if cls._exporter_thread is None:
+            with cls._exporter_lock:
+                if cls._exporter_thread is None:
+                    cls._exporter_thread = threading.Thread(target=cls._exporter_loop, name='TracerExporter',
+                                                            daemon=True)
+                    cls._exporter_thread.start()
+        cls._export_queue.put(span.to_dict())
+
+    @classmethod
+    def _exporter_loop(cls):
+        export_path = Path(Config.TRACING['EXPORT_PATH'])
+        export_path.parent.mkdir(parents=True, exist_ok=True)
+        stopped = False
+        while not stopped:
+            span_dicts = [cls._export_queue.get()]
+            # Writing all spans queued so far in one go
+            while True:
+                try:
+                    span_dicts.append(cls._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP_EXPORTER in span_dicts:
+                stopped = True
+                span_dicts = [x for x in span_dicts if x is not _STOP_EXPORTER]
+            if span_dicts:
+                with open(export_path, 'a', encoding='utf8') as file:
+                    file.writelines(json.dumps(x, default=str) + '\n' for x in span_dicts)
+
+    @classmethod
+    def flush(cls):
+        """
+        Stop the exporter thread after all queued spans are written. It is restarted on the next span.
+        """
+        with cls._exporter_lock:
+            if cls._exporter_thread is not None:
+                cls._export_queue.put(_STOP_EXPORTER)
+                cls._exporter_thread.join()
+                cls._exporter_thread = None
+
+    @staticmethod
+    def load_spans(export_path=None, trace_id=None):
+        """
+        Load exported spans, optionally of a single trace.
+
+        Args:
+            export_path (str, optional): JSONL file. Defaults to Config.TRACING['EXPORT_PATH'].
+            trace_id (str, optional): Only return spans of this trace. Defaults to None.
+        """
+        spans = []
+        with open(export_path or Config.TRACING['EXPORT_PATH'], 'r', encoding='utf8') as file:
+            for line in file:
+                span_dict = json.loads(line)
+                if trace_id is None or span_dict['trace_id'] == trace_id:
+                    spans.append(span_dict)
+        return spans
+
+    @staticmethod
+    def format_trace(spans):
+        """
+        Format the spans of a trace as an indented tree with durations and attributes.
+        """
+        children = {}
+        for span_dict in sorted(spans, key=lambda x: x['start_time']):
+            children.setdefault(span_dict['parent_span_id'], []).append(span_dict)
+
+        lines = []
+        span_ids = {span_dict['span_id'] for span_dict in spans}
+        roots = [s for parent_id, s_list in children.items() if parent_id not in span_ids for s in s_list]
+
+        def add_lines(span_dict, depth):
+            attributes = ', '.join(f"{k}={v}" for k, v in span_dict['attributes'].items())
+            lines.append(f"{'    ' * depth}{span_dict['name']:<{40 - 4 * depth}} {span_dict['duration_ms']:>12.1f} ms "
+                         f"[{span_dict['status']}] {attributes}")
+            for child in children.get(span_dict['span_id'], []):
+                add_lines(child, depth + 1)
+
+        for root in roots:
+            add_lines(root, 0)
+        return '\n'.join(lines)
+
+
+def _reset_after_fork():
+    # The exporter thread does not survive a fork, spans queued before the fork are left to the parent process
+    Tracer._export_queue = queue.SimpleQueue()
+    Tracer._exporter_thread = None
+    Tracer._exporter_lock = threading.Lock()
+
+
+atexit.register(Tracer.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
@@ -1,30 +1,116 @@
 """
 To deploy API on server, run the following in the terminal:
 
+> gunicorn -c conf/base/gunicorn_config.py src.api.fastapi_main:app
+
+This preloads the input data in the master process before forking the workers (see src.api.warmup). Without the
+preload, each worker warms up in the background after startup:
+
 > uvicorn src.api.fastapi_main:app --workers 6 --port 6128 --timeout-keep-alive 3600 --host 0.0.0.0
+
+Load balancers should only route traffic to a worker once /ready returns 200.
+
+/run_optimisation/stream/ runs the same optimisation but streams the solver's progress (incumbent objective, best
+bound, gap and nodes) while it runs, as newline-delimited JSON or, with `Accept: text/event-stream`, as Server-Sent
+Events. The last event holds the results, including the warehouse selection.
+
+Identical /run_optimisation/ requests (same inputs and input data) arriving while one is being solved share its
+results instead of solving again, on any worker of the machine (see src.optimisation_model.single_flight). The
+X-Single-Flight response header tells whether a request led the solve or followed it, and /metrics/single_flight
+counts the solves saved.
+
+/run_parametric_sweep/ sweeps one model coefficient over a range and returns the values at which the warehouse
+selection changes, with the selection and cost components between them (see src.optimisation_model.parametric_sweep).
+
+/evaluate_demand_scenarios/ evaluates a fixed set of open warehouses (e.g. a /run_optimisation/ selection) under
+sampled township demands and returns the distribution of its unmet demand, utilisation, despatchers and cost (see
+src.optimisation_model.demand_scenarios).
+
+/run_optimisation/ returns JSON, MessagePack or Arrow IPC streams of the result tables depending on the Accept
+header, compressed with brotli or gzip depending on Accept-Encoding (see src.api.response_formats).
 """
 
+import time
+import asyncio
 import orjson
-import typing
-from conf import loguru_logger
+from conf import Config, loguru_logger, Tracer
 from fastapi import FastAPI, Request, Body
-from fastapi.responses import JSONResponse
-
-from src.optimisation_model.main import main
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from src.api.warmup import WarmState
+from src.api.response_formats import ORJSONResponse, negotiate_media_type, not_acceptable_response, results_response, \
+    _to_builtin
+from src.optimisation_model.scheduler import SolveScheduler, SolveQueueFull, SolveDeadlineExceeded
+from src.optimisation_model.cancellation import CancelToken, SolveCancelled
+from src.optimisation_model.single_flight import SingleFlight
 from src.api.fastapi_pydantic_models import *  # pydantic Models for Swagger API Docs
 
 
 # ========== API Definition ==========
-class ORJSONResponse(JSONResponse):
-    """Custom JSONResponse class for returning NaN float values in JSON."""
-    media_type = "application/json"
+app = FastAPI(default_response_class=ORJSONResponse)
+app.logger = loguru_logger
 
-    def render(self, content: typing.Any) -> bytes:
-        return orjson.dumps(content)
+DISCONNECT_POLL_SECONDS = 1.0
 
 
-app = FastAPI(default_response_class=ORJSONResponse)
-app.logger = loguru_logger
+def request_trace_id(request: Request):
+    """Trace id propagated by the caller in the X-Trace-Id header, or a new one."""
+    trace_id = request.headers.get('X-Trace-Id')
+    if trace_id is None or not CancelToken.JOB_ID_PATTERN.fullmatch(trace_id):
+        trace_id = Tracer.new_trace_id()
+    return trace_id
+
+
+def queue_full_response(trace_id: str):
+    """429 response when the solve queue is already full, None otherwise."""
+    if Config.SOLVE_SCHEDULER['ENABLED'] and \
+            SolveScheduler.queue_length() >= Config.SOLVE_SCHEDULER['MAX_QUEUE_LENGTH']:
+        return JSONResponse(status_code=429, content={"detail": "Solve queue is full."},
+                            headers={'Retry-After': str(SolveScheduler.retry_after()), 'X-Trace-Id': trace_id})
+    return None
+
+
+async def run_cancellable(request: Request, cancel_token: CancelToken, function, **kwargs):
+    """
+    Run a blocking function on a worker thread, cancelling its token if the client disconnects in the meantime.
+    """
+    task = asyncio.ensure_future(run_in_threadpool(function, cancel_token=cancel_token, **kwargs))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if not task.done() and not cancel_token.is_cancelled() and await request.is_disconnected():
+            cancel_token.cancel('client disconnected')
+    return task.result()
+
+
+def run_optimisation_once(cancel_token, processed_data=None, priority=0, deadline=None, **params):
+    """
+    Run the optimisation pipeline, sharing the results of an identical run already in flight (see SingleFlight).
+
+    Returns:
+        tuple: Compiled JSON results, result tables (see Postprocessing.result_tables) and the single-flight role of
+            this run.
+    """
+    from src.optimisation_model.main import main
+    from src.optimisation_model.preprocessing import Preprocessing
+
+    processed_data = processed_data if processed_data is not None else Preprocessing()
+    fingerprint = SingleFlight.fingerprint(processed_data, **params)
+    with Tracer.span('single_flight', fingerprint=fingerprint) as span:
+        def run():
+            post_process_output = main(processed_data=processed_data, priority=priority, deadline=deadline,
+                                       cancel_token=cancel_token, **params)
+            return post_process_output.compiled_json_results, post_process_output.result_tables
+
+        (compiled_json_results, result_tables), role = SingleFlight.run(fingerprint, run, cancel_token=cancel_token)
+        span.set_attributes(role=role)
+    return compiled_json_results, result_tables, role
+
+
+@app.on_event('startup')
+async def warm_up():
+    # Already warm when preloaded by the gunicorn master, otherwise loading in the background
+    if Config.API['WARM_UP']:
+        WarmState.warm_up_in_background()
 
 
 @app.get('/')
@@ -34,25 +120,279 @@ async def home(request: Request):
     return "Welcome to My LAW Project! Please refer to /docs/ path for Swagger API documentation."
 
 
+@app.get('/ready')
+async def ready():
+    if Config.API['WARM_UP'] and not WarmState.ready:
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True, "warm_up_seconds": WarmState.warm_up_seconds}
+
+
 # ============================== MLNG TIGA ==============================
 @app.post('/run_optimisation/', tags=['optimisation'])
 async def run_optimisation(
     request: Request,
     inputs: OptimisationModelInput = Body(
         ..., example=EXAMPLE_JSON["OptimisationModelInput"]
+    ),
+    priority: int = 0,
+    timeout_seconds: float = None,
+    target_gap: float = None,
+):
+
+    user_ip = request.client.host
+    trace_id = request_trace_id(request)
+    logger = request.app.logger.bind(request_id=trace_id)
+    logger.info(f"[{user_ip}] /run_optimisation/ is called.")
+    json_data = inputs.dict()  # Loading input data
+    deadline = time.time() + timeout_seconds if timeout_seconds else None
+
+    # Rejecting early when the requested result format is not supported, or the solve queue is already full
+    media_type = negotiate_media_type(request)
+    if media_type is None:
+        logger.warning(f"[{user_ip}] /run_optimisation/ rejected, not acceptable: {request.headers.get('Accept')}.")
+        return not_acceptable_response(headers={'X-Trace-Id': trace_id})
+    response = queue_full_response(trace_id)
+    if response is not None:
+        logger.warning(f"[{user_ip}] /run_optimisation/ rejected, solve queue is full.")
+        return response
+
+    # Run optimisation on a worker thread (the event loop stays responsive while waiting for a solver slot or an
+    # identical run), all pipeline stages are recorded as spans of this request's trace. The trace id doubles as the
+    # job id for /cancel/. The model pipeline (pyomo, pandas, mlflow) is imported on first use, keeping worker
+    # startup light.
+    try:
+        with Tracer.trace(trace_id), Tracer.span('run_optimisation', client_ip=user_ip, priority=priority), \
+                CancelToken(job_id=trace_id, deadline=deadline) as cancel_token:
+            compiled_json_results, result_tables, single_flight_role = await run_cancellable(
+                request, cancel_token, run_optimisation_once,
+                processed_data=WarmState.processed_data, priority=priority, deadline=deadline, target_gap=target_gap,
+                **json_data
+            )
+    except SolveQueueFull as error:
+        logger.warning(f"[{user_ip}] /run_optimisation/ rejected: {error}")
+        return JSONResponse(status_code=429, content={"detail": str(error)},
+                            headers={'Retry-After': str(error.retry_after), 'X-Trace-Id': trace_id})
+    except SolveDeadlineExceeded as error:
+        logger.warning(f"[{user_ip}] /run_optimisation/ timed out in the solve queue: {error}")
+        return JSONResponse(status_code=503, content={"detail": str(error)},
+                            headers={'Retry-After': str(error.retry_after), 'X-Trace-Id': trace_id})
+    except SolveCancelled as error:
+        logger.warning(f"[{user_ip}] /run_optimisation/ cancelled: {error}")
+        status_code = 504 if error.reason == CancelToken.DEADLINE_REASON else 409
+        return JSONResponse(status_code=status_code, content={"detail": str(error)}, headers={'X-Trace-Id': trace_id})
+
+    logger.info(f"[{user_ip}] /run_optimisation/ completed ({single_flight_role}).")
+
+    # Encoding large results on a worker thread as well
+    with Tracer.trace(trace_id), Tracer.span('encode_results', media_type=media_type):
+        return await run_in_threadpool(
+            results_response, request, compiled_json_results, result_tables, media_type=media_type,
+            headers={'X-Trace-Id': trace_id, 'X-Single-Flight': single_flight_role},
+        )
+
+
+@app.post('/run_optimisation/stream/', tags=['optimisation'])
+async def run_optimisation_stream(
+    request: Request,
+    inputs: OptimisationModelInput = Body(
+        ..., example=EXAMPLE_JSON["OptimisationModelInput"]
+    ),
+    priority: int = 0,
+    timeout_seconds: float = None,
+    target_gap: float = None,
+):
+    """
+    Run the optimisation, streaming progress events while solving. The events are 'started', then 'incumbent',
+    'progress', 'root_bound' and 'completed' as reported by the solver, and finally either 'result' (holding the
+    optimisation results) or 'error'. The solver only reports the incumbent's objective while running, so the
+    warehouse selection comes with the 'result' event. Disconnecting cancels the run.
+    """
+    user_ip = request.client.host
+    trace_id = request_trace_id(request)
+    logger = request.app.logger.bind(request_id=trace_id)
+    logger.info(f"[{user_ip}] /run_optimisation/stream/ is called.")
+    json_data = inputs.dict()  # Loading input data
+    deadline = time.time() + timeout_seconds if timeout_seconds else None
+    use_sse = 'text/event-stream' in request.headers.get('Accept', '')
+
+    response = queue_full_response(trace_id)
+    if response is not None:
+        logger.warning(f"[{user_ip}] /run_optimisation/stream/ rejected, solve queue is full.")
+        return response
+
+    from src.optimisation_model.main import main
+
+    def format_event(event):
+        # Encoded like ORJSONResponse, the results may hold numpy values
+        data = orjson.dumps(event, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY)
+        if use_sse:
+            return b'event: ' + event['event'].encode() + b'\ndata: ' + data + b'\n\n'
+        return data + b'\n'
+
+    async def stream_events():
+        loop = asyncio.get_running_loop()
+        progress_queue = asyncio.Queue()
+
+        def on_progress(event):  # Called from the solver output thread
+            loop.call_soon_threadsafe(progress_queue.put_nowait, event)
+
+        with CancelToken(job_id=trace_id, deadline=deadline) as cancel_token:
+            # The task copies the trace context when created, so the pipeline spans belong to this request's trace
+            with Tracer.trace(trace_id):
+                task = asyncio.ensure_future(run_in_threadpool(
+                    main, processed_data=WarmState.processed_data, priority=priority, deadline=deadline,
+                    cancel_token=cancel_token, progress_callback=on_progress, target_gap=target_gap, **json_data
+                ))
+            try:
+                yield format_event({'event': 'started', 'trace_id': trace_id})
+                while True:
+                    next_event = asyncio.ensure_future(progress_queue.get())
+                    await asyncio.wait({next_event, task}, return_when=asyncio.FIRST_COMPLETED)
+                    if not next_event.done():
+                        next_event.cancel()
+                        break
+                    yield format_event(next_event.result())
+                while not progress_queue.empty():
+                    yield format_event(progress_queue.get_nowait())
+
+                try:
+                    optimisation_results = task.result()
+                except (SolveQueueFull, SolveDeadlineExceeded, SolveCancelled) as error:
+                    logger.warning(f"[{user_ip}] /run_optimisation/stream/ stopped: {error}")
+                    yield format_event({'event': 'error', 'detail': str(error)})
+                    return
+                except Exception as error:
+                    logger.exception(f"[{user_ip}] /run_optimisation/stream/ failed: {error}")
+                    yield format_event({'event': 'error', 'detail': str(error)})
+                    return
+                logger.info(f"[{user_ip}] /run_optimisation/stream/ completed.")
+                yield format_event({'event': 'result', 'results': optimisation_results.compiled_json_results})
+            finally:
+                # Reached early when the client disconnects
+                if not task.done():
+                    cancel_token.cancel('client disconnected')
+
+    return StreamingResponse(
+        stream_events(), media_type='text/event-stream' if use_sse else 'application/x-ndjson',
+        headers={'X-Trace-Id': trace_id, 'Cache-Control': 'no-cache'},
     )
+
+
+def run_parametric_sweep_once(cancel_token, **params):
+    """Run a parametric sweep, see src.optimisation_model.parametric_sweep, returning its piecewise result."""
+    from src.optimisation_model.parametric_sweep import ParametricSweep
+    return ParametricSweep(cancel_token=cancel_token, **params).result
+
+
+@app.post('/run_parametric_sweep/', tags=['optimisation'])
+async def run_parametric_sweep(
+    request: Request,
+    inputs: ParametricSweepInput = Body(
+        ..., example=EXAMPLE_JSON["ParametricSweepInput"]
+    ),
+    priority: int = 0,
+    timeout_seconds: float = None,
+):
+
+    user_ip = request.client.host
+    trace_id = request_trace_id(request)
+    logger = request.app.logger.bind(request_id=trace_id)
+    logger.info(f"[{user_ip}] /run_parametric_sweep/ is called.")
+    json_data = inputs.dict()  # Loading input data
+    deadline = time.time() + timeout_seconds if timeout_seconds else None
+
+    response = queue_full_response(trace_id)
+    if response is not None:
+        logger.warning(f"[{user_ip}] /run_parametric_sweep/ rejected, solve queue is full.")
+        return response
+
+    # Each solve of the sweep waits for a solver slot in turn, the deadline and cancellation cover the whole sweep
+    try:
+        with Tracer.trace(trace_id), Tracer.span('run_parametric_sweep', client_ip=user_ip, priority=priority), \
+                CancelToken(job_id=trace_id, deadline=deadline) as cancel_token:
+            result = await run_cancellable(
+                request, cancel_token, run_parametric_sweep_once,
+                processed_data=WarmState.processed_data, priority=priority, deadline=deadline, **json_data
+            )
+    except SolveQueueFull as error:
+        logger.warning(f"[{user_ip}] /run_parametric_sweep/ rejected: {error}")
+        return JSONResponse(status_code=429, content={"detail": str(error)},
+                            headers={'Retry-After': str(error.retry_after), 'X-Trace-Id': trace_id})
+    except SolveDeadlineExceeded as error:
+        logger.warning(f"[{user_ip}] /run_parametric_sweep/ timed out in the solve queue: {error}")
+        return JSONResponse(status_code=503, content={"detail": str(error)},
+                            headers={'Retry-After': str(error.retry_after), 'X-Trace-Id': trace_id})
+    except SolveCancelled as error:
+        logger.warning(f"[{user_ip}] /run_parametric_sweep/ cancelled: {error}")
+        status_code = 504 if error.reason == CancelToken.DEADLINE_REASON else 409
+        return JSONResponse(status_code=status_code, content={"detail": str(error)}, headers={'X-Trace-Id': trace_id})
+
+    logger.info(f"[{user_ip}] /run_parametric_sweep/ completed in {result['n_solves']} solves.")
+    return ORJSONResponse(result, headers={'X-Trace-Id': trace_id})
+
+
+def evaluate_demand_scenarios_once(cancel_token, **params):
+    """Evaluate open warehouses under sampled demands, see src.optimisation_model.demand_scenarios."""
+    from src.optimisation_model.demand_scenarios import DemandScenarios
+    return DemandScenarios(cancel_token=cancel_token, **params).result
+
+
+@app.post('/evaluate_demand_scenarios/', tags=['optimisation'])
+async def evaluate_demand_scenarios(
+    request: Request,
+    inputs: DemandScenariosInput = Body(
+        ..., example=EXAMPLE_JSON["DemandScenariosInput"]
+    ),
+    timeout_seconds: float = None,
 ):
 
     user_ip = request.client.host
-    request.app.logger.info(f"[{user_ip}] /run_optimisation/ is called.")
+    trace_id = request_trace_id(request)
+    logger = request.app.logger.bind(request_id=trace_id)
+    logger.info(f"[{user_ip}] /evaluate_demand_scenarios/ is called.")
     json_data = inputs.dict()  # Loading input data
+    deadline = time.time() + timeout_seconds if timeout_seconds else None
+
+    # No solver involved, the scenarios are evaluated with NumPy (in worker processes for several batches)
+    try:
+        with Tracer.trace(trace_id), Tracer.span('evaluate_demand_scenarios', client_ip=user_ip), \
+                CancelToken(job_id=trace_id, deadline=deadline) as cancel_token:
+            result = await run_cancellable(
+                request, cancel_token, evaluate_demand_scenarios_once, processed_data=WarmState.processed_data,
+                **json_data
+            )
+    except SolveCancelled as error:
+        logger.warning(f"[{user_ip}] /evaluate_demand_scenarios/ cancelled: {error}")
+        status_code = 504 if error.reason == CancelToken.DEADLINE_REASON else 409
+        return JSONResponse(status_code=status_code, content={"detail": str(error)}, headers={'X-Trace-Id': trace_id})
+    except ValueError as error:
+        logger.warning(f"[{user_ip}] /evaluate_demand_scenarios/ rejected: {error}")
+        return JSONResponse(status_code=422, content={"detail": str(error)}, headers={'X-Trace-Id': trace_id})
+
+    logger.info(f"[{user_ip}] /evaluate_demand_scenarios/ completed.")
+    return ORJSONResponse(result, headers={'X-Trace-Id': trace_id})
+
+
+@app.get('/metrics/single_flight', tags=['optimisation'])
+async def single_flight_metrics():
+    """Number of optimisation runs solved and of identical concurrent runs that shared their results instead."""
+    return SingleFlight.metrics()
+
 
-    # Run optimisation
-    optimisation_results = main(**json_data)
+@app.get('/metrics/model_cache', tags=['optimisation'])
+async def model_cache_metrics():
+    """This worker's reuse of built optimisation models, see src.optimisation_model.model_cache."""
+    from src.optimisation_model.model_cache import ModelCache
+    return ModelCache.stats()
 
-    request.app.logger.info(f"[{user_ip}] /run_optimisation/ completed.")
 
-    return JSONResponse(content=optimisation_results.compiled_json_results)
+@app.post('/cancel/{job_id}', tags=['optimisation'])
+async def cancel(request: Request, job_id: str):
+    """Cancel a queued or running optimisation, identified by its X-Trace-Id, on any worker."""
+    request.app.logger.info(f"[{request.client.host}] /cancel/{job_id} is called.")
+    if not CancelToken.cancel_job(job_id):
+        return JSONResponse(status_code=404, content={"detail": f"No queued or running job {job_id}."})
+    return {"job_id": job_id, "cancelling": True}
 
 
 if __name__ == '__main__':
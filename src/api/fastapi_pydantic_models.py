@@ -1,7 +1,7 @@
 import json
 from conf import Config
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from typing import List, Optional
 
 # ================================================================================
@@ -19,16 +19,35 @@ EXAMPLE_JSON = {
         "cost_of_delivery": Config.OPT_PARAMS['cost_of_delivery'],
         "working_hours_per_day": Config.OPT_PARAMS['working_hours_per_day'],
         "maximum_delivery_hrs_constraint": Config.OPT_PARAMS['maximum_delivery_hrs_constraint'],
-        "profit_per_sales_volume": Config.OPT_PARAMS['profit_per_sales_volume']
-    }
+        "profit_per_sales_volume": Config.OPT_PARAMS['profit_per_sales_volume'],
+        "solve_profile": Config.DEFAULT_SOLVE_PROFILE,
+        "despatcher_formulation": Config.DESPATCHER_FORMULATION,
+        "presolve": Config.PRESOLVE['ENABLED'],
+        "aggregation_nodes": Config.AGGREGATION['N_NODES'],
+        "decomposition": Config.DECOMPOSITION['PARTITION'],
+    },
+    'ParametricSweepInput': {
+        "optimisation_scenario": 2,
+        "presolve": Config.PRESOLVE['ENABLED'],
+        "parameter": 'profit_per_sales_volume',
+        "start": 0.2,
+        "stop": 1.0,
+    },
+    'DemandScenariosInput': {
+        "warehouses": [
+            'North Port, Port Klang', 'Type A Warehouse, Port Klang', 'Subang Jaya', 'North Port, Port Klang (3)',
+            'Balakong', 'Jalan Kusta, Sg Buloh', 'Bukit Kemuning Industrial', 'Sg Tekali, Hulu Langat', 'Klang Jaya',
+        ],
+        "n_scenarios": Config.DEMAND_SCENARIOS['N_SCENARIOS'],
+    },
 }
 
 
 # ================================================================================
 # OPTIMISATION INPUTS
 # ================================================================================
-class OptimisationModelInput(BaseModel):
-    """Optimisation input parameters"""
+class ModelParametersInput(BaseModel):
+    """Optimisation model parameters"""
 
     optimisation_scenario: Optional[int] = Config.SELECTED_OPTIMISATION_SCENARIO
     add_delivery_time_constraint: Optional[bool] = Config.ADD_DELIVERY_TIME_CONSTRAINT
@@ -41,4 +60,79 @@ class OptimisationModelInput(BaseModel):
     working_hours_per_day: Optional[float] = Config.OPT_PARAMS['working_hours_per_day']
     maximum_delivery_hrs_constraint: Optional[float] = Config.OPT_PARAMS['maximum_delivery_hrs_constraint']
     profit_per_sales_volume: Optional[float] = Config.OPT_PARAMS['profit_per_sales_volume']
+    despatcher_formulation: Optional[str] = Config.DESPATCHER_FORMULATION  # See Config.DESPATCHER_FORMULATION
+
+    @validator('despatcher_formulation')
+    def check_despatcher_formulation(cls, despatcher_formulation):
+        if despatcher_formulation is not None and despatcher_formulation not in Config.DESPATCHER_FORMULATIONS:
+            raise ValueError(f"Unknown despatcher formulation, choose from {Config.DESPATCHER_FORMULATIONS}.")
+        return despatcher_formulation
+
+
+class ModelInput(ModelParametersInput):
+    """Optimisation model inputs"""
+
+    presolve: Optional[bool] = Config.PRESOLVE['ENABLED']  # See Config.PRESOLVE
+
+
+class OptimisationModelInput(ModelInput):
+    """Optimisation input parameters"""
+
+    solve_profile: Optional[str] = Config.DEFAULT_SOLVE_PROFILE  # Latency tier, see Config.SOLVE_PROFILES
+    aggregation_nodes: Optional[int] = Config.AGGREGATION['N_NODES']  # Resolution of the demand, see Config.AGGREGATION
+    decomposition: Optional[str] = Config.DECOMPOSITION['PARTITION']  # See Config.DECOMPOSITION
+
+    @validator('solve_profile')
+    def check_solve_profile(cls, solve_profile):
+        if solve_profile is not None and solve_profile not in Config.SOLVE_PROFILES:
+            raise ValueError(f"Unknown solve profile, choose from {list(Config.SOLVE_PROFILES)}.")
+        return solve_profile
+
+    @validator('aggregation_nodes')
+    def check_aggregation_nodes(cls, aggregation_nodes):
+        if aggregation_nodes is not None and aggregation_nodes < 1:
+            raise ValueError("aggregation_nodes must be at least 1.")
+        return aggregation_nodes
+
+    @validator('decomposition')
+    def check_decomposition(cls, decomposition):
+        if decomposition is not None and decomposition not in Config.DECOMPOSITION['PARTITIONS']:
+            raise ValueError(f"Unknown decomposition partition, choose from {Config.DECOMPOSITION['PARTITIONS']}.")
+        return decomposition
+
+
+class ParametricSweepInput(ModelInput):
+    """Coefficient to sweep over a range, with the other optimisation model inputs"""
+
+    parameter: str  # See Config.PARAMETRIC_SWEEP['PARAMETERS']
+    start: float
+    stop: float
+
+    @validator('parameter')
+    def check_parameter(cls, parameter):
+        if parameter not in Config.PARAMETRIC_SWEEP['PARAMETERS']:
+            raise ValueError(f"Unknown sweep parameter, choose from {Config.PARAMETRIC_SWEEP['PARAMETERS']}.")
+        return parameter
+
+    @validator('stop')
+    def check_range(cls, stop, values):
+        if 'start' in values and not values['start'] < stop:
+            raise ValueError("stop must be above start.")
+        return stop
+
+
+class DemandScenariosInput(ModelParametersInput):
+    """
+    Open warehouses to evaluate under sampled demands, with the other optimisation model parameters. No presolve: the
+    warehouses are given, and merging townships would change how their demands are sampled.
+    """
+
+    warehouses: List[str]  # e.g. the warehouse selection of /run_optimisation/
+    n_scenarios: Optional[int] = Config.DEMAND_SCENARIOS['N_SCENARIOS']
+    random_state: Optional[int] = Config.DEMAND_SCENARIOS['RANDOM_STATE']
 
+    @validator('n_scenarios')
+    def check_n_scenarios(cls, n_scenarios):
+        if n_scenarios is not None and n_scenarios < 1:
+            raise ValueError("n_scenarios must be at least 1.")
+        return n_scenarios
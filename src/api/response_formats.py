@@ -0,0 +1,146 @@
+"""
+Content-negotiated result formats for the optimisation endpoints.
+
+The format is chosen from the request's Accept header (highest q-value first, JSON for `*/*` or no header):
+
+- application/json: JSON encoded with orjson.
+- application/msgpack (or application/x-msgpack): MessagePack of the same content as the JSON.
+- application/vnd.apache.arrow.stream: the result tables (warehouse selection, warehouse-township assignment and
+  despatchers) as consecutive Arrow IPC streams, one per table, in that order. Each stream's schema metadata holds
+  the table name under b'table', and the names are listed in the X-Arrow-Tables header. Read them with
+  `pyarrow.ipc.open_stream()` repeatedly on the same buffer. Numeric columns are not copied when converting from pandas.
+
+Responses are compressed with brotli or gzip following the Accept-Encoding header, see Config.API.
+"""
+
+import gzip
+import typing
+import orjson
+from conf import Config
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+MEDIA_TYPE_ALIASES = {
+    JSON: JSON,
+    'application/*': JSON,
+    '*/*': JSON,
+    MSGPACK: MSGPACK,
+    'application/x-msgpack': MSGPACK,
+    ARROW_STREAM: ARROW_STREAM,
+}
+
+
+def _to_builtin(value):
+    """Fallback encoder for numpy and pandas scalars, e.g. the values of DataFrame.to_dict() on older pandas."""
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Type is not serialisable: {type(value)}")
+
+
+class ORJSONResponse(JSONResponse):
+    """Custom JSONResponse class for returning NaN float values in JSON."""
+    media_type = JSON
+
+    def render(self, content: typing.Any) -> bytes:
+        return orjson.dumps(content, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _parse_header_values(header):
+    """Values of an Accept-style header with their q-values, highest first, skipping q=0."""
+    values = []
+    for position, item in enumerate(header.split(',')):
+        value, *parameters = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for parameter in parameters:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        if value and quality > 0:
+            values.append((-quality, position, value.lower()))
+    return [value for _, _, value in sorted(values)]
+
+
+def negotiate_media_type(request: Request):
+    """
+    Returns:
+        str: Result media type for the request's Accept header, None if no supported type is acceptable.
+    """
+    accept = request.headers.get('Accept') or '*/*'
+    for media_type in _parse_header_values(accept):
+        if media_type in MEDIA_TYPE_ALIASES:
+            return MEDIA_TYPE_ALIASES[media_type]
+    return None
+
+
+def not_acceptable_response(headers=None):
+    return ORJSONResponse(
+        status_code=406, headers=headers,
+        content={"detail": f"Not acceptable, choose from {[JSON, MSGPACK, ARROW_STREAM]}."},
+    )
+
+
+def _encode_arrow_stream(result_tables):
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    sink = pa.BufferOutputStream()
+    for table_name, table_df in result_tables.items():
+        record_batch = pa.RecordBatch.from_pandas(table_df, preserve_index=True)
+        schema_metadata = dict(record_batch.schema.metadata or {}, table=table_name)
+        record_batch = record_batch.replace_schema_metadata(schema_metadata)
+        with pa.ipc.new_stream(sink, record_batch.schema) as writer:
+            writer.write_batch(record_batch)
+    return sink.getvalue().to_pybytes()
+
+
+def _compress(body, request):
+    """Compress the body with the first accepted (and available) encoding, returns the body and its encoding."""
+    if len(body) < Config.API['COMPRESSION_MIN_BYTES']:
+        return body, None
+    for encoding in _parse_header_values(request.headers.get('Accept-Encoding', '')):
+        if encoding == 'br':
+            try:
+                import brotli
+            except ImportError:
+                continue
+            return brotli.compress(body, quality=Config.API['BROTLI_QUALITY']), 'br'
+        if encoding == 'gzip':
+            return gzip.compress(body, compresslevel=Config.API['GZIP_LEVEL']), 'gzip'
+    return body, None
+
+
+def results_response(request: Request, compiled_json_results, result_tables, media_type=None, headers=None):
+    """
+    Encode the optimisation results in the negotiated format.
+
+    Args:
+        request (Request): Request, for its Accept and Accept-Encoding headers.
+        compiled_json_results (dict): Results as compiled by Postprocessing.
+        result_tables (dict): Result DataFrames by name, see Postprocessing.result_tables.
+        media_type (str, optional): Negotiated media type. Defaults to negotiating it from the request.
+        headers (dict, optional): Additional response headers. Defaults to None.
+    """
+    media_type = media_type or negotiate_media_type(request)
+    headers = dict(headers or {}, Vary='Accept, Accept-Encoding')
+    if media_type == JSON:
+        body = ORJSONResponse(content=compiled_json_results).body
+    elif media_type == MSGPACK:
+        import msgpack
+        body = msgpack.packb(compiled_json_results, default=_to_builtin, use_bin_type=True)
+    elif media_type == ARROW_STREAM:
+        body = _encode_arrow_stream(result_tables)
+        headers['X-Arrow-Tables'] = ','.join(result_tables)
+    else:
+        return not_acceptable_response(headers)
+
+    body, content_encoding = _compress(body, request)
+    if content_encoding is not None:
+        headers['Content-Encoding'] = content_encoding
+    return Response(content=body, media_type=media_type, headers=headers)
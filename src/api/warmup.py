@@ -0,0 +1,83 @@
+"""
+API warm-up.
+
+Loads everything a request needs that does not depend on its inputs: the model pipeline dependencies (pyomo,
+pandas, mlflow), the Preprocessing snapshot of the input files, its data fingerprint and the warehouse-township
+distance matrix. Under gunicorn with `preload_app` this runs once in the master process, so the forked workers share
+these pages copy-on-write; under plain uvicorn each worker warms up in the background after startup.
+"""
+
+import gc
+import time
+import threading
+from conf import Config, Logger, Tracer
+
+
+class WarmState:
+
+    _logger = Logger().logger
+    _warm_up_lock = threading.Lock()
+
+    processed_data = None
+    ready = False
+    warm_up_seconds = None
+
+    @classmethod
+    def warm_up(cls, build_base_model=None):
+        """
+        Load the shared request state. Safe to call more than once, later calls return immediately.
+
+        Args:
+            build_base_model (bool, optional): Build a model with default inputs to warm up pyomo's code paths and
+                the ModelCache. Defaults to Config.API['BUILD_BASE_MODEL'].
+        """
+        build_base_model = Config.API['BUILD_BASE_MODEL'] if build_base_model is None else build_base_model
+
+        with cls._warm_up_lock:
+            if cls.ready:
+                return
+
+            start_time = time.perf_counter()
+            cls._logger.info("[WarmState] Warm-up initiated...")
+            with Tracer.span('warm_up', build_base_model=build_base_model) as span:
+                # Importing the model pipeline dependencies
+                from src.optimisation_model.main import main  # noqa: F401
+                from src.optimisation_model.preprocessing import Preprocessing
+                from src.optimisation_model.model import OptimisationModel
+                from src.optimisation_model.presolve import Presolve
+
+                processed_data = Preprocessing()
+                span.set_attributes(W=len(processed_data.warehouse_df), T=len(processed_data.township_df),
+                                    n_distances=len(processed_data.distance_matrix),
+                                    data_fingerprint=processed_data.data_fingerprint)
+
+                if build_base_model:
+                    # Kept by the ModelCache, so that runs with default inputs skip the build
+                    base_model_data = Presolve(processed_data) if Config.PRESOLVE['ENABLED'] else processed_data
+                    OptimisationModel(base_model_data).release()
+
+            # Moving everything loaded so far out of the garbage collector's generations, so that collections in
+            # forked workers do not write to (and hence copy) the shared pages
+            gc.collect()
+            if hasattr(gc, 'freeze'):
+                gc.freeze()
+
+            cls.processed_data = processed_data
+            cls.warm_up_seconds = time.perf_counter() - start_time
+            cls.ready = True
+            cls._logger.info("[WarmState] Warm-up completed in %.2fs.", cls.warm_up_seconds)
+
+    @classmethod
+    def warm_up_in_background(cls):
+        """
+        Start the warm-up on a background thread, so the server can answer /ready while loading.
+        """
+        if not cls.ready:
+            threading.Thread(target=cls._warm_up_logging_errors, name='WarmUp', daemon=True).start()
+
+    @classmethod
+    def _warm_up_logging_errors(cls):
+        try:
+            cls.warm_up()
+        except Exception as error:
+            cls._logger.exception(f"[WarmState] Warm-up failed: {error}")
@@ -0,0 +1,60 @@
+"""
+Benchmark of the demand aggregation's objective error and run time against solving on the townships.
+
+Run from the project root:
+
+> python -m src.benchmarks.aggregation_error [--scenario 2] [--nodes 10 20 40]
+"""
+
+import time
+import argparse
+from src.optimisation_model.main import main
+from src.optimisation_model.preprocessing import Preprocessing
+
+N_NODES = [10, 20, 40]
+
+
+def benchmark_aggregation_error(n_nodes=N_NODES, **kwargs):
+    """
+    Solve the model on the townships and on each number of demand nodes.
+
+    Args:
+        n_nodes (list, optional): Numbers of demand nodes to aggregate into. Defaults to N_NODES.
+        **kwargs: Optimisation model inputs, see OptimisationModel.
+
+    Returns:
+        list: One dict per run: n_nodes (None on the townships), objective (of the disaggregated solution),
+            aggregated_objective, relative_error (against the unaggregated objective) and seconds. Unaggregated runs
+            are solved to the configured gap, so the error is only meaningful beyond it.
+    """
+    processed_data = Preprocessing()
+    results = []
+    for nodes in [None] + list(n_nodes):
+        start_time = time.perf_counter()
+        post_process_output = main(processed_data=processed_data, aggregation_nodes=nodes, **kwargs)
+        seconds = time.perf_counter() - start_time
+        report = post_process_output.aggregation_report or {}
+        # Objectives with whole despatchers per warehouse-township pair, whatever the despatcher formulation
+        solve_summary = post_process_output.solve_summary
+        objective = report.get('disaggregated_objective',
+                               solve_summary.get('per_arc_objective', solve_summary['objective']))
+        results.append(dict(n_nodes=nodes, objective=objective,
+                            aggregated_objective=report.get('aggregated_objective', objective), seconds=seconds))
+
+    unaggregated_objective = results[0]['objective']
+    for result in results:
+        result['relative_error'] = (result['objective'] - unaggregated_objective) / abs(unaggregated_objective)
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', type=int, default=None, help="Optimisation scenario, defaults to Config.")
+    parser.add_argument('--nodes', type=int, nargs='+', default=N_NODES, help="Numbers of demand nodes.")
+    args = parser.parse_args()
+
+    print(f"{'n_nodes':>10} {'objective':>16} {'aggregated':>16} {'rel. error':>10} {'seconds':>8}")
+    for result in benchmark_aggregation_error(args.nodes, optimisation_scenario=args.scenario):
+        print(f"{str(result['n_nodes'] or 'townships'):>10} {result['objective']:16,.2f} "
+              f"{result['aggregated_objective']:16,.2f} {result['relative_error']:10.2%} {result['seconds']:8.2f}")
@@ -0,0 +1,102 @@
+"""
+Benchmark of DemandScenarios' greedy assignment against solving the model per scenario, with the warehouses fixed.
+
+Run from the project root:
+
+> python -m src.benchmarks.demand_scenarios_vs_milp [--scenario 2] [--costs] [--milp-scenarios 10]
+"""
+
+import time
+import argparse
+import numpy as np
+import pyomo.environ as pyo
+from conf import Config
+from src.optimisation_model.preprocessing import Preprocessing, Township
+from src.optimisation_model.model import OptimisationModel
+from src.optimisation_model.solver import ModelSolver
+from src.optimisation_model.solver_log import relative_gap
+from src.optimisation_model.demand_scenarios import DemandScenarios, sample_demands
+
+
+class _ScenarioData:
+    """Snapshot with one scenario's township demands, as read by OptimisationModel."""
+
+    def __init__(self, processed_data, demands, scenario):
+        self.warehouse_list = processed_data.warehouse_list
+        self.township_list = [Township(t.name, t.district, t.latitude, t.longitude, demand)
+                              for t, demand in zip(processed_data.township_list, demands)]
+        self.distance_matrix = processed_data.distance_matrix
+        self.data_fingerprint = f"{processed_data.data_fingerprint}-demand-scenario-{scenario}"
+
+
+def benchmark_demand_scenarios_vs_milp(milp_scenarios=10, **kwargs):
+    """
+    Select the warehouses with CBC, evaluate them under Config.DEMAND_SCENARIOS['N_SCENARIOS'] demand scenarios, and
+    solve the model with the warehouses fixed for the first few of these scenarios.
+
+    Args:
+        milp_scenarios (int, optional): Scenarios also solved with CBC, at most one batch. Defaults to 10.
+        **kwargs: Optimisation model inputs, see OptimisationModel.
+
+    Returns:
+        tuple: DemandScenarios, and one dict per scenario solved with CBC: scenario, greedy and milp objectives (milp
+            None if infeasible, i.e. unmet demand in scenario 1), relative_error (of the greedy objective against
+            CBC's), unmet_demand (greedy) and milp_seconds. CBC solves to the configured gap, so errors within it are
+            not meaningful.
+    """
+    processed_data = Preprocessing()
+    model_builder = OptimisationModel(processed_data, **kwargs)
+    ModelSolver(model_builder.model)
+    demand_scenarios = DemandScenarios.from_model_builder(model_builder)
+    model_builder.release()
+
+    # The first batch's scenarios, sampled again
+    batch_size = min(demand_scenarios.n_scenarios, Config.DEMAND_SCENARIOS['BATCH_SIZE'])
+    seed = np.random.SeedSequence(demand_scenarios.random_state).spawn(1)[0]
+    scenario_demands = sample_demands(demand_scenarios.network, seed, batch_size)[:milp_scenarios]
+    results = []
+    for scenario, demands in enumerate(scenario_demands):
+        start_time = time.perf_counter()
+        # Not released to the ModelCache, its warehouses are fixed
+        scenario_model = OptimisationModel(_ScenarioData(processed_data, demands, scenario), **kwargs).model
+        for w in scenario_model.W:
+            scenario_model.x[w].fix(int(w in demand_scenarios.warehouses))
+        try:
+            ModelSolver(scenario_model)
+            milp_objective = pyo.value(scenario_model.obj)
+        except ValueError:
+            milp_objective = None
+        greedy_objective = demand_scenarios.metrics['objective'][scenario]
+        results.append(dict(
+            scenario=scenario, greedy=greedy_objective, milp=milp_objective,
+            relative_error=relative_gap(greedy_objective, milp_objective),
+            unmet_demand=demand_scenarios.metrics['unmet_demand'][scenario],
+            milp_seconds=time.perf_counter() - start_time,
+        ))
+    return demand_scenarios, results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', type=int, default=None, help="Optimisation scenario, defaults to Config.")
+    parser.add_argument('--costs', action='store_true', help="Add despatcher hiring and delivery costs.")
+    parser.add_argument('--milp-scenarios', type=int, default=10, help="Demand scenarios also solved with CBC.")
+    args = parser.parse_args()
+
+    model_inputs = dict(optimisation_scenario=args.scenario)
+    if args.costs:
+        model_inputs.update(add_despatcher_hiring_cost=True, add_delivery_cost=True)
+
+    def format_value(value, spec):
+        return '-' if value is None else format(value, spec)
+
+    demand_scenarios, milp_results = benchmark_demand_scenarios_vs_milp(args.milp_scenarios, **model_inputs)
+    print(f"{'scenario':>8} {'greedy':>16} {'milp':>16} {'rel. error':>10} {'unmet':>12} {'seconds':>8}")
+    for result in milp_results:
+        print(f"{result['scenario']:>8} {result['greedy']:16,.2f} {format_value(result['milp'], '16,.2f'):>16} "
+              f"{format_value(result['relative_error'], '10.2%'):>10} {result['unmet_demand']:12,.0f} "
+              f"{result['milp_seconds']:8.2f}")
+    milp_seconds = np.mean([result['milp_seconds'] for result in milp_results])
+    print(f"\n{demand_scenarios.n_scenarios} scenarios evaluated in {demand_scenarios.seconds:.2f}s, against "
+          f"{milp_seconds:.2f}s per scenario with CBC.")
@@ -0,0 +1,68 @@
+"""
+Benchmark of the Lagrangian relaxation's bound and repaired solution against CBC.
+
+Run from the project root:
+
+> python -m src.benchmarks.lagrangian_vs_cbc [--scenario 2] [--costs] [--formulation per_warehouse]
+"""
+
+import time
+import argparse
+from src.optimisation_model.main import main
+from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.solver_log import relative_gap
+
+
+def benchmark_lagrangian_vs_cbc(**kwargs):
+    """
+    Solve the model with CBC (default solver settings) and with the 'lagrangian' solve profile.
+
+    Args:
+        **kwargs: Optimisation model inputs, see OptimisationModel.
+
+    Returns:
+        list: One dict per run: method, objective (None if no feasible solution was found in the solver's time
+            limit), bound (the Lagrangian bound for both runs), relative_error (of the objective against CBC's), gap
+            (between the objective and the bound) and seconds. CBC solves to the configured gap, so errors within it
+            are not meaningful.
+    """
+    processed_data = Preprocessing()
+    results = []
+    for method, solve_profile in [('cbc', None), ('lagrangian', 'lagrangian')]:
+        start_time = time.perf_counter()
+        try:
+            solve_summary = main(processed_data=processed_data, solve_profile=solve_profile, **kwargs).solve_summary
+        except ValueError:
+            # e.g. CBC's time limit reached without a feasible solution
+            solve_summary = {'objective': None}
+        results.append(dict(method=method, objective=solve_summary['objective'],
+                            bound=solve_summary.get('lagrangian_bound'), seconds=time.perf_counter() - start_time))
+
+    cbc_result, lagrangian_result = results
+    cbc_result['bound'] = lagrangian_result['bound']
+    for result in results:
+        result['relative_error'] = relative_gap(result['objective'], cbc_result['objective'])
+        result['gap'] = relative_gap(result['objective'], result['bound'])
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', type=int, default=None, help="Optimisation scenario, defaults to Config.")
+    parser.add_argument('--costs', action='store_true', help="Add despatcher hiring and delivery costs.")
+    parser.add_argument('--formulation', default=None, help="Despatcher formulation, defaults to Config.")
+    args = parser.parse_args()
+
+    model_inputs = dict(optimisation_scenario=args.scenario, despatcher_formulation=args.formulation)
+    if args.costs:
+        model_inputs.update(add_despatcher_hiring_cost=True, add_delivery_cost=True)
+
+    def format_value(value, spec):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'method':>10} {'objective':>16} {'bound':>16} {'rel. error':>10} {'gap':>8} {'seconds':>8}")
+    for result in benchmark_lagrangian_vs_cbc(**model_inputs):
+        print(f"{result['method']:>10} {format_value(result['objective'], '16,.2f'):>16} "
+              f"{format_value(result['bound'], '16,.2f'):>16} {format_value(result['relative_error'], '10.2%'):>10} "
+              f"{format_value(result['gap'], '8.2%'):>8} {result['seconds']:8.2f}")
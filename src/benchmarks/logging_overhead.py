@@ -0,0 +1,49 @@
+"""
+Benchmark of the per-call cost of conf.Logger on the calling thread.
+
+Run from the project root:
+
+> python -m src.benchmarks.logging_overhead
+"""
+
+import timeit
+import logging
+from conf import Logger
+
+N_CALLS = 100_000
+
+
+def benchmark_logging_overhead(n_calls=N_CALLS):
+    """
+    Time debug/info calls on the calling thread at INFO level.
+
+    Args:
+        n_calls (int, optional): Number of logging calls per measurement. Defaults to N_CALLS.
+
+    Returns:
+        dict: Microseconds per call for each measurement.
+    """
+    logger = Logger().logger
+    original_level = logger.level
+    logger.setLevel(logging.INFO)
+    value = {'warehouse': 'North Port, Port Klang', 'selected': True}
+
+    measurements = {
+        'debug_fstring_disabled': lambda: logger.debug(f"--> Warehouse: {value['warehouse']} | {value['selected']}"),
+        'debug_lazy_disabled': lambda: logger.debug("--> Warehouse: %s | %s", value['warehouse'], value['selected']),
+        'info_enqueued': lambda: logger.info("--> Warehouse: %s | %s", value['warehouse'], value['selected']),
+    }
+    results = {}
+    try:
+        for name, log_call in measurements.items():
+            n = n_calls if name != 'info_enqueued' else n_calls // 100
+            results[name] = timeit.timeit(log_call, number=n) / n * 1e6
+    finally:
+        logger.setLevel(original_level)
+    return results
+
+
+if __name__ == "__main__":
+
+    for name, microseconds in benchmark_logging_overhead().items():
+        print(f"{name:<25}: {microseconds:8.3f} us/call")
@@ -0,0 +1,84 @@
+"""
+Benchmark of the cold import time and memory of the modules loaded by each API worker.
+
+Every module is imported in a fresh interpreter, so the numbers match a newly started uvicorn worker. Heavy
+dependencies that end up imported are listed to catch eager imports creeping back in.
+
+Run from the project root:
+
+> python -m src.benchmarks.startup_time
+"""
+
+import sys
+import json
+import subprocess
+
+MODULES = [
+    'conf',
+    'src.data_connectors',
+    'src.api.fastapi_main',
+    'src.optimisation_model.main',
+]
+
+HEAVY_DEPENDENCIES = ['pandas', 'pyomo', 'mlflow', 'sqlalchemy', 'haversine', 'geopy', 'boto3', 'azure']
+
+_IMPORT_SCRIPT = """
+import sys, json, time, importlib
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+rss_before = rss_mb()
+start_time = time.perf_counter()
+importlib.import_module(sys.argv[1])
+import_seconds = time.perf_counter() - start_time
+rss_after = rss_mb()
+heavy = [name for name in json.loads(sys.argv[2]) if name in sys.modules]
+print(json.dumps({'import_seconds': import_seconds, 'rss_before_mb': rss_before, 'rss_after_mb': rss_after,
+                  'heavy_dependencies': heavy}))
+"""
+
+
+def benchmark_startup_time(modules=None, n_repeats=3):
+    """
+    Import each module in a fresh interpreter and measure import time and resident memory.
+
+    Args:
+        modules (list, optional): Modules to import. Defaults to MODULES.
+        n_repeats (int, optional): Number of cold imports per module, the fastest is reported. Defaults to 3.
+
+    Returns:
+        dict: Import seconds, RSS (MB) and imported heavy dependencies per module.
+    """
+    results = {}
+    for module in modules or MODULES:
+        runs = []
+        for _ in range(n_repeats):
+            completed = subprocess.run(
+                [sys.executable, '-c', _IMPORT_SCRIPT, module, json.dumps(HEAVY_DEPENDENCIES)],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        results[module] = min(runs, key=lambda x: x['import_seconds'])
+    return results
+
+
+if __name__ == "__main__":
+
+    for module_name, result in benchmark_startup_time().items():
+        rss_after_mb = f"{result['rss_after_mb']:8.1f} MB" if result['rss_after_mb'] is not None else '     n/a'
+        print(f"{module_name:<32} {result['import_seconds'] * 1000:9.1f} ms  RSS {rss_after_mb}  "
+              f"heavy: {', '.join(result['heavy_dependencies']) or '-'}")
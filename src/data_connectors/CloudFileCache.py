@@ -0,0 +1,216 @@
+"""
+CloudFileCache script includes a local read-through cache for objects downloaded from Azure Blob Storage and
+AWS S3 Bucket.
+
+Cached objects are keyed by namespace (storage account/container or bucket) + object key and validated against the
+ETag/Last-Modified returned by the object listing, which the connectors already request, so a cache hit costs no
+extra round-trip. The cache directory is safe to share between API workers:
+    - Each version of an object is written atomically to its own data file, named after its ETag/Last-Modified, and
+      the metadata file, written after it, points to that version. A reader never pairs new content with stale
+      metadata, and data files are never rewritten in place.
+    - Least recently used data files are evicted once the cache grows beyond its size limit. Each process counts the
+      bytes it writes and only scans the cache directory when its count crosses the limit, evicting down to
+      EVICT_TO_FRACTION of it. Between scans, the cache can exceed its limit by what the other processes wrote.
+    - Superseded versions are left to the eviction, so a path handed out just before an update stays readable.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from collections import namedtuple
+from conf import Config, Logger
+
+CachedObject = namedtuple('CachedObject', ['name', 'etag', 'last_modified'])
+
+
+class CloudFileCache:
+
+    DATA_SUFFIX = '.data'
+    META_SUFFIX = '.meta.json'
+    FETCH_ATTEMPTS = 2  # A data file evicted between fetch_path() and reading it is downloaded again
+
+    def __init__(self, cache_dir=None, max_size_bytes=None, offline=None):
+        """
+        Initialisation
+
+        Args:
+            cache_dir ([str]): [cache directory. Defaults to Config.CLOUD_CACHE['DIR']]
+            max_size_bytes ([int]): [maximum cache size before LRU eviction. Defaults to Config setting]
+            offline ([bool]): [serve objects from the cache only, without contacting the cloud storage.
+                               Defaults to Config setting]
+        """
+        self._logger = Logger().logger
+        self.cache_dir = Path(cache_dir or Config.CLOUD_CACHE['DIR'])
+        self.max_size_bytes = max_size_bytes or Config.CLOUD_CACHE['MAX_SIZE_BYTES']
+        self.offline = Config.CLOUD_CACHE['OFFLINE'] if offline is None else offline
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.total_size = None  # Bytes in the cache as of the last scan, plus those written since by this process
+
+    def fetch_path(self, namespace, cloud_object, download_function):
+        """
+        Return the local path of a cached object, downloading it first if it is missing or stale.
+
+        Args:
+            namespace ([str]): [storage namespace, e.g. 'azure/<account>/<container>' or 's3/<bucket>']
+            cloud_object ([CachedObject]): [object name with the ETag/Last-Modified reported by the listing]
+            download_function ([callable]): [function returning the object content as bytes]
+        Returns:
+            data_path ([Path]): [path to the cached object content]
+        """
+        entry_id = self._entry_id(namespace, cloud_object.name)
+        meta_path = Path(self.cache_dir, entry_id + self.META_SUFFIX)
+        metadata = self._read_metadata(meta_path)
+
+        if metadata is not None and 'version' in metadata and (self.offline or self._is_valid(metadata, cloud_object)):
+            data_path = self._data_path(entry_id, metadata['version'])
+            try:
+                os.utime(data_path)  # Marking entry as recently used
+                self._logger.debug("[CloudFileCache] Cache hit for %s/%s.", namespace, cloud_object.name)
+                return data_path
+            except FileNotFoundError:
+                pass  # Evicted by another process since the metadata was read, a miss
+
+        if self.offline:
+            raise FileNotFoundError(f"[CloudFileCache] {namespace}/{cloud_object.name} is not cached (offline mode).")
+
+        self._logger.debug("[CloudFileCache] Cache miss for %s/%s, downloading.", namespace, cloud_object.name)
+        version = self._version(cloud_object)
+        data_path = self._data_path(entry_id, version)
+        data = download_function()
+        self._write_atomic(data_path, data)
+        self._write_atomic(meta_path, json.dumps({
+            'namespace': namespace,
+            'name': cloud_object.name,
+            'etag': cloud_object.etag,
+            'last_modified': str(cloud_object.last_modified),
+            'version': version,
+        }).encode('utf8'))
+        self.__count_written(len(data))
+        return data_path
+
+    def fetch(self, namespace, cloud_object, download_function):
+        """
+        Return the content of a cached object as bytes, downloading it first if it is missing or stale.
+
+        Args:
+            namespace ([str]): [storage namespace]
+            cloud_object ([CachedObject]): [object name with the ETag/Last-Modified reported by the listing]
+            download_function ([callable]): [function returning the object content as bytes]
+        """
+        for attempt in range(self.FETCH_ATTEMPTS):
+            try:
+                with open(self.fetch_path(namespace, cloud_object, download_function), 'rb') as file:
+                    return file.read()
+            except FileNotFoundError:
+                if self.offline or attempt == self.FETCH_ATTEMPTS - 1:
+                    raise
+
+    def list_objects(self, namespace, prefix=''):
+        """
+        List cached objects under a prefix, used in offline mode in place of the cloud listing.
+
+        Args:
+            namespace ([str]): [storage namespace]
+            prefix ([str]): [object name prefix]
+        Returns:
+            cached_objects ([list]): [list of CachedObject sorted by name]
+        """
+        cached_objects = []
+        for meta_path in self.cache_dir.glob('*' + self.META_SUFFIX):
+            metadata = self._read_metadata(meta_path)
+            if metadata is None or metadata['namespace'] != namespace or not metadata['name'].startswith(prefix):
+                continue
+            cached_objects.append(CachedObject(metadata['name'], metadata['etag'], metadata['last_modified']))
+        return sorted(cached_objects, key=lambda x: x.name)
+
+    def evict(self, target_size_bytes=None):
+        """
+        Remove least recently used data files until the cache fits within `target_size_bytes`, and the metadata
+        pointing to them.
+
+        Args:
+            target_size_bytes ([int]): [size to evict down to. Defaults to `max_size_bytes`]
+        """
+        target_size_bytes = self.max_size_bytes if target_size_bytes is None else target_size_bytes
+        entries = []
+        total_size = 0
+        for data_path in self.cache_dir.glob('*' + self.DATA_SUFFIX):
+            try:
+                stat = data_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, data_path))
+            total_size += stat.st_size
+
+        for _, size, data_path in sorted(entries, key=lambda x: x[0]):
+            if total_size <= target_size_bytes:
+                break
+            entry_id, _, version = data_path.name[:-len(self.DATA_SUFFIX)].partition('.')
+            meta_path = Path(self.cache_dir, entry_id + self.META_SUFFIX)
+            metadata = self._read_metadata(meta_path)
+            try:
+                data_path.unlink()
+                if metadata is not None and metadata.get('version') == version:
+                    meta_path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            self._logger.debug("[CloudFileCache] Evicted %s (%s bytes).", data_path.name, size)
+        self.total_size = total_size
+
+    def clear(self):
+        """
+        Remove all cached objects.
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.total_size = 0
+
+    def __count_written(self, size):
+        """Count bytes written, scanning the cache and evicting only once the count crosses the size limit."""
+        if self.total_size is None:
+            self.evict()  # First write of this process, counting what is already cached
+        self.total_size += size
+        if self.total_size > self.max_size_bytes:
+            self.evict(int(self.max_size_bytes * Config.CLOUD_CACHE['EVICT_TO_FRACTION']))
+
+    @staticmethod
+    def _is_valid(metadata, cloud_object):
+        if cloud_object.etag is not None:
+            return metadata['etag'] == cloud_object.etag
+        return cloud_object.last_modified is not None and metadata['last_modified'] == str(cloud_object.last_modified)
+
+    @staticmethod
+    def _entry_id(namespace, name):
+        return hashlib.sha256(f"{namespace}/{name}".encode('utf8')).hexdigest()
+
+    @staticmethod
+    def _version(cloud_object):
+        """Key of the object version, from the ETag/Last-Modified validating it."""
+        return hashlib.sha256(f"{cloud_object.etag}|{cloud_object.last_modified}".encode('utf8')).hexdigest()[:16]
+
+    def _data_path(self, entry_id, version):
+        return Path(self.cache_dir, f"{entry_id}.{version}{self.DATA_SUFFIX}")
+
+    @staticmethod
+    def _read_metadata(meta_path):
+        try:
+            with open(meta_path, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_atomic(self, path, data):
+        # Writing to a temporary file first so concurrent workers never read a partially written entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -1,21 +1,88 @@
 """
 CloudFileConnector script includes reading and writing to Azure Blob Storage and AWS S3 Bucket.
+
+Objects are downloaded concurrently on a bounded thread pool and parsed from in-memory bytes buffers, so binary
+formats (parquet, feather, xlsx, pickle) load the same way as text formats. Both connectors accept emulator
+endpoints (Azurite connection strings, moto/LocalStack `endpoint_url`) for local testing, and an optional
+CloudFileCache to avoid re-downloading unchanged objects.
 """
 import os
+import shutil
 import boto3
 import pandas as pd
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from conf import Logger
 from azure.storage.blob import BlobServiceClient
 from src.data_connectors.PandasFileConnector import PandasFileConnector
-from io import StringIO
+from src.data_connectors.CloudFileCache import CloudFileCache, CachedObject
+
+DEFAULT_MAX_WORKERS = 16
+
+
+def _parallel_map(fetch_function, items, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Apply `fetch_function` to every item on a bounded thread pool, yielding results in the original order.
+
+    At most `2 * max_workers` results are in flight at any time, so iterating lazily keeps memory bounded even for
+    partitioned datasets with hundreds of objects.
+
+    Args:
+        fetch_function ([callable]): [function called with a single item]
+        items ([list]): [items to process]
+        max_workers ([int]): [maximum number of concurrent threads]
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(executor.submit(fetch_function, item))
+            if len(in_flight) >= 2 * max_workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def _logged_stream(dataframes, logger, error_message):
+    """
+    Yield the lazily downloaded dataframes, logging errors raised while iterating as the eager loads do. The errors
+    are raised again, so a stream that failed part way is not mistaken for a complete one.
+
+    Args:
+        dataframes ([iterator]): [dataframes downloaded by `_parallel_map`]
+        logger ([logging.Logger]): [connector logger]
+        error_message ([str]): [message logged with the error]
+    """
+    try:
+        yield from dataframes
+    except Exception as error:
+        logger.exception(f"{error_message} | Error: {error}")
+        raise
+
+
+def _parse_bytes(data, object_name, **kwargs):
+    """
+    Parse a downloaded object as a dataframe based on its file extension.
+
+    Args:
+        data ([bytes]): [object content]
+        object_name ([str]): [blob name or object key, used to detect the file format]
+        **kwargs ([dict]): [dictionary of extra arguments passed to PandasFileConnector.load]
+    """
+    return PandasFileConnector.load(BytesIO(data), file_type=PandasFileConnector._check_filetype(object_name),
+                                    **kwargs)
+
 
 class AzureBlobStorage:
 
-    def __init__(self, azure_storage_conn_string):
+    def __init__(self, azure_storage_conn_string, max_workers=DEFAULT_MAX_WORKERS, cache: CloudFileCache = None):
         self._logger = Logger().logger
         self.blob_service_client = BlobServiceClient.from_connection_string(azure_storage_conn_string)
+        self.max_workers = max_workers
+        self.cache = cache
 
-    def load(self, container_name, blob_name=''):
+    def load(self, container_name, blob_name='', stream=False, **kwargs):
         """
         Load all blob files in a container name given to local path and append to a dataframe, works only for blob files with same file format
         
@@ -27,22 +94,33 @@ class AzureBlobStorage:
         Args:
             container_name ([str]): [container name]
             blob_name ([str]): [blob name aka file name, if blob name is not given, download all blobs inside the container]
+            stream ([bool]): [if True, return a generator yielding one dataframe per blob instead of a single
+                              concatenated dataframe, download errors are logged and raised while iterating.
+                              Defaults to False]
+            **kwargs ([dict]): [dictionary of extra arguments passed to PandasFileConnector.load]
         """
         try:
             self._logger.debug("[AzureBlobStorage] Load initiated.")
-            compiled_azure_df = pd.DataFrame()
             container_client = self.blob_service_client.get_container_client(container_name)
-            my_blobs = container_client.list_blobs(blob_name)
-            if not list(my_blobs):
+            my_blobs = self._list_blobs(container_client, container_name, blob_name)
+            if not my_blobs:
                 raise Exception(
                     f"[AzureBlobStorage] Failed to download blob files from Azure Blob Storage | Error: Blob name has typos."
                 )
-            my_blobs = container_client.list_blobs(blob_name) # reloading the blob
-            for blob in my_blobs:
-                self._logger.debug(f"[AzureBlobStorage] Loading blob {blob.name}.")
-                downloaded_blob = container_client.download_blob(blob)
-                azure_df = PandasFileConnector.load(StringIO(downloaded_blob.content_as_text()), file_type=PandasFileConnector._check_filetype(blob.name))
-                compiled_azure_df = pd.concat([compiled_azure_df, azure_df], axis=0).reset_index(drop=True)
+            self._logger.debug("[AzureBlobStorage] Loading %s blobs.", len(my_blobs))
+
+            def load_blob(blob):
+                return _parse_bytes(self._download_blob_bytes(container_client, container_name, blob), blob.name,
+                                    **kwargs)
+
+            azure_dfs = _parallel_map(load_blob, my_blobs, max_workers=self.max_workers)
+            if stream:
+                return _logged_stream(
+                    azure_dfs, self._logger,
+                    "[AzureBlobStorage] Failed to download blob files from Azure Blob Storage"
+                )
+            compiled_azure_df = pd.concat(list(azure_dfs), axis=0, ignore_index=True)
+            self._logger.debug("[AzureBlobStorage] Load complete.")
             return compiled_azure_df
 
         except Exception as error:
@@ -69,17 +147,27 @@ class AzureBlobStorage:
         try:
             self._logger.debug("[AzureBlobStorage] Download initiated.")
             container_client = self.blob_service_client.get_container_client(container_name)
-            my_blobs = container_client.list_blobs(blob_name)
-            if not list(my_blobs):
+            my_blobs = self._list_blobs(container_client, container_name, blob_name)
+            if not my_blobs:
                 raise Exception(
                     f"[AzureBlobStorage] Failed to download blob files from Azure Blob Storage | Error: Blob name has typos."
                 )
-            my_blobs = container_client.list_blobs(blob_name) # reloading the blob
-            for blob in my_blobs:
-                bytes = container_client.get_blob_client(blob).download_blob().readall()
+
+            def download_blob(blob):
                 download_file_path = os.path.join(local_filepath_to_download, blob.name)
+                os.makedirs(os.path.dirname(download_file_path) or '.', exist_ok=True)
+                if self.cache is not None:
+                    cached_path = self.cache.fetch_path(
+                        self._cache_namespace(container_name), blob,
+                        lambda: container_client.download_blob(blob.name).readall()
+                    )
+                    shutil.copyfile(cached_path, download_file_path)
+                    return
                 with open(download_file_path, "wb") as file:
-                    file.write(bytes)
+                    container_client.download_blob(blob.name).readinto(file)
+
+            for _ in _parallel_map(download_blob, my_blobs, max_workers=self.max_workers):
+                pass
             self._logger.debug("[AzureBlobStorage] Download complete.")
 
         except Exception as error:
@@ -116,34 +204,70 @@ class AzureBlobStorage:
                 f"[AzureBlobStorage] Failed to save file to Azure Blob Storage | Error: {error}"
             )
 
+    def _list_blobs(self, container_client, container_name, blob_name):
+        """
+        List blobs under `blob_name` with their ETag/Last-Modified, from the cache index in offline mode.
+        """
+        if self.cache is not None and self.cache.offline:
+            return self.cache.list_objects(self._cache_namespace(container_name), blob_name)
+        return [CachedObject(blob.name, blob.etag, blob.last_modified)
+                for blob in container_client.list_blobs(blob_name) if not blob.name.endswith('/')]
+
+    def _download_blob_bytes(self, container_client, container_name, blob):
+        """
+        Download a blob as bytes, going through the cache when one is configured.
+        """
+        def download_function():
+            return container_client.download_blob(blob.name).readall()
+
+        if self.cache is None:
+            return download_function()
+        return self.cache.fetch(self._cache_namespace(container_name), blob, download_function)
+
+    def _cache_namespace(self, container_name):
+        return f"azure/{self.blob_service_client.account_name}/{container_name}"
+
 
 class AWSS3Bucket:
 
-    def __init__(self, aws_access_key_id: str, aws_secret_access_key: str):
+    def __init__(self, aws_access_key_id: str, aws_secret_access_key: str, endpoint_url: str = None,
+                 region_name: str = None, max_workers: int = DEFAULT_MAX_WORKERS, cache: CloudFileCache = None):
         self._logger = Logger().logger
         self.s3_resource = boto3.resource('s3',
                                           aws_access_key_id=aws_access_key_id,
-                                          aws_secret_access_key=aws_secret_access_key)
+                                          aws_secret_access_key=aws_secret_access_key,
+                                          endpoint_url=endpoint_url,
+                                          region_name=region_name)
+        # boto3 resources are not thread-safe, but the underlying low-level client is
+        self.s3_client = self.s3_resource.meta.client
+        self.max_workers = max_workers
+        self.cache = cache
 
-    def load(self, bucket_name, filepath_aws):
+    def load(self, bucket_name, filepath_aws, stream=False, **kwargs):
         """
         Load and append files from filepath_aws as a pd.DataFrame using PandasFileConnector. Works only for all files withs same file format type.
 
         Args:
             bucket_name ([str]): [aws bucket name]
             filepath_aws ([st]): [filepath in aws to download file from]
+            stream ([bool]): [if True, return a generator yielding one dataframe per object instead of a single
+                              concatenated dataframe, download errors are logged and raised while iterating.
+                              Defaults to False]
+            **kwargs ([dict]): [dictionary of extra arguments passed to PandasFileConnector.load]
         """
 
         try:
             self._logger.debug("[AWSS3Bucket] Load initiated.")
-            compiled_aws_df = pd.DataFrame()
-            for obj in self.s3_resource.Bucket(bucket_name).objects.filter(Prefix=filepath_aws):
-                if obj.key.endswith('/'):
-                    continue
-                self._logger.debug(f"[AWSS3Bucket] Loading file {obj.key}.")
-                aws_df = PandasFileConnector.load(obj.get()['Body'],
-                                                  file_type=PandasFileConnector._check_filetype(obj.key))
-                compiled_aws_df = pd.concat([compiled_aws_df, aws_df], axis=0)
+            s3_objects = self._list_objects(bucket_name, filepath_aws)
+            self._logger.debug("[AWSS3Bucket] Loading %s files.", len(s3_objects))
+
+            def load_object(s3_object):
+                return _parse_bytes(self._download_object_bytes(bucket_name, s3_object), s3_object.name, **kwargs)
+
+            aws_dfs = _parallel_map(load_object, s3_objects, max_workers=self.max_workers)
+            if stream:
+                return _logged_stream(aws_dfs, self._logger, "[AWSS3Bucket] Failed to load file from AWS S3 Storage")
+            compiled_aws_df = pd.concat(list(aws_dfs), axis=0, ignore_index=True) if s3_objects else pd.DataFrame()
             self._logger.debug("[AWSS3Bucket] Load complete.")
             return compiled_aws_df
 
@@ -165,13 +289,22 @@ class AWSS3Bucket:
 
         try:
             self._logger.debug("[AWSS3Bucket] Download initiated.")
-            for obj in self.s3_resource.Bucket(bucket_name).objects.filter(Prefix=filepath_aws):
-                target = os.path.join(local_dir, os.path.relpath(obj.key, filepath_aws))
-                if not os.path.exists(os.path.dirname(target)):
-                    os.makedirs(os.path.dirname(target))
-                if obj.key[-1] == '/':
-                    continue
-                self.s3_resource.Bucket(bucket_name).download_file(obj.key, target)
+            s3_objects = self._list_objects(bucket_name, filepath_aws)
+
+            def download_object(s3_object):
+                target = os.path.join(local_dir, os.path.relpath(s3_object.name, filepath_aws))
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                if self.cache is not None:
+                    cached_path = self.cache.fetch_path(
+                        self._cache_namespace(bucket_name), s3_object,
+                        lambda: self.s3_client.get_object(Bucket=bucket_name, Key=s3_object.name)['Body'].read()
+                    )
+                    shutil.copyfile(cached_path, target)
+                    return
+                self.s3_client.download_file(bucket_name, s3_object.name, target)
+
+            for _ in _parallel_map(download_object, s3_objects, max_workers=self.max_workers):
+                pass
             self._logger.debug("[AWSS3Bucket] Download complete.")
         except Exception as error:
             self._logger.exception(
@@ -201,4 +334,29 @@ class AWSS3Bucket:
         except Exception as error:
             self._logger.exception(
                 f"[AWSS3Bucket] Failed to save file to AWS S3 Storage | Error: {error}"
-            )
\ No newline at end of file
+            )
+
+    def _list_objects(self, bucket_name, filepath_aws):
+        """
+        List objects under `filepath_aws` with their ETag/Last-Modified, from the cache index in offline mode.
+        """
+        if self.cache is not None and self.cache.offline:
+            return self.cache.list_objects(self._cache_namespace(bucket_name), filepath_aws)
+        return [CachedObject(obj.key, obj.e_tag, obj.last_modified)
+                for obj in self.s3_resource.Bucket(bucket_name).objects.filter(Prefix=filepath_aws)
+                if not obj.key.endswith('/')]
+
+    def _download_object_bytes(self, bucket_name, s3_object):
+        """
+        Download an object as bytes, going through the cache when one is configured.
+        """
+        def download_function():
+            return self.s3_client.get_object(Bucket=bucket_name, Key=s3_object.name)['Body'].read()
+
+        if self.cache is None:
+            return download_function()
+        return self.cache.fetch(self._cache_namespace(bucket_name), s3_object, download_function)
+
+    @staticmethod
+    def _cache_namespace(bucket_name):
+        return f"s3/{bucket_name}"
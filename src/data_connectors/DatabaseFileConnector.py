@@ -1,9 +1,17 @@
 """
 DatabaseFileConnector script includes reading and writing to Postgresql, MySQL, MSSQL.
+
+Saving uses a dialect-aware bulk writer by default:
+    - postgresql: COPY FROM STDIN (CSV) through the psycopg2 cursor
+    - mssql: pyodbc `fast_executemany` on batched inserts
+    - mysql / sqlite: multi-row VALUES batches
+SQLite is supported as a local stand-in database for verifying the save/load round trip.
 """
 
+import csv
+import time
 import pandas as pd
-from sqlalchemy import create_engine
+from io import StringIO
 from conf import Logger
 
 
@@ -13,8 +21,13 @@ class DatabaseConnector:
         'postgresql': 'public',
         'mssql': 'dbo',
         'mysql': None,
+        'sqlite': None,
     }
 
+    DEFAULT_BATCH_SIZE = 10_000
+    SQLITE_MAX_VARIABLES = 999  # Maximum number of bound parameters per statement in older SQLite builds
+    STAGING_TABLE_SUFFIX = '__staging'
+
     def __init__(self, host: str, port: str, username: str, password: str, database: str,
                  db_type='postgresql', schema_name=None):
 
@@ -65,7 +78,8 @@ class DatabaseConnector:
             engine_conn.dispose()
             self._logger.debug("[DatabaseConnector] SQL connection disposed.")
     
-    def save(self, data_df, table_name, if_exist_do='replace', **kwargs):
+    def save(self, data_df, table_name, if_exist_do='replace', bulk=True, batch_size=None,
+             use_staging_table=False, **kwargs):
         """
         Save dataframe to database table.
 
@@ -73,21 +87,51 @@ class DatabaseConnector:
             data_df ([dataframe]): [dataframe to be saved out to database]
             table_name ([str]): [name of database table]
             if_exist_do ([str]): [{'replace', 'append', 'fail'}. Defaults to 'replace']
+            bulk ([bool]): [use the dialect-aware bulk writer instead of row-by-row inserts. Defaults to True]
+            batch_size ([int]): [number of rows written per batch. Defaults to DEFAULT_BATCH_SIZE]
+            use_staging_table ([bool]): [for 'replace', write into a staging table first and swap it with the target
+                                         table in a single transaction, so readers never see a partial table.
+                                         Defaults to False]
             **kwargs ([dict]): [dictionary of extra arguments]
+        Returns:
+            save_stats ([dict]): [rows written, elapsed seconds and rows/sec]
         """
         try:
 
             # Establishing connection
             self._logger.debug("[DatabaseConnector] Establishing connection...")
-            engine_conn = self._create_engine()
+            engine_conn = self._create_engine(bulk=bulk)
             self._logger.debug("[DatabaseConnector] SQL connection established...")
 
             # Saving data
-            self._logger.info(f"[DatabaseConnector] Saving data_df to SQL {table_name}...")
-            data_df.to_sql(name=table_name, con=engine_conn, if_exists=if_exist_do, index=False, **kwargs)
+            use_staging_table = use_staging_table and if_exist_do == 'replace'
+            target_table_name = table_name + self.STAGING_TABLE_SUFFIX if use_staging_table else table_name
+            kwargs.setdefault('schema', self.schema_name)  # As read by `load()`
+            if bulk:
+                kwargs.setdefault('method', self._bulk_insert_method())
+                kwargs.setdefault('chunksize', self._bulk_batch_size(data_df, batch_size))
+            elif batch_size is not None:
+                kwargs.setdefault('chunksize', batch_size)
+
+            self._logger.info(f"[DatabaseConnector] Saving data_df to SQL {target_table_name}...")
+            start_time = time.perf_counter()
+            data_df.to_sql(name=target_table_name, con=engine_conn,
+                           if_exists='replace' if use_staging_table else if_exist_do, index=False, **kwargs)
+            if use_staging_table:
+                self._swap_staging_table(engine_conn, target_table_name, table_name)
+            elapsed_time = time.perf_counter() - start_time
             self._logger.info(f"[DatabaseConnector] data_df saved to SQL {table_name} successfully.")
 
-            self._logger.info("Dataframe saved out to database successfully. ")
+            save_stats = {
+                'rows': len(data_df),
+                'seconds': elapsed_time,
+                'rows_per_sec': len(data_df) / elapsed_time if elapsed_time > 0 else float('inf'),
+            }
+            self._logger.info(
+                f"Dataframe saved out to database successfully. | rows: {save_stats['rows']} | "
+                f"time: {save_stats['seconds']:.2f}s | rows/sec: {save_stats['rows_per_sec']:,.0f}"
+            )
+            return save_stats
 
         except Exception as error:
             self._logger.exception(f"[DatabaseConnector] SQL Query Failed. Error: {error}")
@@ -95,19 +139,107 @@ class DatabaseConnector:
         finally:
             engine_conn.dispose()
             self._logger.debug("[DatabaseConnector] SQL connection disposed.")
-    
-    def _create_engine(self):
+
+    def _bulk_insert_method(self):
+        """
+        Insertion method passed to `DataFrame.to_sql` for the current database type.
+        """
+        if self.db_type == 'postgresql':
+            return self._postgresql_copy_from_stdin
+        if self.db_type == 'mssql':
+            return None  # Plain executemany, made fast by `fast_executemany` on the pyodbc engine
+        return 'multi'  # Multi-row VALUES batches for mysql/sqlite
+
+    def _bulk_batch_size(self, data_df, batch_size=None):
+        """
+        Number of rows per batch, capped for SQLite's bound parameter limit on multi-row inserts.
+        """
+        batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        if self.db_type == 'sqlite':
+            batch_size = min(batch_size, max(1, self.SQLITE_MAX_VARIABLES // max(1, len(data_df.columns))))
+        return batch_size
+
+    @staticmethod
+    def _postgresql_copy_from_stdin(table, conn, keys, data_iter):
+        """
+        `DataFrame.to_sql` insertion method streaming each batch through PostgreSQL's COPY FROM STDIN.
+
+        Args:
+            table ([pandas.io.sql.SQLTable]): [target table]
+            conn ([sqlalchemy.engine.Connection]): [connection in the current transaction]
+            keys ([list]): [column names]
+            data_iter ([iterable]): [rows of the batch]
+        """
+        csv_buffer = StringIO()
+        csv.writer(csv_buffer).writerows(data_iter)
+        csv_buffer.seek(0)
+
+        columns = ', '.join('"{}"'.format(k) for k in keys)
+        table_name = '"{}"."{}"'.format(table.schema, table.name) if table.schema else '"{}"'.format(table.name)
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH CSV", csv_buffer)
+
+    def _swap_staging_table(self, engine_conn, staging_table_name, table_name):
+        """
+        Atomically replace `table_name` with the fully written staging table.
+
+        Args:
+            engine_conn ([sqlalchemy.engine.Engine]): [database engine]
+            staging_table_name ([str]): [name of the staging table]
+            table_name ([str]): [name of the target table]
+        """
+        from sqlalchemy import inspect, text
+        self._logger.debug("[DatabaseConnector] Swapping %s into %s...", staging_table_name, table_name)
+        target_table = self._quoted_table_name(table_name)
+        staging_table = self._quoted_table_name(staging_table_name)
+        with engine_conn.begin() as conn:
+            table_exists = inspect(conn).has_table(table_name, schema=self.schema_name)
+            if self.db_type == 'mysql':
+                # MySQL DDL is not transactional, but a multi-table RENAME is atomic
+                if table_exists:
+                    old_table = self._quoted_table_name(table_name + '__old')
+                    conn.execute(text(f"RENAME TABLE {target_table} TO {old_table}, "
+                                      f"{staging_table} TO {target_table}"))
+                    conn.execute(text(f"DROP TABLE {old_table}"))
+                else:
+                    conn.execute(text(f"RENAME TABLE {staging_table} TO {target_table}"))
+            elif self.db_type == 'mssql':
+                if table_exists:
+                    conn.execute(text(f"DROP TABLE {target_table}"))
+                # The new name is not qualified, the table stays in its schema
+                conn.execute(text(f"EXEC sp_rename '{staging_table}', '{table_name}'"))
+            else:
+                if table_exists:
+                    conn.execute(text(f"DROP TABLE {target_table}"))
+                conn.execute(text(f'ALTER TABLE {staging_table} RENAME TO "{table_name}"'))
+        self._logger.debug("[DatabaseConnector] %s swapped into %s.", staging_table_name, table_name)
+
+    def _quoted_table_name(self, table_name):
+        """
+        Table name quoted for the current database type, qualified with the schema if any.
+        """
+        quote = {'mysql': '`{}`', 'mssql': '[{}]'}.get(self.db_type, '"{}"')
+        names = [table_name] if self.schema_name is None else [self.schema_name, table_name]
+        return '.'.join(quote.format(name) for name in names)
+
+    def _create_engine(self, bulk=False):
+        # Importing sqlalchemy on first connection, so that importing src.data_connectors stays light
+        from sqlalchemy import create_engine
         sql_connectors = {
             'postgresql': 'postgresql',
             'mysql': 'mysql+pymysql',
-            'mssql': 'mssql+pyodbc'
+            'mssql': 'mssql+pyodbc',
+            'sqlite': 'sqlite',
         }
         sql_connector = sql_connectors[self.db_type]
         if self.db_type == 'mssql':
             engine_conn = create_engine(
                 f"{sql_connector}://{self.username}:{self.password}@{self.host}:{self.port}/{self.database}"
-                f"?driver=SQL+Server"
+                f"?driver=SQL+Server",
+                fast_executemany=bulk
             )
+        elif self.db_type == 'sqlite':
+            engine_conn = create_engine(f"{sql_connector}:///{self.database}")
         else:
             engine_conn = create_engine(
                 f"{sql_connector}://{self.username}:{self.password}@{self.host}:{self.port}/{self.database}"
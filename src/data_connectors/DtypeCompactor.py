@@ -0,0 +1,107 @@
+"""
+DtypeCompactor script includes dtype compaction of loaded dataframes to reduce memory usage, and a registry of
+reusable per-table schemas.
+
+Compaction is lossless: integers are downcast to the smallest integer type holding all values, floats are downcast
+to float32 only when every value round-trips exactly, and low-cardinality string columns become categoricals (or
+Arrow-backed strings, where the installed pandas supports them).
+"""
+
+import numpy as np
+import pandas as pd
+from conf import Config, Logger
+
+
+class SchemaRegistry:
+    """
+    Registry of named schemas ({column: dtype}) applied on top of automatic compaction.
+    """
+
+    _schemas = {}
+
+    @classmethod
+    def register(cls, name, dtypes):
+        """
+        Register a schema.
+
+        Args:
+            name ([str]): [schema name]
+            dtypes ([dict]): [{column: dtype}, e.g. {'District': 'category', 'id': 'int32'}]
+        """
+        cls._schemas[name] = dict(dtypes)
+
+    @classmethod
+    def get(cls, name):
+        """
+        Return a registered schema.
+
+        Args:
+            name ([str]): [schema name]
+        """
+        assert name in cls._schemas, f"Schema ({name}) not registered. Registered schemas: {list(cls._schemas)}"
+        return cls._schemas[name]
+
+
+class DtypeCompactor:
+
+    _logger = Logger().logger
+
+    @classmethod
+    def compact(cls, data_df, schema=None, categorical_max_unique_ratio=None, string_dtype=None):
+        """
+        Compact dataframe dtypes and log memory usage before and after.
+
+        Args:
+            data_df ([dataframe]): [dataframe to compact]
+            schema ([str, dict]): [registered schema name or {column: dtype}, applied before automatic compaction.
+                                   Defaults to None]
+            categorical_max_unique_ratio ([float]): [string columns with at most this ratio of unique values to rows
+                                                     become categoricals. Defaults to Config setting]
+            string_dtype ([str]): [dtype for the remaining string columns, e.g. 'string[pyarrow]'. Defaults to Config
+                                   setting, None keeps them as objects]
+        Returns:
+            data_df ([dataframe]): [compacted dataframe]
+        """
+        categorical_max_unique_ratio = categorical_max_unique_ratio or \
+            Config.DATA_LOADING['CATEGORICAL_MAX_UNIQUE_RATIO']
+        string_dtype = string_dtype or Config.DATA_LOADING['STRING_DTYPE']
+        schema = SchemaRegistry.get(schema) if isinstance(schema, str) else (schema or {})
+
+        memory_before = data_df.memory_usage(deep=True).sum()
+        data_df = data_df.copy()
+        for column in data_df.columns:
+            if column in schema:
+                data_df[column] = data_df[column].astype(schema[column])
+            else:
+                data_df[column] = cls._compact_series(data_df[column], categorical_max_unique_ratio, string_dtype)
+        memory_after = data_df.memory_usage(deep=True).sum()
+
+        cls._logger.info(
+            f"[DtypeCompactor] Memory usage before: {memory_before / 1024:,.1f} KB | "
+            f"after: {memory_after / 1024:,.1f} KB | saved: {1 - memory_after / max(memory_before, 1):.0%}"
+        )
+        return data_df
+
+    @staticmethod
+    def _compact_series(series, categorical_max_unique_ratio, string_dtype=None):
+        if pd.api.types.is_bool_dtype(series):
+            return series
+        if pd.api.types.is_integer_dtype(series):
+            return pd.to_numeric(series, downcast='integer')
+        if pd.api.types.is_float_dtype(series):
+            downcast_series = series.astype(np.float32)
+            if np.array_equal(downcast_series.astype(series.dtype).values, series.values, equal_nan=True):
+                return downcast_series
+            return series
+        if pd.api.types.is_object_dtype(series) and len(series) > 0:
+            non_null_series = series.dropna()
+            if not non_null_series.map(lambda x: isinstance(x, str)).all():
+                return series
+            if series.nunique() / len(series) <= categorical_max_unique_ratio:
+                return series.astype('category')
+            if string_dtype is not None:
+                try:
+                    return series.astype(string_dtype)
+                except (TypeError, ImportError):
+                    return series
+        return series
@@ -1,26 +1,166 @@
 """
 PandasFileConnector script includes loading and writing to file formats for csv, excel, feather, json, txt,
 pickle, parquet.
+
+Column projection (`columns=`) and row filters (`filters=`) are pushed down natively for parquet/feather through
+Arrow datasets (including partitioned directories), mapped to `usecols` for csv/excel/txt, and applied after loading
+for the remaining formats. Filters follow the pyarrow convention: a list of (column, op, value) tuples combined with
+AND, or a list of such lists combined with OR. Supported ops: '=', '==', '!=', '<', '<=', '>', '>=', 'in', 'not in'.
 """
 
+import os
 import json
+import time
+import operator
+import multiprocessing
 import pandas as pd
 from pathlib import Path
-from conf import Logger
+from contextlib import ExitStack
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from conf import Config, Logger
+from src.data_connectors.DtypeCompactor import DtypeCompactor, SchemaRegistry
+
+FILTER_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda series, value: series.isin(value),
+    'not in': lambda series, value: ~series.isin(value),
+}
+
+
+def _normalise_filters(filters):
+    """
+    Return filters in disjunctive normal form: a list of conjunctions, each a list of (column, op, value) tuples.
+    """
+    if not filters:
+        return []
+    if isinstance(filters[0], tuple):
+        return [list(filters)]
+    return [list(conjunction) for conjunction in filters]
+
+
+def _filter_columns(filters):
+    """
+    Columns referenced by the filters, in order of appearance.
+    """
+    filter_columns = []
+    for conjunction in _normalise_filters(filters):
+        for column, _, _ in conjunction:
+            if column not in filter_columns:
+                filter_columns.append(column)
+    return filter_columns
+
+
+def _usecols(columns, filters):
+    """
+    Columns to read so that both the requested columns and the filter columns are available.
+    """
+    if columns is None:
+        return None
+    return list(columns) + [c for c in _filter_columns(filters) if c not in columns]
+
+
+def _apply_filters(data_df, filters):
+    """
+    Apply filters to an already loaded dataframe.
+    """
+    disjunctions = _normalise_filters(filters)
+    if not disjunctions:
+        return data_df
+    mask = pd.Series(False, index=data_df.index)
+    for conjunction in disjunctions:
+        conjunction_mask = pd.Series(True, index=data_df.index)
+        for column, op, value in conjunction:
+            conjunction_mask &= FILTER_OPERATORS[op](data_df[column], value)
+        mask |= conjunction_mask
+    return data_df.loc[mask].reset_index(drop=True)
+
+
+def _project_and_filter(data_df, columns=None, filters=None):
+    """
+    Post-load filtering and column selection for formats where pushdown is not possible.
+    """
+    if not isinstance(data_df, pd.DataFrame):
+        return data_df
+    data_df = _apply_filters(data_df, filters)
+    if columns is not None:
+        data_df = data_df[list(columns)]
+    return data_df
+
+
+def _filters_to_expression(filters):
+    """
+    Convert filters to a pyarrow.dataset expression for pushdown into Arrow datasets.
+    """
+    import pyarrow.dataset as ds
+
+    expression = None
+    for conjunction in _normalise_filters(filters):
+        conjunction_expression = None
+        for column, op, value in conjunction:
+            field = ds.field(column)
+            if op == 'in':
+                term = field.isin(list(value))
+            elif op == 'not in':
+                term = ~field.isin(list(value))
+            else:
+                term = FILTER_OPERATORS[op](field, value)
+            conjunction_expression = term if conjunction_expression is None else conjunction_expression & term
+        expression = conjunction_expression if expression is None else expression | conjunction_expression
+    return expression
+
+
+def _timed_load(file_type, filepath, kwargs):
+    """
+    Load a single file and time it. Defined at module level so that it can be sent to a process pool.
+    """
+    start_time = time.perf_counter()
+    compact, schema = kwargs.pop('compact', False), kwargs.pop('schema', None)
+    data_df = PandasFileConnector._get_connector(file_type).load(filepath=filepath, **kwargs)
+    if compact and isinstance(data_df, pd.DataFrame):
+        data_df = DtypeCompactor.compact(data_df, schema=schema)
+    return data_df, time.perf_counter() - start_time
+
+
+class LoadManyResult(dict):
+    """
+    Dictionary of dataframes returned by PandasFileConnector.load_many, with per-file load time (seconds) in
+    `timings` and the exceptions of files that failed to load in `errors`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.timings = {}
+        self.errors = {}
 
 
 class PandasFileConnector:
 
     _logger = Logger().logger
 
+    # Parsers of these formats hold the GIL, so load_many() loads the large ones (Config.DATA_LOADING
+    # ['PROCESS_POOL_MIN_BYTES']) in separate processes and the others in the calling thread, threads would not
+    # overlap them. Parquet/feather/pickle are read by Arrow or C code that releases the GIL and use threads instead.
+    PROCESS_POOL_FILE_TYPES = ['.csv', '.xlsx', '.txt', '.json']
+
     @classmethod
-    def load(cls, filepath, file_type=None, **kwargs):
+    def load(cls, filepath, file_type=None, columns=None, filters=None, compact=False, schema=None, **kwargs):
         """
         Different load methods for respective file format type.
 
         Args:
             filepath ([str]): [filepath]
             file_type ([str]): [type of files: {'.csv', '.xlsx', '.json', '.txt', '.pkl', '.yaml', '.parquet'}]
+            columns ([list]): [columns to load. Defaults to None, i.e. all columns]
+            filters ([list]): [row filters as (column, op, value) tuples, see module docstring. Defaults to None]
+            compact ([bool]): [compact dtypes to reduce memory usage, see DtypeCompactor. None follows
+                               Config.DATA_LOADING['COMPACT_DTYPES'] at call time. Defaults to False]
+            schema ([str, dict]): [registered schema name or {column: dtype} applied when compacting. Defaults to None]
             **kwargs ([dict]): [dictionary of extra arguments]
 
         Returns:
@@ -28,17 +168,112 @@ class PandasFileConnector:
         """
 
         try:
-            cls._logger.debug(f"[PandasFileConnector] Data loading ({filepath}) initiated...")
+            cls._logger.debug("[PandasFileConnector] Data loading (%s) initiated...", filepath)
             file_type = file_type or cls._check_filetype(filepath)
             file_type = file_type if file_type.startswith('.') else '.' + file_type
             pd_connector = cls._get_connector(file_type)
-            data_df = pd_connector.load(filepath=filepath, **kwargs)
-            cls._logger.info(f"[PandasFileConnector] Data loaded ({filepath}) successfully.")
+            data_df = pd_connector.load(filepath=filepath, columns=columns, filters=filters, **kwargs)
+            compact = Config.DATA_LOADING['COMPACT_DTYPES'] if compact is None else compact
+            if compact and isinstance(data_df, pd.DataFrame):
+                data_df = DtypeCompactor.compact(data_df, schema=schema)
+            cls._logger.info("[PandasFileConnector] Data loaded (%s) successfully.", filepath)
             return data_df
 
         except Exception as error:
             cls._logger.exception(f"[PandasFileConnector] load error: {error}")
 
+    @classmethod
+    def load_many(cls, file_specs, max_workers=None, use_processes=None):
+        """
+        Load several files concurrently, so that the total load time approaches that of the slowest file.
+
+        Args:
+            file_specs ([dict]): [{name: filepath} or {name: dict(filepath=..., file_type=..., **load_kwargs)}, where
+                                  load_kwargs may include compact/schema (see load), resolved here and applied inside
+                                  the worker]
+            max_workers ([int]): [maximum number of threads/processes per pool. Defaults to number of files, capped
+                                  at the number of cores]
+            use_processes ([bool]): [force all files onto a process pool (True) or a thread pool (False).
+                                     Defaults to None, i.e. chosen by file format and size, see
+                                     PROCESS_POOL_FILE_TYPES]
+        Returns:
+            data_dfs ([LoadManyResult]): [dictionary of loaded dataframes, with `timings` and `errors`]
+        """
+        data_dfs = LoadManyResult()
+        max_workers = max_workers or max(1, min(len(file_specs), os.cpu_count() or 1))
+
+        # Assigning each file to a thread or a process pool, or to the calling thread
+        jobs = {'thread': {}, 'process': {}, 'inline': {}}
+        for name, file_spec in file_specs.items():
+            load_kwargs = dict(file_spec) if isinstance(file_spec, dict) else {'filepath': file_spec}
+            filepath = load_kwargs.pop('filepath')
+            file_type = load_kwargs.pop('file_type', None) or cls._check_filetype(filepath)
+            file_type = file_type if file_type.startswith('.') else '.' + file_type
+            # Resolved in this process, spawned workers neither see runtime Config changes nor registered schemas
+            if load_kwargs.get('compact', False) is None:
+                load_kwargs['compact'] = Config.DATA_LOADING['COMPACT_DTYPES']
+            if isinstance(load_kwargs.get('schema'), str):
+                load_kwargs['schema'] = SchemaRegistry.get(load_kwargs['schema'])
+            if use_processes is None:
+                jobs[cls._load_on(file_type, filepath)][name] = (file_type, filepath, load_kwargs)
+            else:
+                jobs['process' if use_processes else 'thread'][name] = (file_type, filepath, load_kwargs)
+        thread_jobs, process_jobs, inline_jobs = jobs['thread'], jobs['process'], jobs['inline']
+
+        cls._logger.debug("[PandasFileConnector] Loading %s files concurrently (%s on threads, %s on processes, %s "
+                          "in the calling thread)...", len(file_specs), len(thread_jobs), len(process_jobs),
+                          len(inline_jobs))
+        start_time = time.perf_counter()
+        with ExitStack() as stack:
+            futures = {}
+            mp_context = multiprocessing.get_context(Config.DATA_LOADING['MP_CONTEXT'])
+            pools = [(thread_jobs, ThreadPoolExecutor, {}),
+                     (process_jobs, ProcessPoolExecutor, {'mp_context': mp_context})]
+            for pool_jobs, executor_class, executor_kwargs in pools:
+                if not pool_jobs:
+                    continue
+                executor = stack.enter_context(executor_class(max_workers=min(max_workers, len(pool_jobs)),
+                                                              **executor_kwargs))
+                for name, (file_type, filepath, load_kwargs) in pool_jobs.items():
+                    futures[name] = (filepath, executor.submit(_timed_load, file_type, filepath, load_kwargs))
+
+            # Loaded while the pools run
+            for name, (file_type, filepath, load_kwargs) in inline_jobs.items():
+                future = Future()
+                try:
+                    future.set_result(_timed_load(file_type, filepath, load_kwargs))
+                except Exception as error:
+                    future.set_exception(error)
+                futures[name] = (filepath, future)
+
+            for name, (filepath, future) in futures.items():
+                try:
+                    data_dfs[name], data_dfs.timings[name] = future.result()
+                    cls._logger.debug("[PandasFileConnector] Data loaded (%s) in %.3fs.", filepath,
+                                      data_dfs.timings[name])
+                except Exception as error:
+                    data_dfs.errors[name] = error
+                    cls._logger.exception(f"[PandasFileConnector] load error ({filepath}): {error}")
+
+        cls._logger.info(f"[PandasFileConnector] {len(data_dfs)}/{len(file_specs)} files loaded in "
+                         f"{time.perf_counter() - start_time:.3f}s (sum of per-file times: "
+                         f"{sum(data_dfs.timings.values()):.3f}s).")
+        return data_dfs
+
+    @classmethod
+    def _load_on(cls, file_type, filepath):
+        """
+        Where load_many() loads a file: 'thread' for formats releasing the GIL, otherwise 'process' when the file is
+        large enough to make up for starting a worker process, and 'inline' (the calling thread) when it is not.
+        """
+        if file_type not in cls.PROCESS_POOL_FILE_TYPES:
+            return 'thread'
+        try:
+            large = os.path.getsize(filepath) >= Config.DATA_LOADING['PROCESS_POOL_MIN_BYTES']
+        except (OSError, TypeError):
+            large = False  # e.g. a buffer or directory
+        return 'process' if large else 'inline'
+
     @classmethod
     def save(cls, data_df, filepath, file_type=None, **kwargs):
         """
@@ -52,11 +287,11 @@ class PandasFileConnector:
         """
 
         try:
-            cls._logger.debug(f"[PandasFileConnector] Data saving ({filepath}) initiated...")
+            cls._logger.debug("[PandasFileConnector] Data saving (%s) initiated...", filepath)
             file_type = file_type or cls._check_filetype(filepath)
             pd_connector = cls._get_connector(file_type)
             pd_connector.save(data_df, filepath, **kwargs)
-            cls._logger.info(f"[PandasFileConnector] Data saved ({filepath}) successfully.")
+            cls._logger.info("[PandasFileConnector] Data saved (%s) successfully.", filepath)
 
         except Exception as error:
             cls._logger.exception(f"[PandasFileConnector] save error: {error}")
@@ -78,7 +313,7 @@ class PandasFileConnector:
     @classmethod
     def _check_filetype(cls, filepath):
         file_extension = Path(filepath).suffix
-        cls._logger.debug(f"[_check_filetype] File extension detected as {file_extension}")
+        cls._logger.debug("[_check_filetype] File extension detected as %s", file_extension)
         file_connectors = cls._connector_list()
         assert file_extension in file_connectors.keys(), \
             f"File extension ({file_extension}) not recognised. Only accept .csv, .xlsx, .txt, .json, " \
@@ -97,18 +332,22 @@ class PandasFileConnector:
 class CSVFileConnector:
 
     @classmethod
-    def load(cls, filepath, **kwargs):
+    def load(cls, filepath, columns=None, filters=None, **kwargs):
         """
         Load csv file as dataframe.
 
         Args:
             filepath ([str]): [filepath]
+            columns ([list]): [columns to load, read through `usecols`]
+            filters ([list]): [row filters, applied after loading]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
+        if columns is not None:
+            kwargs.setdefault('usecols', _usecols(columns, filters))
         data_df = pd.read_csv(filepath, **kwargs)
-        return data_df
+        return _project_and_filter(data_df, columns, filters)
 
     @classmethod
     def save(cls, data_df, filepath, **kwargs):
@@ -126,18 +365,22 @@ class CSVFileConnector:
 class ExcelFileConnector:
 
     @classmethod
-    def load(cls, filepath, **kwargs):
+    def load(cls, filepath, columns=None, filters=None, **kwargs):
         """
         Load xlsx excel file as dataframe.
 
         Args:
             filepath ([str]): [filepath]
+            columns ([list]): [columns to load, read through `usecols`]
+            filters ([list]): [row filters, applied after loading]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
+        if columns is not None:
+            kwargs.setdefault('usecols', _usecols(columns, filters))
         data_df = pd.read_excel(filepath, **kwargs)
-        return data_df
+        return _project_and_filter(data_df, columns, filters)
 
     @classmethod
     def save(cls, data_df, filepath, **kwargs):
@@ -155,18 +398,26 @@ class ExcelFileConnector:
 class FeatherFileConnector:
 
     @classmethod
-    def load(cls, filepath, **kwargs):
+    def load(cls, filepath, columns=None, filters=None, **kwargs):
         """
         Read a feather file as a dataframe.
 
         Args:
-            filepath ([str]): [filepath]
+            filepath ([str]): [filepath, or a directory of feather files read as one Arrow dataset]
+            columns ([list]): [columns to load]
+            filters ([list]): [row filters, pushed down into the Arrow dataset scan]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
-        data_df = pd.read_feather(filepath, **kwargs)
-        return data_df
+        # pd.read_feather() reads single files only
+        if not hasattr(filepath, 'read') and (filters or os.path.isdir(filepath)):
+            import pyarrow.dataset as ds
+            dataset = ds.dataset(str(filepath), format='feather', **kwargs)
+            expression = _filters_to_expression(filters) if filters else None
+            return dataset.to_table(columns=columns, filter=expression).to_pandas()
+        data_df = pd.read_feather(filepath, columns=_usecols(columns, filters), **kwargs)
+        return _project_and_filter(data_df, columns, filters)
 
     @classmethod
     def save(cls, data_df, filepath, **kwargs):
@@ -184,19 +435,23 @@ class FeatherFileConnector:
 class JSONFileConnector:
 
     @classmethod
-    def load(cls, filepath, **kwargs):
+    def load(cls, filepath, columns=None, filters=None, **kwargs):
         """
         Load json excel file as dataframe.
 
         Args:
             filepath ([str]): [filepath]
+            columns ([list]): [columns to keep, only applied if the loaded data is a dataframe]
+            filters ([list]): [row filters, only applied if the loaded data is a dataframe]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
+        if hasattr(filepath, 'read'):
+            return _project_and_filter(json.load(filepath, **kwargs), columns, filters)
         with open(filepath, mode='r') as fs_file:
             data_df = json.load(fs_file, **kwargs)
-            return data_df
+            return _project_and_filter(data_df, columns, filters)
 
     @classmethod
     def save(cls, data_df, filepath, orient='records', **kwargs):
@@ -220,20 +475,26 @@ class JSONFileConnector:
 class TxtFileConnector:
 
     @classmethod
-    def load(cls, filepath, sep=' ', **kwargs):
+    def load(cls, filepath, sep=' ', columns=None, filters=None, **kwargs):
         """
         Read a text file as a dataframe.
 
         Args:
             filepath ([str]): [filepath]
             sep ([str]): [text file column seperator]
+            columns ([list]): [columns to load, read through `usecols`]
+            filters ([list]): [row filters, applied after loading]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
+        if columns is not None:
+            kwargs.setdefault('usecols', _usecols(columns, filters))
+        if hasattr(filepath, 'read'):
+            return _project_and_filter(pd.read_csv(filepath, sep=sep, **kwargs), columns, filters)
         with open(filepath, mode='r') as fs_file:
             data_df = pd.read_csv(fs_file, sep=sep, **kwargs)
-            return data_df
+            return _project_and_filter(data_df, columns, filters)
 
     @classmethod
     def save(cls, data_df, filepath, sep=' ', **kwargs):
@@ -252,19 +513,23 @@ class TxtFileConnector:
 class PickleFileConnector:
 
     @classmethod
-    def load(cls, filepath, **kwargs):
+    def load(cls, filepath, columns=None, filters=None, **kwargs):
         """
         Read a pickle file as a dataframe.
 
         Args:
             filepath ([str]): [filepath]
+            columns ([list]): [columns to keep, applied after loading]
+            filters ([list]): [row filters, applied after loading]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
+        if hasattr(filepath, 'read'):
+            return _project_and_filter(pd.read_pickle(filepath, **kwargs), columns, filters)
         with open(filepath, 'rb') as file:
             data_df = pd.read_pickle(file, **kwargs)
-            return data_df
+            return _project_and_filter(data_df, columns, filters)
 
     @classmethod
     def save(cls, data_df, filepath, **kwargs):
@@ -282,17 +547,21 @@ class PickleFileConnector:
 class ParquetFileConnector:
 
     @classmethod
-    def load(cls, filepath, **kwargs):
+    def load(cls, filepath, columns=None, filters=None, **kwargs):
         """
         Read a parquet file as a dataframe.
 
         Args:
-            filepath ([str]): [filepath]
+            filepath ([str]): [filepath, or a (partitioned) directory of parquet files]
+            columns ([list]): [columns to load]
+            filters ([list]): [row filters, pushed down to row groups/partitions by the pyarrow engine]
             **kwargs ([dict]): [dictionary of extra arguments]
         Returns:
             data_df ([dataframe]): [loaded dataframe]
         """
-        return pd.read_parquet(filepath, **kwargs)
+        if filters:
+            kwargs['filters'] = filters
+        return pd.read_parquet(filepath, columns=columns, **kwargs)
 
     @classmethod
     def save(cls, data_df, filepath, **kwargs):
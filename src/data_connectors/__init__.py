@@ -10,6 +10,9 @@ from src.data_connectors.PandasFileConnector import (
 from src.data_connectors.YAMLFileConnector import (
     YAMLFileConnector
 )
+from src.data_connectors.DtypeCompactor import (
+    DtypeCompactor, SchemaRegistry
+)
 
 pd.set_option("max.columns", 20)
 pd.set_option("display.width", 2000)
@@ -1,5 +1,4 @@
 import pandas as pd
-import geopy.distance
 from conf import Config
 from pathlib import Path
 from src.data_connectors import PandasFileConnector
@@ -15,9 +14,22 @@ class DataPreprocessor:
         "model_input": Config.FILES["MODEL_INPUT_DATA"]
     }
 
+    STATION_LIST_DTYPES = {'Region': 'category', 'TA': 'category', 'Segment': 'category', 'Sub Segment': 'category',
+                           'District': 'category', 'State': 'category'}
+
+    # compact=None follows Config.DATA_LOADING['COMPACT_DTYPES'] at load time
+    RAW_INPUT_FILES = {
+        "station_sales": dict(filepath=Path(Config.FILES["RAW_DATA"], "dmr_final_forecast_central.csv"),
+                              columns=['id', 'product', 'region', 'sales']),
+        "station_list": dict(filepath=Path(Config.FILES["RAW_DATA"], "STATION LIST_GPS_DS.xlsx"), skiprows=3,
+                             compact=None, schema=STATION_LIST_DTYPES),
+        "district_coords": dict(filepath=Path(Config.FILES["RAW_DATA"], "Klang Valley Districts.xlsx")),
+    }
+
     @classmethod
-    def get_station_sales(cls):
-        data_df = PandasFileConnector.load(Path(cls.EXPORT_DIR['raw'], "dmr_final_forecast_central.csv"))
+    def get_station_sales(cls, data_df=None):
+        if data_df is None:
+            data_df = PandasFileConnector.load(**cls.RAW_INPUT_FILES['station_sales'])
         data_df['sales'] = pd.to_numeric(data_df['sales'], errors='coerce')
         data_df = data_df.groupby(['id', 'product', 'region'])['sales'].mean().reset_index(drop=False)
         data_df = data_df.pivot(index=['region', 'id'], columns='product', values='sales').reset_index(drop=False)
@@ -27,28 +39,35 @@ class DataPreprocessor:
         return data_df
 
     @classmethod
-    def get_station_list(cls):
-        data_df = PandasFileConnector.load(Path(cls.EXPORT_DIR['raw'], "STATION LIST_GPS_DS.xlsx"), skiprows=3)
+    def get_station_list(cls, data_df=None):
+        if data_df is None:
+            data_df = PandasFileConnector.load(**cls.RAW_INPUT_FILES['station_list'])
         data_df = data_df.drop("Unnamed: 0", axis=1)
         return data_df
 
     @classmethod
-    def get_district_coords(cls):
-        data_df = PandasFileConnector.load(Path(cls.EXPORT_DIR['raw'], "Klang Valley Districts.xlsx"))
+    def get_district_coords(cls, data_df=None):
+        if data_df is None:
+            data_df = PandasFileConnector.load(**cls.RAW_INPUT_FILES['district_coords'])
         data_df['Latitude'] = data_df['Latitude'].str.replace("° N", "").astype(float)
         data_df['Longitude'] = data_df['Longitude'].str.replace("° E", "").astype(float)
         return data_df
 
     @classmethod
     def merge_data(cls):
-        
+
+        Config.make_dirs()
+
+        # Loading all raw files concurrently
+        raw_dfs = PandasFileConnector.load_many(cls.RAW_INPUT_FILES)
+
         # Merging station list and sales
-        station_list_df = cls.get_station_list()
-        station_sales_df = cls.get_station_sales()
+        station_list_df = cls.get_station_list(raw_dfs.get('station_list'))
+        station_sales_df = cls.get_station_sales(raw_dfs.get('station_sales'))
         station_merged_df = station_list_df.merge(station_sales_df, how='inner', left_on="Fuel Acc", right_on="id")
 
         # Associating each station to the closest district
-        districts_df = cls.get_district_coords()
+        districts_df = cls.get_district_coords(raw_dfs.get('district_coords'))
 
         # Assigning closest district
         station_merged_df['Assigned Township'] = station_merged_df.apply(
@@ -87,6 +106,7 @@ class DataPreprocessor:
 
     @staticmethod
     def calc_distance(coords_1, coords_2):
+        import geopy.distance
         return geopy.distance.distance(coords_1, coords_2)
         
 
@@ -0,0 +1,273 @@
+"""
+Spatial aggregation of townships (demand points) into representative demand nodes.
+
+With thousands of demand points (e.g. stations) the model's warehouse x township variables and constraints explode.
+Aggregation clusters the points with demand-weighted k-means on their location into `n_nodes` nodes, located at the
+demand-weighted centroid of their points and with their total demand, and the model is solved on the nodes. The
+solution is disaggregated back to the points by a transportation LP over the selected warehouses, serving each point
+the share of its node's demand that the node was served, from the nearest warehouses within their capacity.
+Despatchers are then required per warehouse-point pair, as in the per-arc formulation.
+
+`disaggregate()` reports the objective of the disaggregated solution, evaluated on the points, next to the
+aggregated model's objective, and how far the points are from their nodes. The disaggregated solution is feasible
+for the unaggregated model (apart from the delivery time constraint, which is only checked on the nodes), so for cost
+minimisation its objective bounds the unaggregated optimum from above. See src/benchmarks/aggregation_error.py to
+compare with the unaggregated objective.
+"""
+
+import math
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import pyomo.environ as pyo
+from collections import OrderedDict
+from conf import Config, Logger
+from src.optimisation_model.preprocessing import Preprocessing, Township
+from src.optimisation_model.solver import ModelSolver
+
+KM_PER_DEGREE = 111.2
+
+
+def kmeans_labels(township_list, n_clusters):
+    """
+    Demand-weighted k-means clustering of townships on their location.
+
+    Args:
+        township_list (list): Townships to cluster.
+        n_clusters (int): Number of clusters.
+
+    Returns:
+        list: Cluster label (0 to n_clusters - 1) of each township.
+    """
+    from sklearn.cluster import KMeans
+
+    # Clustering on (approximately) km, so that latitude and longitude distances weigh the same
+    latitudes = np.array([t.latitude for t in township_list], dtype=float)
+    longitudes = np.array([t.longitude for t in township_list], dtype=float)
+    locations = np.column_stack([
+        latitudes * KM_PER_DEGREE,
+        longitudes * KM_PER_DEGREE * math.cos(math.radians(latitudes.mean())),
+    ])
+    demands = np.array([t.demand for t in township_list], dtype=float)
+    kmeans = KMeans(n_clusters=n_clusters, n_init=Config.AGGREGATION['N_INIT'],
+                    random_state=Config.AGGREGATION['RANDOM_STATE'])
+    return kmeans.fit_predict(locations, sample_weight=np.maximum(demands, 1e-9)).tolist()
+
+
+class Aggregation:
+
+    _clusterings = OrderedDict()  # (data fingerprint, n_nodes) -> node label per point, least recently used first
+    _clusterings_lock = threading.Lock()
+
+    def __init__(self, processed_data: Preprocessing, n_nodes: int):
+        """
+        Initialisation
+
+        Args:
+            processed_data (Preprocessing): Input snapshot (or its Presolve reduction) to aggregate. It is only read,
+                never modified.
+            n_nodes (int): Number of demand nodes to aggregate the townships into.
+        """
+        self._logger = Logger().logger
+        self.original_data = processed_data
+        self.n_nodes = min(n_nodes, len(processed_data.township_list))
+
+        # Input data is kept as loaded, the demand nodes are listed in township_list
+        self.warehouse_df = processed_data.warehouse_df
+        self.township_df = processed_data.township_df
+        self.warehouse_list = processed_data.warehouse_list
+        self.node_of = {}  # Township -> demand node
+        self.point_assignment_data = None
+        self.point_despatchers_data = None
+        self.report = {}
+        self._distance_matrix = None
+        self._data_fingerprint = None
+
+        start_time = time.perf_counter()
+        self.township_list = self.__aggregate(processed_data.township_list)
+        self._logger.info(f"[Aggregation] {len(processed_data.township_list)} townships aggregated into "
+                          f"{len(self.township_list)} demand nodes in {time.perf_counter() - start_time:.2f}s.")
+
+    @property
+    def distance_matrix(self):
+        """Haversine distances (km) between every warehouse and demand node."""
+        if self._distance_matrix is None:
+            from haversine import haversine
+            self._distance_matrix = {
+                (w.name, node.name): haversine((w.latitude, w.longitude), (node.latitude, node.longitude))
+                for node in self.township_list
+                for w in self.warehouse_list
+            }
+        return self._distance_matrix
+
+    @property
+    def data_fingerprint(self):
+        """Hash of the original snapshot's fingerprint and the demand nodes' townships."""
+        if self._data_fingerprint is None:
+            self._data_fingerprint = hashlib.sha256(
+                f"{self.original_data.data_fingerprint}:{json.dumps(self.node_of, sort_keys=True)}".encode()
+            ).hexdigest()
+        return self._data_fingerprint
+
+    def __aggregate(self, township_list):
+        labels = self.__cluster_labels(township_list)
+        n_digits = len(str(self.n_nodes))
+        members = OrderedDict()
+        for label in sorted(set(labels)):
+            members[f"Node {label + 1:0{n_digits}d}"] = [t for t, t_label in zip(township_list, labels)
+                                                         if t_label == label]
+
+        nodes = []
+        for node_name, node_townships in members.items():
+            demands = np.array([t.demand for t in node_townships], dtype=float)
+            weights = demands if demands.sum() > 0 else np.ones(len(demands))
+            largest_township = node_townships[int(np.argmax(demands))]
+            nodes.append(Township(
+                name=node_name, district=largest_township.district,
+                latitude=float(np.average([t.latitude for t in node_townships], weights=weights)),
+                longitude=float(np.average([t.longitude for t in node_townships], weights=weights)),
+                demand=float(demands.sum()),
+            ))
+            self.node_of.update({t.name: node_name for t in node_townships})
+        return nodes
+
+    def __cluster_labels(self, township_list):
+        """Demand-weighted k-means labels of the townships, kept per input data and number of nodes."""
+        cache_key = (self.original_data.data_fingerprint, self.n_nodes)
+        with self._clusterings_lock:
+            if cache_key in self._clusterings:
+                self._clusterings.move_to_end(cache_key)
+                return self._clusterings[cache_key]
+
+        labels = kmeans_labels(township_list, self.n_nodes)
+
+        with self._clusterings_lock:
+            self._clusterings[cache_key] = labels
+            while len(self._clusterings) > Config.AGGREGATION['MAX_CACHED_CLUSTERINGS']:
+                self._clusterings.popitem(last=False)
+        return labels
+
+    def disaggregate(self, model_builder, cancel_token=None):
+        """
+        Disaggregate the solved model's supply from the demand nodes to the townships, and compare the objective of
+        the disaggregated solution with the aggregated model's.
+
+        Args:
+            model_builder (OptimisationModel): Solved model, built on this aggregation.
+            cancel_token (CancelToken, optional): See ModelSolver. Defaults to None.
+
+        Returns:
+            dict: Aggregation report: n_townships, n_nodes, aggregated_objective, disaggregated_objective,
+                objective_difference, relative_objective_difference, max_displacement_km and
+                mean_displacement_km (demand-weighted distance of the townships to their node) and
+                disaggregation_seconds.
+        """
+        start_time = time.perf_counter()
+        model = model_builder.model
+        warehouses = [w.name for w in self.warehouse_list]  # The model's may be fewer, e.g. after a decomposition
+        selected_warehouses = [w for w in model.W if (model.x[w].value or 0) > 0.5]
+        townships = self.original_data.township_list
+        original_distances = self.original_data.distance_matrix
+
+        # Serving each township the share of its node's demand the node was served
+        node_supply = {node: sum(model.x_assign[w, node].value or 0 for w in model.W) for node in model.T}
+        node_served_share = {node.name: min(1.0, node_supply[node.name] / node.demand) if node.demand > 0 else 0.0
+                             for node in self.township_list}
+        served = {t.name: t.demand * node_served_share[self.node_of[t.name]] for t in townships}
+
+        assignment = pd.DataFrame(0.0, index=[t.name for t in townships], columns=warehouses)
+        if selected_warehouses and sum(served.values()) > 0:
+            transportation_model = self.__transportation_model(selected_warehouses, townships, served)
+            ModelSolver(transportation_model, threads=1, cancel_token=cancel_token)
+            for (w, t), supply in transportation_model.y.items():
+                assignment.loc[t, w] = supply.value or 0.0
+        self.point_assignment_data = assignment
+
+        # Despatchers per warehouse-township pair, as in the per-arc formulation
+        distances = pd.DataFrame(
+            [[max(model_builder.MIN_DISTANCE_KM, original_distances[w, t.name]) for w in warehouses]
+             for t in townships],
+            index=assignment.index, columns=warehouses,
+        )
+        time_per_delivery = distances / pyo.value(model.delivery_speed) * 2
+        monthly_delivery_freq = 30 * pyo.value(model.working_hours_per_day) / time_per_delivery
+        required_despatchers = assignment / (pyo.value(model.despatch_volume_limit) * monthly_delivery_freq)
+        self.point_despatchers_data = np.ceil(required_despatchers - 1e-6).clip(lower=0)
+
+        aggregated_objective = pyo.value(model.obj)
+        disaggregated_objective = self.__objective(model_builder, assignment, time_per_delivery)
+        objective_difference = disaggregated_objective - aggregated_objective
+        nodes = {node.name: node for node in self.township_list}
+        displacements = pd.Series({t.name: self._distance(t, nodes[self.node_of[t.name]]) for t in townships})
+        demands = pd.Series({t.name: t.demand for t in townships})
+        self.report = {
+            'n_townships': len(townships),
+            'n_nodes': len(self.township_list),
+            'aggregated_objective': aggregated_objective,
+            'disaggregated_objective': disaggregated_objective,
+            'objective_difference': objective_difference,
+            'relative_objective_difference': abs(objective_difference) / max(1e-10, abs(disaggregated_objective)),
+            'max_displacement_km': float(displacements.max()),
+            'mean_displacement_km': float((displacements * demands).sum() / max(1e-10, demands.sum())),
+            'disaggregation_seconds': round(time.perf_counter() - start_time, 4),
+        }
+        self._logger.info(f"[Aggregation] Disaggregated: {self.report}")
+        return self.report
+
+    def __transportation_model(self, warehouses, townships, served):
+        """Supply the served demand of the townships from the warehouses at the least delivery distance."""
+        original_distances = self.original_data.distance_matrix
+        capacities = {w.name: w.capacity for w in self.warehouse_list}
+        model = pyo.ConcreteModel()
+        model.optimised = False
+        model.W = pyo.Set(initialize=warehouses)
+        model.T = pyo.Set(initialize=[t.name for t in townships])
+        model.y = pyo.Var(model.W, model.T, domain=pyo.NonNegativeReals)
+        model.obj = pyo.Objective(
+            expr=pyo.quicksum(original_distances[w, t] * model.y[w, t] for w in model.W for t in model.T),
+            sense=pyo.minimize,
+        )
+        model.capacity_constraint = pyo.Constraint(
+            model.W, rule=lambda m, w: pyo.quicksum(m.y[w, t] for t in m.T) <= capacities[w]
+        )
+        model.served_constraint = pyo.Constraint(
+            model.T, rule=lambda m, t: pyo.quicksum(m.y[w, t] for w in m.W) == served[t]
+        )
+        return model
+
+    def __objective(self, model_builder, assignment, time_per_delivery):
+        """Objective of the disaggregated solution, as the unaggregated model would evaluate it."""
+        model = model_builder.model
+        total_cost = sum(pyo.value(model.w_cost[w]) * round(model.x[w].value or 0) for w in model.W)
+        if model_builder.add_despatcher_hiring_cost:
+            total_cost += self.point_despatchers_data.values.sum() * pyo.value(model.despatch_hiring_cost)
+        if model_builder.add_delivery_cost:
+            n_delivery_trips = assignment / pyo.value(model.despatch_volume_limit)
+            total_cost += (n_delivery_trips * time_per_delivery).values.sum() * pyo.value(model.cost_of_delivery)
+        if model_builder.optimisation_scenario == 1:
+            return float(total_cost)
+        return float(assignment.values.sum() * pyo.value(model.profit_per_sales_volume) - total_cost)
+
+    @staticmethod
+    def _distance(location_1, location_2):
+        from haversine import haversine
+        return haversine((location_1.latitude, location_1.longitude), (location_2.latitude, location_2.longitude))
+
+    def map_results(self, warehouse_selection_data, warehouse_township_assignment_data, despatchers_data):
+        """
+        Replace the demand nodes' results by the townships' results of `disaggregate()`.
+
+        Args:
+            warehouse_selection_data (pd.DataFrame): Warehouse selection, unchanged by the aggregation.
+            warehouse_township_assignment_data (pd.DataFrame): Supply per demand node (rows) and warehouse (columns).
+            despatchers_data (pd.DataFrame): Despatchers per demand node (rows) and warehouse (columns).
+
+        Returns:
+            tuple: The three DataFrames, per township instead of demand node.
+        """
+        if self.point_assignment_data is None:
+            raise ValueError("Results are mapped back to the townships after disaggregate().")
+        return warehouse_selection_data, self.point_assignment_data, self.point_despatchers_data
@@ -0,0 +1,125 @@
+"""
+Cancellation of optimisation jobs.
+
+A CancelToken is created per job and checked while the job waits for a solver slot, while the solver process runs
+and between the pipeline stages. It is cancelled locally (e.g. when the API client disconnects), by its deadline, or
+from any worker on the machine through a marker file, which is how `CancelToken.cancel_job()` reaches jobs running
+in other API workers.
+"""
+
+import re
+import time
+import uuid
+import threading
+from pathlib import Path
+from conf import Config, Logger
+
+
+class SolveCancelled(Exception):
+    """Raised when a job is cancelled or its deadline has passed."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        # Picklable with its reason, e.g. when raised in a decomposition worker process
+        return self.__class__, (str(self), self.reason)
+
+
+class CancelToken:
+
+    DEADLINE_REASON = 'deadline exceeded'
+    JOB_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+    _logger = Logger().logger
+
+    def __init__(self, job_id=None, deadline=None):
+        """
+        Initialisation
+
+        Args:
+            job_id (str, optional): Job id used to cancel the job from other workers, letters, digits, '_' and '-'
+                only. Defaults to a new id.
+            deadline (float, optional): Unix time after which the job counts as cancelled. Defaults to None.
+        """
+        assert job_id is None or self.JOB_ID_PATTERN.fullmatch(job_id), f"Invalid job id ({job_id})."
+        self.job_id = job_id or uuid.uuid4().hex
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+        self._job_path = Path(self._jobs_dir(), self.job_id)
+        self._cancel_path = Path(self._cancel_dir(), self.job_id)
+
+    def __enter__(self):
+        self.register()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unregister()
+
+    def register(self):
+        """Make the job cancellable from other workers."""
+        self._job_path.parent.mkdir(parents=True, exist_ok=True)
+        self._job_path.touch()
+
+    def unregister(self):
+        for path in [self._job_path, self._cancel_path]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def cancel(self, reason='cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            self._logger.info(f"[CancelToken] Job {self.job_id} cancelled: {reason}.")
+
+    def cancel_other_processes(self):
+        """Cancel the job's work in other processes, e.g. decomposition workers, which check the job's marker file."""
+        self._cancel_path.parent.mkdir(parents=True, exist_ok=True)
+        self._cancel_path.touch()
+
+    def is_cancelled(self, grace_seconds=0):
+        """
+        Args:
+            grace_seconds (float, optional): Extra time allowed past the deadline. Defaults to 0.
+        """
+        if self._event.is_set():
+            return True
+        if self._cancel_path.exists():
+            self.cancel('cancelled by request')
+        elif self.deadline is not None and time.time() > self.deadline + grace_seconds:
+            self.cancel(self.DEADLINE_REASON)
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise SolveCancelled(f"Job {self.job_id} {self.reason}.", reason=self.reason)
+
+    @classmethod
+    def cancel_job(cls, job_id):
+        """
+        Cancel a queued or running job on any worker of this machine.
+
+        Args:
+            job_id (str): Job id.
+
+        Returns:
+            bool: Whether the job was found.
+        """
+        if not cls.JOB_ID_PATTERN.fullmatch(job_id) or not Path(cls._jobs_dir(), job_id).exists():
+            return False
+        cancel_path = Path(cls._cancel_dir(), job_id)
+        cancel_path.parent.mkdir(parents=True, exist_ok=True)
+        cancel_path.touch()
+        return True
+
+    @staticmethod
+    def _jobs_dir():
+        return Path(Config.SOLVE_SCHEDULER['LOCK_DIR'], 'jobs')
+
+    @staticmethod
+    def _cancel_dir():
+        return Path(Config.SOLVE_SCHEDULER['LOCK_DIR'], 'cancel')
@@ -0,0 +1,285 @@
+"""
+Spatial decomposition of the warehouse selection.
+
+Most warehouses only realistically serve nearby townships, so the instance is partitioned into regions of townships,
+by District or by demand-weighted k-means on their location. Each region's subproblem is the model over its
+townships and the warehouses near it: those within Config.DECOMPOSITION['BUFFER_KM'] of the region (so regions
+overlap on the warehouses between them), plus the nearest others until they can hold the region's demand. The
+subproblems are solved in parallel worker processes, each on one thread and through the SolveScheduler.
+
+The regions' solutions ignore each other, e.g. two regions may both count on the full capacity of a warehouse they
+share. The repair solve restores global feasibility: it is the full model over all townships, but only over the
+warehouses selected in any region (plus the most cost-effective others if they cannot hold the total demand), which
+is a much smaller MILP. Decomposition exposes the snapshot attributes of that repair model, so OptimisationModel
+builds it from Decomposition, and Postprocessing maps its results back to all warehouses with `map_results()`.
+"""
+
+import os
+import time
+import json
+import hashlib
+import multiprocessing
+import concurrent.futures
+from collections import Counter
+import numpy as np
+import pyomo.environ as pyo
+from conf import Config, Logger
+from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.cancellation import CancelToken, SolveCancelled
+
+
+class _RegionData:
+    """Snapshot of one region's townships and warehouses, as read by OptimisationModel."""
+
+    def __init__(self, name, warehouse_list, township_list, distance_matrix, data_fingerprint):
+        self.name = name
+        self.warehouse_list = warehouse_list
+        self.township_list = township_list
+        self.distance_matrix = distance_matrix
+        self.data_fingerprint = data_fingerprint
+
+
+def _solve_region(region_data, model_inputs, deadline, job_id):
+    """Solve a region's subproblem, in a worker process."""
+    from src.optimisation_model.model import OptimisationModel
+    from src.optimisation_model.solver import ModelSolver
+
+    start_time = time.perf_counter()
+    cancel_token = CancelToken(job_id=job_id, deadline=deadline)  # Cancelled from the main process by marker file
+    model_builder = OptimisationModel(region_data, **model_inputs)
+    build_seconds = time.perf_counter() - start_time
+    model_solver = ModelSolver(model_builder.model, threads=1, deadline=deadline, cancel_token=cancel_token)
+    model = model_builder.model
+    return {
+        'region': region_data.name,
+        'n_townships': len(region_data.township_list),
+        'n_warehouses': len(region_data.warehouse_list),
+        'selected_warehouses': [w for w in model.W if (model.x[w].value or 0) > 0.5],
+        'objective': pyo.value(model.obj),
+        'gap': model_solver.gap,
+        'build_seconds': round(build_seconds, 4),
+        'solve_seconds': model_solver.statistics.get('wall_seconds'),
+        'seconds': round(time.perf_counter() - start_time, 4),
+    }
+
+
+class Decomposition:
+
+    def __init__(self, processed_data: Preprocessing, partition: str, model_inputs: dict = None, deadline=None,
+                 cancel_token=None):
+        """
+        Initialisation, solves the regions' subproblems.
+
+        Args:
+            processed_data (Preprocessing): Input snapshot (or its Presolve/Aggregation reduction) to decompose. It is
+                only read, never modified.
+            partition (str): 'district' (a region per District) or 'kmeans' (Config.DECOMPOSITION['N_REGIONS']
+                regions clustered on location).
+            model_inputs (dict, optional): Optimisation model inputs for the subproblems, see OptimisationModel.
+                Defaults to None.
+            deadline (float, optional): Unix time by which the subproblems must have been solved. Defaults to None.
+            cancel_token (CancelToken, optional): Token cancelling the subproblem solves. Defaults to None.
+
+        Raises:
+            ValueError: Unknown partition.
+            SolveCancelled: The job was cancelled while solving the subproblems.
+        """
+        if partition not in Config.DECOMPOSITION['PARTITIONS']:
+            raise ValueError(f"Unknown decomposition partition '{partition}', choose from "
+                             f"{Config.DECOMPOSITION['PARTITIONS']}.")
+        self._logger = Logger().logger
+        self.original_data = processed_data
+        self.partition = partition
+        self.model_inputs = model_inputs or {}
+        self.deadline = deadline
+        self.cancel_token = cancel_token or CancelToken(deadline=deadline)
+
+        # Input data is kept as loaded, the repair solve's warehouses are listed in warehouse_list
+        self.warehouse_df = processed_data.warehouse_df
+        self.township_df = processed_data.township_df
+        self.township_list = processed_data.township_list
+        self.region_results = []
+        self.n_workers = None
+        self.boundary_warehouses = []  # Warehouses added to the repair solve as candidates of several regions
+        self.added_warehouses = []  # Warehouses added to the repair solve to hold the total demand
+        self._distance_matrix = None
+        self._data_fingerprint = None
+
+        start_time = time.perf_counter()
+        regions = self.__regions()
+        self.region_results = self.__solve_regions(regions)
+        self.parallel_seconds = time.perf_counter() - start_time
+        self.warehouse_list = self.__repair_warehouses(regions)
+        self._logger.info(f"[Decomposition] {len(regions)} regions solved in {self.parallel_seconds:.2f}s, "
+                          f"repair solve over {len(self.warehouse_list)} warehouses.")
+
+    @property
+    def report(self):
+        """Partition, regions' sizes, selected warehouses and timings, and the repair solve's warehouses."""
+        region_seconds = sum(result['seconds'] for result in self.region_results)
+        return {
+            'partition': self.partition,
+            'n_regions': len(self.region_results),
+            'n_workers': self.n_workers,
+            'parallel_seconds': round(self.parallel_seconds, 4),
+            'region_seconds': round(region_seconds, 4),
+            'parallel_speedup': round(region_seconds / max(1e-10, self.parallel_seconds), 2),
+            'n_repair_warehouses': len(self.warehouse_list),
+            'boundary_warehouses': self.boundary_warehouses,
+            'added_warehouses': self.added_warehouses,
+            'regions': self.region_results,
+        }
+
+    @property
+    def distance_matrix(self):
+        """Distances of the original snapshot between the repair solve's warehouses and the townships."""
+        if self._distance_matrix is None:
+            original_distances = self.original_data.distance_matrix
+            self._distance_matrix = {
+                (w.name, t.name): original_distances[w.name, t.name]
+                for t in self.township_list
+                for w in self.warehouse_list
+            }
+        return self._distance_matrix
+
+    @property
+    def data_fingerprint(self):
+        """Hash of the original snapshot's fingerprint and the repair solve's warehouses."""
+        if self._data_fingerprint is None:
+            self._data_fingerprint = hashlib.sha256(
+                f"{self.original_data.data_fingerprint}:{json.dumps([w.name for w in self.warehouse_list])}".encode()
+            ).hexdigest()
+        return self._data_fingerprint
+
+    def __regions(self):
+        """Regions' snapshots, with the warehouses near each region."""
+        if self.partition == 'district':
+            labels = [str(t.district) for t in self.township_list]
+        else:
+            from src.optimisation_model.aggregation import kmeans_labels
+            n_regions = min(Config.DECOMPOSITION['N_REGIONS'], len(self.township_list))
+            labels = [f"Region {label + 1}" for label in kmeans_labels(self.township_list, n_regions)]
+
+        original_distances = self.original_data.distance_matrix
+        regions = []
+        for label in sorted(set(labels)):
+            townships = [t for t, t_label in zip(self.township_list, labels) if t_label == label]
+            warehouses = self.__region_warehouses(townships)
+            regions.append(_RegionData(
+                name=label, warehouse_list=warehouses, township_list=townships,
+                distance_matrix={(w.name, t.name): original_distances[w.name, t.name]
+                                 for t in townships for w in warehouses},
+                data_fingerprint=hashlib.sha256(
+                    f"{self.original_data.data_fingerprint}:{label}:"
+                    f"{json.dumps([t.name for t in townships] + [w.name for w in warehouses])}".encode()
+                ).hexdigest(),
+            ))
+        return regions
+
+    def __region_warehouses(self, townships):
+        """Warehouses within the buffer of the region's townships, then the nearest others until they hold its
+        demand."""
+        original_distances = self.original_data.distance_matrix
+        warehouse_list = self.original_data.warehouse_list
+        nearest_distances = np.array([min(original_distances[w.name, t.name] for t in townships)
+                                      for w in warehouse_list])
+        region_demand = sum(t.demand for t in townships)
+        warehouses, capacity = [], 0.0
+        for i in np.argsort(nearest_distances, kind='stable'):
+            if nearest_distances[i] > Config.DECOMPOSITION['BUFFER_KM'] and capacity >= region_demand and warehouses:
+                break
+            warehouses.append(warehouse_list[i])
+            capacity += warehouse_list[i].capacity
+        return [w for w in warehouse_list if w in warehouses]  # In input order
+
+    def __solve_regions(self, regions):
+        mp_context = multiprocessing.get_context(Config.DECOMPOSITION['MP_CONTEXT'])
+        self.n_workers = max(1, min(len(regions), Config.DECOMPOSITION['MAX_WORKERS'] or os.cpu_count()))
+        self._logger.info(f"[Decomposition] Solving {len(regions)} regions ({self.partition}) on {self.n_workers} "
+                          f"worker processes.")
+        results = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_workers, mp_context=mp_context) as executor:
+            futures = {
+                executor.submit(_solve_region, region, self.model_inputs, self.deadline, self.cancel_token.job_id):
+                    region
+                for region in regions
+            }
+            pending = set(futures)
+            try:
+                while pending:
+                    done, pending = concurrent.futures.wait(
+                        pending, timeout=Config.SOLVE_SCHEDULER['POLL_INTERVAL_SECONDS'],
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        region = futures[future]
+                        results[region.name] = self.__region_result(region, future)
+                    self.cancel_token.raise_if_cancelled()
+            except SolveCancelled:
+                for future in pending:
+                    future.cancel()
+                self.cancel_token.cancel_other_processes()  # Terminates the running subproblems' solvers
+                raise
+        return [results[region.name] for region in regions]
+
+    def __region_result(self, region, future):
+        try:
+            result = future.result()
+            self._logger.debug(f"[Decomposition] Region {region.name} solved: {result}")
+            return result
+        except SolveCancelled:
+            raise
+        except Exception as error:
+            # e.g. a region without a feasible solution, its warehouses are all left to the repair solve
+            self._logger.warning(f"[Decomposition] Region {region.name} not solved, its warehouses are left to the "
+                                 f"repair solve: {error}")
+            return {
+                'region': region.name, 'n_townships': len(region.township_list),
+                'n_warehouses': len(region.warehouse_list),
+                'selected_warehouses': [w.name for w in region.warehouse_list], 'error': str(error), 'seconds': 0.0,
+            }
+
+    def __repair_warehouses(self, regions):
+        """
+        Warehouses selected in any region and, if Config.DECOMPOSITION['REPAIR_BOUNDARY_WAREHOUSES'], those on the
+        boundary (candidates of more than one region, which a region alone undervalues), plus the most cost-effective
+        others if they cannot hold the total demand.
+        """
+        selected = set(name for result in self.region_results for name in result['selected_warehouses'])
+        if Config.DECOMPOSITION['REPAIR_BOUNDARY_WAREHOUSES']:
+            n_regions = Counter(w.name for region in regions for w in region.warehouse_list)
+            self.boundary_warehouses = sorted(name for name, n in n_regions.items() if n > 1 and name not in selected)
+            selected.update(self.boundary_warehouses)
+
+        warehouse_list = self.original_data.warehouse_list
+        capacity = sum(w.capacity for w in warehouse_list if w.name in selected)
+        total_demand = sum(t.demand for t in self.township_list)
+        for w in sorted(warehouse_list, key=lambda w: w.monthly_cost / max(1e-10, w.capacity)):
+            if capacity >= total_demand and selected:
+                break
+            if w.name not in selected:
+                selected.add(w.name)
+                self.added_warehouses.append(w.name)
+                capacity += w.capacity
+        return [w for w in warehouse_list if w.name in selected]  # In input order
+
+    def map_results(self, warehouse_selection_data, warehouse_township_assignment_data, despatchers_data):
+        """
+        Map the repair solve's results back to all warehouses, the warehouses left out are not selected.
+
+        Args:
+            warehouse_selection_data (pd.DataFrame): Selection of the repair solve's warehouses.
+            warehouse_township_assignment_data (pd.DataFrame): Supply per township (rows) and repair solve's
+                warehouse (columns).
+            despatchers_data (pd.DataFrame): Despatchers per township (rows) and repair solve's warehouse (columns).
+
+        Returns:
+            tuple: The three DataFrames, with all warehouses in input order.
+        """
+        warehouse_names = [w.name for w in self.original_data.warehouse_list]
+        warehouse_selection_data = warehouse_selection_data.set_index('Name').reindex(warehouse_names) \
+            .fillna({'Selected': False}).astype({'Selected': bool}).rename_axis('Name').reset_index()
+        warehouse_township_assignment_data = warehouse_township_assignment_data.reindex(columns=warehouse_names) \
+            .fillna(0)
+        despatchers_data = despatchers_data.reindex(columns=warehouse_names).fillna(0)
+        return warehouse_selection_data, warehouse_township_assignment_data, despatchers_data
@@ -0,0 +1,324 @@
+"""
+Monte Carlo evaluation of a fixed warehouse network under sampled township demands.
+
+The model plans for one deterministic demand per township (its Proportion Sales of the total demand, see
+InputHandler). DemandScenarios samples township demands around it and evaluates a network of open warehouses, fixed
+from a solution, in each scenario: its unmet demand, warehouse utilisation, despatchers and cost. With the warehouses
+fixed only the assignment is left, so the model is not solved per scenario:
+
+- Townships are assigned to the cheapest open warehouses with spare capacity, the townships of largest regret first,
+  as in LagrangianSolver._assign. Neither order depends on the demand, so each township is assigned in all scenarios of
+  a batch at once, on scenario x warehouse NumPy arrays.
+- Demand the open warehouses cannot hold is unmet. In scenario 2, demand only served at a loss is left unmet as well.
+  Despatchers and costs follow the model's objective and despatcher formulation.
+- Batches of Config.DEMAND_SCENARIOS['BATCH_SIZE'] scenarios run in parallel worker processes. Each batch samples its
+  scenarios from its own seed, spawned from RANDOM_STATE, so the scenarios do not depend on the number of workers.
+
+Each township's demand is lognormal around its deterministic demand, with the coefficient of variation of its
+stations' forecasts (see InputHandler.get_township_demand_cv), times a lognormal factor common to all townships.
+"""
+
+import os
+import time
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from conf import Config, Logger, Tracer
+from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.input_handler import InputHandler
+from src.optimisation_model.lagrangian import distance_array, unit_cost_arrays, hired_despatchers
+from src.optimisation_model.cancellation import SolveCancelled
+
+# Metrics of each scenario, summarised over the scenarios
+METRICS = [
+    'demand', 'unmet_demand', 'unmet_demand_share', 'utilisation', 'max_warehouse_utilisation', 'despatchers',
+    'warehouse_cost', 'despatcher_hiring_cost', 'delivery_cost', 'sales_revenue', 'objective',
+]
+
+
+def _lognormal_factors(rng, cv, size):
+    """Lognormal factors of mean 1 and the given coefficients of variation."""
+    sigma = np.sqrt(np.log1p(np.square(cv)))
+    return rng.lognormal(-np.square(sigma) / 2, sigma, size)
+
+
+def sample_demands(network, seed, n_scenarios):
+    """
+    Args:
+        network (dict): Arrays of the open warehouses, see DemandScenarios.network.
+        seed (np.random.SeedSequence): Seed of the batch.
+        n_scenarios (int): Scenarios in the batch.
+
+    Returns:
+        np.ndarray: Demand of each scenario (rows) and township (columns).
+    """
+    rng = np.random.default_rng(seed)
+    n_townships = len(network['demands'])
+    return network['demands'] * _lognormal_factors(rng, network['common_cv'], (n_scenarios, 1)) * \
+        _lognormal_factors(rng, network['demand_cvs'], (n_scenarios, n_townships))
+
+
+def _evaluate_batch(network, seed, n_scenarios):
+    """Sample and evaluate a batch of demand scenarios, in a worker process, see `sample_demands()`."""
+    return _evaluate_demands(network, sample_demands(network, seed, n_scenarios))
+
+
+def _evaluate_demands(network, demands):
+    """
+    Args:
+        network (dict): Arrays of the open warehouses, see DemandScenarios.network.
+        demands (np.ndarray): Demand of each scenario (rows) and township (columns).
+
+    Returns:
+        dict: Array of each metric (see METRICS) per scenario, and 'warehouse_utilisation' per scenario (rows) and
+            open warehouse (columns).
+    """
+    n_scenarios, n_townships = demands.shape
+    capacities = network['capacities']
+    supply = np.zeros((n_scenarios, len(capacities), n_townships))
+    spare_capacities = np.tile(capacities, (n_scenarios, 1))
+    for t, candidates in zip(network['township_order'], network['candidates']):
+        available = spare_capacities[:, candidates]
+        assigned = np.clip(demands[:, t, None] - (np.cumsum(available, axis=1) - available), 0, available)
+        supply[:, candidates, t] = assigned
+        spare_capacities[:, candidates] -= assigned
+
+    warehouse_supply = np.minimum(supply.sum(axis=2), capacities)  # Without rounding errors
+    total_demand = demands.sum(axis=1)
+    unmet_demand = np.maximum(0, total_demand - warehouse_supply.sum(axis=1))
+    despatchers = hired_despatchers(network['despatcher_rates'] * supply, network['despatcher_formulation'])
+    despatchers = despatchers.reshape(n_scenarios, -1).sum(axis=1)
+    metrics = {
+        'demand': total_demand,
+        'unmet_demand': unmet_demand,
+        'unmet_demand_share': unmet_demand / total_demand,
+        'utilisation': warehouse_supply.sum(axis=1) / capacities.sum(),
+        'warehouse_utilisation': warehouse_supply / capacities,
+        'despatchers': despatchers,
+        'warehouse_cost': np.full(n_scenarios, network['warehouse_cost']),
+        'despatcher_hiring_cost': despatchers * network['despatch_hiring_cost'],
+        'delivery_cost': (network['delivery_costs'] * supply).sum(axis=(1, 2)),
+        'sales_revenue': warehouse_supply.sum(axis=1) * network['profit_per_sales_volume'],
+    }
+    metrics['max_warehouse_utilisation'] = metrics['warehouse_utilisation'].max(axis=1)
+    total_cost = metrics['warehouse_cost'] + metrics['despatcher_hiring_cost'] + metrics['delivery_cost']
+    metrics['objective'] = total_cost if network['optimisation_scenario'] == 1 else \
+        metrics['sales_revenue'] - total_cost
+    return metrics
+
+
+class DemandScenarios:
+
+    def __init__(
+        self, warehouses: list, processed_data: Preprocessing = None, n_scenarios: int = None,
+        random_state: int = None, cancel_token=None, optimisation_scenario: int = None,
+        add_delivery_time_constraint: bool = None, add_despatcher_hiring_cost: bool = None,
+        add_delivery_cost: bool = None, despatch_hiring_cost: float = None, delivery_speed: float = None,
+        despatch_volume_limit: float = None, cost_of_delivery: float = None, working_hours_per_day: float = None,
+        maximum_delivery_hrs_constraint: float = None, profit_per_sales_volume: float = None,
+        despatcher_formulation: str = None
+    ):
+        """
+        Initialisation, which samples and evaluates the scenarios.
+
+        Args:
+            warehouses (list): Names of the open warehouses, e.g. the warehouse selection of a solution.
+            processed_data (Preprocessing, optional): Input snapshot. Defaults to loading the inputs.
+            n_scenarios (int, optional): Demand scenarios sampled. Defaults to Config.DEMAND_SCENARIOS['N_SCENARIOS'].
+            random_state (int, optional): Seed of the scenarios. Defaults to Config.DEMAND_SCENARIOS['RANDOM_STATE'].
+            cancel_token (CancelToken, optional): Checked between batches. Defaults to None.
+            optimisation_scenario, ..., despatcher_formulation: Optimisation model inputs, see OptimisationModel.
+                Default to Config settings.
+
+        Raises:
+            ValueError: No open warehouses, unknown warehouses or warehouses breaking the delivery time constraint.
+            SolveCancelled: The cancel token was cancelled.
+        """
+        self._logger = Logger().logger
+        self.optimisation_scenario = optimisation_scenario or Config.SELECTED_OPTIMISATION_SCENARIO
+        self.add_delivery_time_constraint = add_delivery_time_constraint or Config.ADD_DELIVERY_TIME_CONSTRAINT
+        self.add_despatcher_hiring_cost = add_despatcher_hiring_cost or Config.ADD_DESPATCHER_HIRING_COST
+        self.add_delivery_cost = add_delivery_cost or Config.ADD_DELIVERY_COST
+        self.despatch_hiring_cost = despatch_hiring_cost or Config.OPT_PARAMS['despatch_hiring_cost']
+        self.delivery_speed = delivery_speed or Config.OPT_PARAMS['delivery_speed']
+        self.despatch_volume_limit = despatch_volume_limit or Config.OPT_PARAMS['despatch_volume_limit']
+        self.cost_of_delivery = cost_of_delivery or Config.OPT_PARAMS['cost_of_delivery']
+        self.working_hours_per_day = working_hours_per_day or Config.OPT_PARAMS['working_hours_per_day']
+        self.maximum_delivery_hrs_constraint = \
+            maximum_delivery_hrs_constraint or Config.OPT_PARAMS['maximum_delivery_hrs_constraint']
+        self.profit_per_sales_volume = profit_per_sales_volume or Config.OPT_PARAMS['profit_per_sales_volume']
+        self.despatcher_formulation = despatcher_formulation or Config.DESPATCHER_FORMULATION
+        self.n_scenarios = n_scenarios or Config.DEMAND_SCENARIOS['N_SCENARIOS']
+        self.random_state = random_state if random_state is not None else Config.DEMAND_SCENARIOS['RANDOM_STATE']
+        self.cancel_token = cancel_token
+        self.processed_data = processed_data if processed_data is not None else Preprocessing()
+
+        warehouse_names = [w.name for w in self.processed_data.warehouse_list]
+        unknown_warehouses = sorted(set(warehouses) - set(warehouse_names))
+        if not warehouses or unknown_warehouses:
+            raise ValueError(f"Open warehouses must be given, from the input warehouses. Unknown: {unknown_warehouses}")
+        self.warehouses = [w for w in warehouse_names if w in set(warehouses)]  # In input order
+        self.network = self.__network(np.array([w in set(warehouses) for w in warehouse_names]))
+
+        self.n_workers = 1
+        with Tracer.span('demand_scenarios', n_scenarios=self.n_scenarios, n_warehouses=len(self.warehouses)) as span:
+            start_time = time.perf_counter()
+            self.deterministic = {metric: values[0] for metric, values in
+                                  _evaluate_demands(self.network, self.network['demands'][None]).items()}
+            self.metrics = self.__evaluate()
+            self.seconds = time.perf_counter() - start_time
+            span.set_attributes(n_workers=self.n_workers, seconds=self.seconds)
+        self._logger.info(f"[DemandScenarios] {self.n_scenarios} scenarios evaluated on {self.n_workers} worker "
+                          f"processes in {self.seconds:.2f}s | unmet demand in "
+                          f"{self.probability_unmet_demand:.1%} of them | objective: "
+                          f"{self.metrics['objective'].mean()} on average, {self.deterministic['objective']} for "
+                          f"the deterministic demand")
+
+    @classmethod
+    def from_model_builder(cls, model_builder, **kwargs):
+        """
+        Args:
+            model_builder (OptimisationModel): Solved model builder whose warehouse selection and inputs to evaluate.
+            **kwargs: Other inputs, see DemandScenarios. processed_data defaults to the model builder's snapshot,
+                whose townships may be Aggregation's demand nodes (at Config.DEMAND_SCENARIOS['DEFAULT_CV']).
+
+        Returns:
+            DemandScenarios: Evaluated on the model builder's warehouse selection and inputs.
+        """
+        model = model_builder.model
+        model_inputs = {coefficient: getattr(model_builder, coefficient)
+                        for coefficient in model_builder.SCALAR_COEFFICIENTS}
+        kwargs.setdefault('processed_data', model_builder.processed_data)
+        return cls(
+            [w for w in model.W if (model.x[w].value or 0) > 0.5],
+            optimisation_scenario=model_builder.optimisation_scenario,
+            add_delivery_time_constraint=model_builder.add_delivery_time_constraint,
+            add_despatcher_hiring_cost=model_builder.add_despatcher_hiring_cost,
+            add_delivery_cost=model_builder.add_delivery_cost,
+            despatcher_formulation=model_builder.despatcher_formulation, **model_inputs, **kwargs
+        )
+
+    @property
+    def probability_unmet_demand(self):
+        """Share of the scenarios with unmet demand (beyond rounding)."""
+        return float(np.mean(self.metrics['unmet_demand'] > 1e-6 * self.metrics['demand']))
+
+    @property
+    def summary(self):
+        """Mean, standard deviation, extremes and Config.DEMAND_SCENARIOS['QUANTILES'] of each metric."""
+        quantiles = Config.DEMAND_SCENARIOS['QUANTILES']
+        summary = {}
+        for metric in METRICS:
+            values = self.metrics[metric]
+            summary[metric] = {'mean': float(values.mean()), 'std': float(values.std()),
+                               'min': float(values.min()), 'max': float(values.max())}
+            summary[metric].update({f"p{q * 100:g}": float(value)
+                                    for q, value in zip(quantiles, np.quantile(values, quantiles))})
+        return summary
+
+    @property
+    def warehouse_utilisation(self):
+        """Mean and highest quantile of each open warehouse's utilisation, and the share of scenarios it is full."""
+        utilisation = self.metrics['warehouse_utilisation']
+        quantile = max(Config.DEMAND_SCENARIOS['QUANTILES'])
+        return {
+            warehouse: {'mean': float(values.mean()), f"p{quantile * 100:g}": float(np.quantile(values, quantile)),
+                        'probability_full': float(np.mean(values >= 1 - 1e-9))}
+            for warehouse, values in zip(self.warehouses, utilisation.T)
+        }
+
+    @property
+    def result(self):
+        return {
+            'warehouses': self.warehouses,
+            'n_scenarios': self.n_scenarios,
+            'probability_unmet_demand': self.probability_unmet_demand,
+            'deterministic': {metric: float(self.deterministic[metric]) for metric in METRICS},
+            'summary': self.summary,
+            'warehouse_utilisation': self.warehouse_utilisation,
+            'seconds': self.seconds,
+        }
+
+    def __network(self, selection):
+        """Arrays of the open warehouses, sent to the worker processes."""
+        distances = distance_array(self.processed_data)
+        if self.add_delivery_time_constraint:
+            too_far = selection & (distances.max(axis=1) / self.delivery_speed > self.maximum_delivery_hrs_constraint)
+            if too_far.any():
+                raise ValueError(f"Open warehouses break the delivery time constraint: "
+                                 f"{[w for w, far in zip(self.warehouses, too_far[selection]) if far]}")
+        despatcher_rates, delivery_costs = unit_cost_arrays(self, distances[selection])
+
+        # Costs per unit of supply ordering the assignment, as in LagrangianSolver
+        unit_costs = delivery_costs.copy()
+        if self.optimisation_scenario == 2:
+            unit_costs -= self.profit_per_sales_volume
+        if self.add_despatcher_hiring_cost:
+            unit_costs += despatcher_rates * self.despatch_hiring_cost
+
+        township_list = self.processed_data.township_list
+        demands = np.array([t.demand for t in township_list], dtype=float)
+        sorted_costs = np.sort(unit_costs, axis=0)
+        regrets = sorted_costs[1] - sorted_costs[0] if len(unit_costs) > 1 else np.zeros(len(demands))
+        township_order = np.lexsort((-demands, -regrets))
+        candidates = []
+        for t in township_order:
+            warehouse_order = np.argsort(unit_costs[:, t], kind='stable')
+            if self.optimisation_scenario == 2:
+                warehouse_order = warehouse_order[unit_costs[warehouse_order, t] < 0]  # Supplying at a loss is optional
+            candidates.append(warehouse_order)
+
+        demand_cvs = InputHandler.get_township_demand_cv()
+        return {
+            'demands': demands,
+            'demand_cvs': demand_cvs.reindex([t.name for t in township_list])
+                                    .fillna(Config.DEMAND_SCENARIOS['DEFAULT_CV']).to_numpy(dtype=float),
+            'common_cv': Config.DEMAND_SCENARIOS['COMMON_CV'],
+            'capacities': np.array([w.capacity for w in self.processed_data.warehouse_list], dtype=float)[selection],
+            'warehouse_cost': float(sum(w.monthly_cost for w, selected in
+                                        zip(self.processed_data.warehouse_list, selection) if selected)),
+            'township_order': township_order,
+            'candidates': candidates,
+            'despatcher_rates': despatcher_rates,
+            'delivery_costs': delivery_costs,
+            'despatcher_formulation': self.despatcher_formulation,
+            'despatch_hiring_cost': self.despatch_hiring_cost if self.add_despatcher_hiring_cost else 0,
+            'profit_per_sales_volume': self.profit_per_sales_volume if self.optimisation_scenario == 2 else 0,
+            'optimisation_scenario': self.optimisation_scenario,
+        }
+
+    def __evaluate(self):
+        batch_size = Config.DEMAND_SCENARIOS['BATCH_SIZE']
+        batch_sizes = [min(batch_size, self.n_scenarios - start) for start in range(0, self.n_scenarios, batch_size)]
+        seeds = np.random.SeedSequence(self.random_state).spawn(len(batch_sizes))
+        self.n_workers = max(1, min(len(batch_sizes), Config.DEMAND_SCENARIOS['MAX_WORKERS'] or os.cpu_count()))
+
+        if self.n_workers == 1:
+            # Not worth starting worker processes
+            batches = []
+            for seed, n_scenarios in zip(seeds, batch_sizes):
+                self.__raise_if_cancelled()
+                batches.append(_evaluate_batch(self.network, seed, n_scenarios))
+        else:
+            mp_context = multiprocessing.get_context(Config.DEMAND_SCENARIOS['MP_CONTEXT'])
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_workers, mp_context=mp_context) as executor:
+                futures = [executor.submit(_evaluate_batch, self.network, seed, n_scenarios)
+                           for seed, n_scenarios in zip(seeds, batch_sizes)]
+                pending = set(futures)
+                try:
+                    while pending:
+                        _, pending = concurrent.futures.wait(
+                            pending, timeout=Config.SOLVE_SCHEDULER['POLL_INTERVAL_SECONDS'],
+                            return_when=concurrent.futures.FIRST_COMPLETED,
+                        )
+                        self.__raise_if_cancelled()
+                except SolveCancelled:
+                    for future in pending:
+                        future.cancel()
+                    raise
+                batches = [future.result() for future in futures]
+        return {metric: np.concatenate([batch[metric] for batch in batches]) for metric in batches[0]}
+
+    def __raise_if_cancelled(self):
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
@@ -15,24 +15,69 @@ pd.set_option("display.width", 2000)
 
 
 class InputHandler:
+
+    MODEL_INPUT_FILES = {
+        'districts': dict(
+            filepath=Path(Config.FILES["MODEL_INPUT_DATA"], "districts_df.csv"),
+            columns=['District', 'Township', 'Latitude', 'Longitude', 'Total Sales', 'Proportion Sales'],
+            compact=None, schema={'District': 'category'}  # compact=None follows Config at load time
+        ),
+        'warehouse_options': dict(
+            filepath=Path(Config.FILES["MODEL_INPUT_DATA"], "Warehouse Options.xlsx"),
+            compact=None
+        ),
+    }
+
+    # Forecast sales per station, with the township it was assigned to (see DataPreprocessor.merge_data)
+    STATION_SALES_FILE = dict(
+        filepath=Path(Config.FILES["INTERMEDIATE_DATA"], "station_merged_df.csv"),
+        columns=['Assigned Township', 'Total Sales'],
+    )
+
+    @classmethod
+    def get_model_inputs(cls):
+        """
+        Load all model input files concurrently.
+
+        Returns:
+            dict: {'districts': districts data, 'warehouse_options': warehouse options data}
+        """
+        data_dfs = PandasFileConnector.load_many(cls.MODEL_INPUT_FILES)
+        return {
+            'districts': cls.get_districts_data(data_dfs.get('districts')),
+            'warehouse_options': cls.get_warehouse_options(data_dfs.get('warehouse_options')),
+        }
     
     @classmethod
-    def get_districts_data(cls):
-        data_df = PandasFileConnector.load(
-            Path(Config.FILES["MODEL_INPUT_DATA"], "districts_df.csv")
-        )
+    def get_districts_data(cls, data_df=None):
+        if data_df is None:
+            data_df = PandasFileConnector.load(**cls.MODEL_INPUT_FILES['districts'])
         data_df['Proportion Sales'] = data_df['Proportion Sales'] / data_df['Proportion Sales'].sum()
         data_df = data_df.drop_duplicates(subset='Township', keep='first')
         data_df['Demand'] = data_df['Proportion Sales'] * Config.OPT_PARAMS['total_demand']
         return data_df
 
     @classmethod
-    def get_warehouse_options(cls):
+    def get_warehouse_options(cls, data_df=None):
         
-        data_df = PandasFileConnector.load(
-            Path(Config.FILES["MODEL_INPUT_DATA"], "Warehouse Options.xlsx")
-        )
+        if data_df is None:
+            data_df = PandasFileConnector.load(**cls.MODEL_INPUT_FILES['warehouse_options'])
         data_df['Capacity (ft3)'] = data_df['Area (sqft)'] * Config.OPT_PARAMS['warehouse_storage_height']
         return data_df
 
+    @classmethod
+    def get_township_demand_cv(cls, data_df=None):
+        """
+        Coefficient of variation of each township's demand, from the spread of the forecast sales of its stations:
+        their standard deviation relative to their mean, over the square root of the number of stations (the
+        township's demand being their total). Townships with a single station take the median over the others.
 
+        Returns:
+            pd.Series: Coefficient of variation, indexed by Township.
+        """
+        if data_df is None:
+            data_df = PandasFileConnector.load(**cls.STATION_SALES_FILE)
+        station_sales = data_df.groupby('Assigned Township')['Total Sales'].agg(['count', 'mean', 'std'])
+        station_cv = (station_sales['std'] / station_sales['mean']).replace(float('inf'), float('nan'))
+        station_cv = station_cv.fillna(station_cv.median())
+        return (station_cv / station_sales['count'] ** 0.5).rename_axis('Township').rename('Demand CV')
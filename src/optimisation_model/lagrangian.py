@@ -0,0 +1,462 @@
+"""
+Lagrangian relaxation of the facility location model, with subgradient multiplier updates.
+
+The township demand constraints (scenario 1) or the excessive supply constraints (scenario 2) are what couple the
+warehouses. Relaxing them with one multiplier per township splits the model into one subproblem per warehouse: open it
+or not, and fill its capacity with the townships of negative reduced cost, cheapest first (a fractional knapsack). The
+subproblems of all warehouses are solved at once on W x T NumPy arrays, without building the Pyomo model.
+
+- Each Lagrangian value is a valid bound on the model's optimum: a lower bound on the cost (scenario 1) or an upper
+  bound on the profit (scenario 2). The subproblems cap each warehouse's supply to a township at its demand, which some
+  optimal solution satisfies, so the bound is far tighter than the LP relaxation's (with its big-M selection
+  constraint). Despatchers are costed at their continuous rate, as in the 'relaxed' formulation, which bounds the
+  others.
+- Feasible solutions are repaired from the subproblems' open warehouses: warehouses are added until they hold the
+  demand, townships are assigned greedily to the cheapest open warehouses with spare capacity and unused warehouses
+  are closed again. They are costed with the model's despatcher formulation, and the best one is improved by a local
+  search once the iterations stop.
+- Multipliers take Polyak steps towards the best feasible objective, the step size is halved whenever the bound has not
+  improved for Config.LAGRANGIAN['PATIENCE'] iterations.
+
+Used standalone by the 'lagrangian' solve profile, which loads the best feasible solution into the model, and as a
+bound provider by profiles with LAGRANGIAN_BOUND, see ProfileSolver.
+"""
+
+import time
+import numpy as np
+from pyomo.opt import ProblemSense, SolverResults, SolverStatus, TerminationCondition
+from conf import Config, Logger
+from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.solver_log import relative_gap
+
+
+class LagrangianSolver:
+
+    def __init__(
+        self, processed_data: Preprocessing, optimisation_scenario: int = None,
+        add_delivery_time_constraint: bool = None, add_despatcher_hiring_cost: bool = None,
+        add_delivery_cost: bool = None, despatch_hiring_cost: float = None, delivery_speed: float = None,
+        despatch_volume_limit: float = None, cost_of_delivery: float = None, working_hours_per_day: float = None,
+        maximum_delivery_hrs_constraint: float = None, profit_per_sales_volume: float = None,
+        despatcher_formulation: str = None, max_iterations: int = None, deadline: float = None,
+        cancel_token=None, target_gap: float = None
+    ):
+        """
+        Initialisation, which runs the subgradient iterations.
+
+        Args:
+            processed_data (Preprocessing): Input snapshot, or its reduction by Presolve, Aggregation or Decomposition.
+            optimisation_scenario, ..., despatcher_formulation: Optimisation model inputs, see OptimisationModel.
+                Default to Config settings.
+            max_iterations (int, optional): Subgradient iterations. Defaults to Config.LAGRANGIAN['MAX_ITERATIONS'].
+            deadline (float, optional): Unix time by which the iterations stop. Defaults to None.
+            cancel_token (CancelToken, optional): Checked every iteration. Defaults to None.
+            target_gap (float, optional): Relative gap between the best feasible objective and the bound at which the
+                iterations stop. Defaults to Config.LAGRANGIAN['TARGET_GAP'].
+
+        Raises:
+            ValueError: No feasible solution, i.e. the warehouses that can be opened cannot hold the demand.
+            SolveCancelled: The cancel token was cancelled.
+        """
+        self._logger = Logger().logger
+        self.processed_data = processed_data
+        self.optimisation_scenario = optimisation_scenario or Config.SELECTED_OPTIMISATION_SCENARIO
+        self.add_delivery_time_constraint = add_delivery_time_constraint or Config.ADD_DELIVERY_TIME_CONSTRAINT
+        self.add_despatcher_hiring_cost = add_despatcher_hiring_cost or Config.ADD_DESPATCHER_HIRING_COST
+        self.add_delivery_cost = add_delivery_cost or Config.ADD_DELIVERY_COST
+        self.despatch_hiring_cost = despatch_hiring_cost or Config.OPT_PARAMS['despatch_hiring_cost']
+        self.delivery_speed = delivery_speed or Config.OPT_PARAMS['delivery_speed']
+        self.despatch_volume_limit = despatch_volume_limit or Config.OPT_PARAMS['despatch_volume_limit']
+        self.cost_of_delivery = cost_of_delivery or Config.OPT_PARAMS['cost_of_delivery']
+        self.working_hours_per_day = working_hours_per_day or Config.OPT_PARAMS['working_hours_per_day']
+        self.maximum_delivery_hrs_constraint = \
+            maximum_delivery_hrs_constraint or Config.OPT_PARAMS['maximum_delivery_hrs_constraint']
+        self.profit_per_sales_volume = profit_per_sales_volume or Config.OPT_PARAMS['profit_per_sales_volume']
+        self.despatcher_formulation = despatcher_formulation or Config.DESPATCHER_FORMULATION
+        self.max_iterations = max_iterations or Config.LAGRANGIAN['MAX_ITERATIONS']
+        self.deadline = deadline
+        self.cancel_token = cancel_token
+        self.target_gap = target_gap if target_gap is not None else Config.LAGRANGIAN['TARGET_GAP']
+        self.sense = 1 if self.optimisation_scenario == 1 else -1  # Profits are maximised as negative costs
+
+        # Model inputs as arrays, warehouses in rows and townships in columns
+        self.warehouse_names = [w.name for w in processed_data.warehouse_list]
+        self.township_names = [t.name for t in processed_data.township_list]
+        self.fixed_costs = np.array([w.monthly_cost for w in processed_data.warehouse_list], dtype=float)
+        self.capacities = np.array([w.capacity for w in processed_data.warehouse_list], dtype=float)
+        self.demands = np.array([t.demand for t in processed_data.township_list], dtype=float)
+        self.__set_costs(distance_array(processed_data))
+
+        self.multipliers = None
+        self.bound = None  # Best Lagrangian value, in the model's objective sense
+        self.objective = None  # Objective of the best feasible solution
+        self.selection = None  # Open warehouses of the best feasible solution
+        self.supply = None  # Supply from each warehouse (rows) to each township (columns) of the best solution
+        self.iterations = 0
+        self.termination_condition = None
+        self.solve_seconds = None
+        self.__solve()
+
+    @classmethod
+    def from_model_builder(cls, model_builder, **kwargs):
+        """
+        Args:
+            model_builder (OptimisationModel): Model builder whose snapshot and inputs to relax.
+            **kwargs: Iteration settings, see LagrangianSolver.
+
+        Returns:
+            LagrangianSolver: Solved on the model builder's snapshot and inputs.
+        """
+        model_inputs = {coefficient: getattr(model_builder, coefficient)
+                        for coefficient in model_builder.SCALAR_COEFFICIENTS}
+        return cls(
+            model_builder.processed_data, optimisation_scenario=model_builder.optimisation_scenario,
+            add_delivery_time_constraint=model_builder.add_delivery_time_constraint,
+            add_despatcher_hiring_cost=model_builder.add_despatcher_hiring_cost,
+            add_delivery_cost=model_builder.add_delivery_cost,
+            despatcher_formulation=model_builder.despatcher_formulation, **model_inputs, **kwargs
+        )
+
+    @property
+    def gap(self):
+        return relative_gap(self.objective, self.bound)
+
+    @property
+    def statistics(self):
+        return {
+            'lagrangian_bound': self.bound,
+            'lagrangian_objective': self.objective,
+            'lagrangian_gap': None if self.gap is None else float(self.gap),
+            'lagrangian_iterations': self.iterations,
+            'lagrangian_seconds': self.solve_seconds,
+        }
+
+    @property
+    def results(self):
+        """Pyomo solver results of the best solution, as written to MLflow for the solvers."""
+        results = SolverResults()
+        results.solver.name = 'lagrangian'
+        results.solver.status = SolverStatus.ok
+        results.solver.termination_condition = self.termination_condition
+        results.solver.wallclock_time = self.solve_seconds
+        results.problem.number_of_variables = self.fixed_costs.size + self.supply.size
+        results.problem.number_of_constraints = self.fixed_costs.size + self.demands.size
+        results.problem.sense = ProblemSense.minimize if self.sense == 1 else ProblemSense.maximize
+        if self.sense == 1:
+            results.problem.lower_bound, results.problem.upper_bound = self.bound, self.objective
+        else:
+            results.problem.lower_bound, results.problem.upper_bound = self.objective, self.bound
+        return results
+
+    def __set_costs(self, distances):
+        # Cost per unit of supply, excluding despatchers, and negative profits in scenario 2
+        self.despatcher_rates, self.supply_costs = unit_cost_arrays(self, distances)
+        if self.optimisation_scenario == 2:
+            self.supply_costs -= self.profit_per_sales_volume
+
+        # Continuous despatcher costs in the subproblems
+        self.unit_costs = self.supply_costs
+        if self.add_despatcher_hiring_cost:
+            self.unit_costs = self.supply_costs + self.despatcher_rates * self.despatch_hiring_cost
+
+        # The delivery time constraint closes the warehouses too far from any township
+        self.can_open = np.ones(len(self.fixed_costs), dtype=bool)
+        if self.add_delivery_time_constraint and distances.size:
+            self.can_open = distances.max(axis=1) / self.delivery_speed <= self.maximum_delivery_hrs_constraint
+
+    def __solve(self):
+        start_time = time.perf_counter()
+        if self.sense == 1 and self.capacities[self.can_open].sum() < self.demands.sum():
+            raise ValueError("Model optimisation resulted into an infeasible solution")
+
+        settings = Config.LAGRANGIAN
+        multipliers = self.__initial_multipliers()
+        step_size = settings['STEP_SIZE']
+        best_bound = -np.inf  # Minimisation form
+        best_objective = np.inf
+        iterations_without_improvement = 0
+        self.termination_condition = TerminationCondition.maxIterations
+
+        for self.iterations in range(1, self.max_iterations + 1):
+            if self.cancel_token is not None:
+                self.cancel_token.raise_if_cancelled()
+
+            bound, values, opened, supply = self._solve_subproblems(multipliers)
+            if bound > best_bound + settings['MIN_IMPROVEMENT'] * max(1.0, abs(best_bound)):
+                iterations_without_improvement = 0
+            else:
+                iterations_without_improvement += 1
+                if iterations_without_improvement >= settings['PATIENCE']:
+                    step_size /= 2
+                    iterations_without_improvement = 0
+            if bound > best_bound:
+                best_bound, self.multipliers = bound, multipliers
+
+            objective, selection, repaired_supply = self._repair(opened)
+            if objective < best_objective:
+                best_objective, self.selection, self.supply = objective, selection, repaired_supply
+
+            # Python floats, the statistics end up in the JSON results
+            self.bound, self.objective = float(self.sense * best_bound), float(self.sense * best_objective)
+            subgradient = self.sense * (self.demands - supply.sum(axis=0))
+            squared_norm = subgradient @ subgradient
+            if self.gap <= self.target_gap:
+                self.termination_condition = TerminationCondition.optimal
+                break
+            if squared_norm == 0:
+                # The subproblems' solution is feasible, the bound cannot improve
+                self.termination_condition = TerminationCondition.other
+                break
+            if step_size < settings['MIN_STEP_SIZE']:
+                self.termination_condition = TerminationCondition.minStepLength
+                break
+            if self.deadline is not None and time.time() >= self.deadline:
+                # Checked after the first iteration, which gives the first bound and feasible solution
+                self.termination_condition = TerminationCondition.maxTimeLimit
+                break
+            multipliers = np.maximum(0, multipliers + step_size * (best_objective - bound) / squared_norm * subgradient)
+
+        if self.termination_condition != TerminationCondition.optimal:
+            self.__improve()
+        self.solve_seconds = time.perf_counter() - start_time
+        self._logger.info(f"[LagrangianSolver] {self.termination_condition} after {self.iterations} iterations in "
+                          f"{self.solve_seconds:.2f}s | objective: {self.objective} | bound: {self.bound} | "
+                          f"gap: {self.gap}")
+
+    def __improve(self):
+        """
+        Local search from the best feasible solution, for as long as it lowers the objective (and up to
+        Config.LAGRANGIAN['LOCAL_SEARCH_SECONDS']): open one of the CANDIDATES closed warehouses of lowest value per
+        unit of capacity for the best multipliers, or close an open warehouse and make up its capacity as in
+        `_repair()`, then close the warehouses made redundant.
+        """
+        end_time = time.time() + Config.LAGRANGIAN['LOCAL_SEARCH_SECONDS']
+        if self.deadline is not None:
+            end_time = min(end_time, self.deadline)
+        _, values, _, _ = self._solve_subproblems(self.multipliers)
+        best = (self.sense * self.objective, self.selection, self.supply)
+        improved = True
+        while improved and time.time() < end_time:
+            improved = False
+            closed = np.flatnonzero(~best[1] & self.can_open)
+            candidates = closed[np.argsort(values[closed] / self.capacities[closed], kind='stable')]
+            moves = [('open', w) for w in candidates[:Config.LAGRANGIAN['CANDIDATES']]] + \
+                [('close', w) for w in np.flatnonzero(best[1])]
+            for move, w in moves:
+                if time.time() >= end_time:
+                    break
+                selection = best[1].copy()
+                selection[w] = move == 'open'
+                if move == 'close':
+                    selection = self._add_capacity(selection, excluded=w)
+                candidate = self.__close_redundant(selection)
+                if candidate is not None and candidate[0] < best[0] - 1e-9 * max(1.0, abs(best[0])):
+                    best, improved = candidate, True
+                    break
+        self.objective, self.selection, self.supply = self.sense * best[0], best[1], best[2]
+
+    def __close_redundant(self, selection):
+        """Assign the townships, then close the open warehouses, most expensive first, while it lowers the objective."""
+        if not self.__holds_demand(selection):
+            return None
+        best = self._evaluate(selection)
+        for w in np.flatnonzero(best[1])[np.argsort(-self.fixed_costs[best[1]], kind='stable')]:
+            selection = best[1].copy()
+            selection[w] = False
+            if self.__holds_demand(selection):
+                candidate = self._evaluate(selection)
+                if candidate[0] < best[0]:
+                    best = candidate
+        return best
+
+    def __holds_demand(self, selection):
+        return self.sense == -1 or self.capacities[selection].sum() >= self.demands.sum()
+
+    def __initial_multipliers(self):
+        """Cost per unit of supply from the cheapest warehouse, including its fixed cost spread over its capacity."""
+        if self.sense == -1 or not self.can_open.any():
+            return np.zeros(len(self.demands))
+        unit_costs = self.unit_costs[self.can_open] + \
+            (self.fixed_costs[self.can_open] / np.maximum(1e-10, self.capacities[self.can_open]))[:, None]
+        return np.maximum(0, unit_costs.min(axis=0))
+
+    def _solve_subproblems(self, multipliers):
+        """
+        Solve the relaxed model for the given multipliers, one fractional knapsack per warehouse.
+
+        Args:
+            multipliers (np.ndarray): Non-negative multiplier per township.
+
+        Returns:
+            tuple: Lagrangian value (minimisation form), each warehouse's value (its cost if opened, opened if
+                negative), the open warehouses and the supply from each warehouse to each township.
+        """
+        reduced_costs = self.unit_costs - self.sense * multipliers
+        supply = np.where(reduced_costs < 0, self.demands, 0)
+
+        # Only the warehouses that cannot supply all their townships of negative reduced cost are sorted
+        over_capacity = np.flatnonzero(supply.sum(axis=1) > self.capacities)
+        if over_capacity.size:
+            costs = reduced_costs[over_capacity]
+            order = np.argsort(costs, axis=1, kind='stable')
+            sorted_demands = self.demands[order]
+            filled_before = np.cumsum(sorted_demands, axis=1) - sorted_demands
+            sorted_supply = np.clip(self.capacities[over_capacity, None] - filled_before, 0, sorted_demands)
+            sorted_supply[np.take_along_axis(costs, order, axis=1) >= 0] = 0
+            warehouse_supply = np.zeros_like(costs)
+            np.put_along_axis(warehouse_supply, order, sorted_supply, axis=1)
+            supply[over_capacity] = warehouse_supply
+
+        values = self.fixed_costs + (reduced_costs * supply).sum(axis=1)
+        opened = (values < 0) & self.can_open
+        supply[~opened] = 0
+        bound = self.sense * (multipliers @ self.demands) + values[opened].sum()
+        return bound, values, opened, supply
+
+    def _repair(self, opened):
+        """
+        Feasible solution from the subproblems' open warehouses.
+
+        Args:
+            opened (np.ndarray): Open warehouses of the subproblems.
+
+        Returns:
+            tuple: See `_evaluate()`.
+        """
+        return self._evaluate(self._add_capacity(opened))
+
+    def _add_capacity(self, selection, excluded=None):
+        """
+        Open warehouses until they hold the demand (scenario 1), each time the one of lowest fixed cost per unit of
+        the capacity still missing, as in the greedy heuristic for covering knapsacks.
+        """
+        selection = selection.copy()
+        can_open = self.can_open.copy()
+        if excluded is not None:
+            can_open[excluded] = False
+        shortfall = self.demands.sum() - self.capacities[selection].sum()
+        while self.sense == 1 and shortfall > 0:
+            candidates = np.flatnonzero(~selection & can_open)
+            if not candidates.size:
+                break
+            w = candidates[np.argmin(self.fixed_costs[candidates] / np.minimum(self.capacities[candidates], shortfall))]
+            selection[w] = True
+            shortfall -= self.capacities[w]
+        return selection
+
+    def _evaluate(self, selection):
+        """
+        Args:
+            selection (np.ndarray): Open warehouses, holding the demand in scenario 1.
+
+        Returns:
+            tuple: Objective (minimisation form), the open warehouses left with supply and the supply from each
+                warehouse to each township.
+        """
+        supply = self._assign(selection)
+        selection = selection & (supply.sum(axis=1) > 0)
+        return self._objective(selection, supply), selection, supply
+
+    def _assign(self, selection):
+        """
+        Assign the townships to the cheapest open warehouses with spare capacity, the townships with the largest regret
+        (extra cost per unit from their second cheapest open warehouse) first.
+        """
+        supply = np.zeros_like(self.unit_costs)
+        spare_capacities = np.where(selection, self.capacities, 0)
+        open_warehouses = np.flatnonzero(selection)
+        sorted_costs = np.sort(self.unit_costs[open_warehouses], axis=0)
+        regrets = sorted_costs[1] - sorted_costs[0] if len(open_warehouses) > 1 else np.zeros(len(self.demands))
+        for t in np.lexsort((-self.demands, -regrets)):
+            costs = self.unit_costs[open_warehouses, t]
+            candidates = open_warehouses[np.argsort(costs, kind='stable')]
+            if self.sense == -1:
+                candidates = candidates[self.unit_costs[candidates, t] < 0]  # Supplying at a loss is optional
+            available = spare_capacities[candidates]
+            assigned = np.clip(self.demands[t] - (np.cumsum(available) - available), 0, available)
+            supply[candidates, t] = assigned
+            spare_capacities[candidates] -= assigned
+        return supply
+
+    def _objective(self, selection, supply, tolerance=1e-6):
+        """Objective (minimisation form) of a feasible solution, with the model's despatcher formulation."""
+        objective = self.fixed_costs[selection].sum() + (self.supply_costs * supply).sum()
+        if self.add_despatcher_hiring_cost:
+            despatchers = hired_despatchers(self.despatcher_rates * supply, self.despatcher_formulation, tolerance)
+            objective += despatchers.sum() * self.despatch_hiring_cost
+        return objective
+
+    def load_solution(self, model):
+        """
+        Set the model's variables to the best feasible solution.
+
+        Args:
+            model (pyo.ConcreteModel): Model built by OptimisationModel on the same snapshot and inputs.
+        """
+        despatchers = self.despatcher_rates * self.supply
+        if self.despatcher_formulation == 'per_arc':
+            despatchers = np.maximum(0, np.ceil(despatchers - 1e-6))
+        for i, w in enumerate(self.warehouse_names):
+            model.x[w].set_value(int(self.selection[i]))
+            for j, t in enumerate(self.township_names):
+                model.x_assign[w, t].set_value(float(self.supply[i, j]))
+                model.n_despatchers[w, t].set_value(float(despatchers[i, j]))
+            if self.despatcher_formulation == 'per_warehouse':
+                model.n_warehouse_despatchers[w].set_value(max(0, int(np.ceil(despatchers[i].sum() - 1e-6))))
+
+
+def distance_array(processed_data):
+    """
+    Args:
+        processed_data (Preprocessing): Input snapshot, or its reduction.
+
+    Returns:
+        np.ndarray: Distance (km) from each warehouse (rows) to each township (columns), at least
+            OptimisationModel.MIN_DISTANCE_KM as in the model.
+    """
+    from src.optimisation_model.model import OptimisationModel
+
+    distance_matrix = processed_data.distance_matrix
+    warehouse_names = [w.name for w in processed_data.warehouse_list]
+    township_names = [t.name for t in processed_data.township_list]
+    return np.maximum(OptimisationModel.MIN_DISTANCE_KM, np.array(
+        [[distance_matrix[w, t] for t in township_names] for w in warehouse_names], dtype=float
+    ).reshape(len(warehouse_names), len(township_names)))
+
+
+def unit_cost_arrays(inputs, distances):
+    """
+    Args:
+        inputs: Optimisation model inputs as attributes, e.g. a LagrangianSolver.
+        distances (np.ndarray): See `distance_array()`.
+
+    Returns:
+        tuple: Despatchers required and delivery cost (0 without add_delivery_cost) per unit of supply from each
+            warehouse to each township.
+    """
+    time_per_delivery = (distances / inputs.delivery_speed) * 2
+    despatcher_rates = time_per_delivery / (inputs.despatch_volume_limit * 30 * inputs.working_hours_per_day)
+    delivery_costs = np.zeros_like(distances)
+    if inputs.add_delivery_cost:
+        delivery_costs += time_per_delivery / inputs.despatch_volume_limit * inputs.cost_of_delivery
+    return despatcher_rates, delivery_costs
+
+
+def hired_despatchers(despatchers, despatcher_formulation, tolerance=1e-6):
+    """
+    Despatchers hired for the despatchers required per warehouse-township pair, by despatcher formulation: rounded up
+    per pair ('per_arc'), per warehouse ('per_warehouse') or not at all ('relaxed').
+
+    Args:
+        despatchers (np.ndarray): Despatchers required, townships in the last axis and warehouses in the one before.
+        despatcher_formulation (str): See OptimisationModel.
+        tolerance (float, optional): Slack before rounding up. Defaults to 1e-6.
+
+    Returns:
+        np.ndarray: Despatchers hired per pair, or per warehouse in the 'per_warehouse' formulation.
+    """
+    if despatcher_formulation == 'per_arc':
+        return np.maximum(0, np.ceil(despatchers - tolerance))
+    if despatcher_formulation == 'per_warehouse':
+        return np.maximum(0, np.ceil(despatchers.sum(axis=-1) - tolerance))
+    return despatchers
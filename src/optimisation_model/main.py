@@ -1,45 +1,141 @@
-from conf import Logger
+import time
+from conf import Config, Logger, Tracer
 from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.presolve import Presolve
+from src.optimisation_model.aggregation import Aggregation
+from src.optimisation_model.decomposition import Decomposition
 from src.optimisation_model.model import OptimisationModel
-from src.optimisation_model.solver import ModelSolver
+from src.optimisation_model.solve_profiles import ProfileSolver
 from src.optimisation_model.postprocessing import Postprocessing
 from src.optimisation_model.mlflow_logger import MLFlowLogger
+from src.optimisation_model.cancellation import CancelToken
 
 _logger = Logger().logger
 
 
-def main(**kwargs):
+def main(processed_data=None, priority=0, deadline=None, cancel_token=None, progress_callback=None, target_gap=None,
+         solve_profile=None, presolve=None, aggregation_nodes=None, decomposition=None, **kwargs):
     """
     This function represents the main entry-point function,
     which does the processing, creates the optimisation model,
     and does the post-processing.
+
+    Args:
+        processed_data (Preprocessing, optional): Pre-loaded input snapshot, e.g. from the API warm-up. It is only
+            read, never modified. Defaults to loading the inputs.
+        priority (int, optional): Solve scheduling priority, higher priorities are solved first. Defaults to 0.
+        deadline (float, optional): Unix time by which the solve must have finished. Defaults to None.
+        cancel_token (CancelToken, optional): Token to cancel the run, checked between stages and while solving.
+            Defaults to a token cancelled by the deadline.
+        progress_callback (callable, optional): Called with the solver's progress events while solving, see
+            ModelSolver. Defaults to None.
+        target_gap (float, optional): Relative gap at which the solver stops with its incumbent. Defaults to the
+            configured ratioGap.
+        solve_profile (str, optional): Latency tier, see Config.SOLVE_PROFILES. Its time budget applies from here,
+            on top of the deadline. Defaults to Config.DEFAULT_SOLVE_PROFILE.
+        presolve (bool, optional): Reduce the warehouses and townships before building the model, see Presolve.
+            Defaults to Config.PRESOLVE['ENABLED'].
+        aggregation_nodes (int, optional): Solve on this many demand nodes aggregated from the townships, see
+            Aggregation. Defaults to Config.AGGREGATION['N_NODES'], None solves on the townships.
+        decomposition (str, optional): Partition ('district' or 'kmeans') to solve in parallel by region before a
+            repair solve, see Decomposition. Defaults to Config.DECOMPOSITION['PARTITION'], None solves the
+            monolithic model.
+        **kwargs: Optimisation model inputs, see OptimisationModel.
     """
-    
-    # process the data using Preprocessing class
-    _logger.debug("[MainPreprocessing] initiated...")
-    processed_data = Preprocessing()
-    _logger.debug("[MainPreprocessing] completed successfully.")
-
-    # build the optimisation model, where objectives and constraints are defined.
-    _logger.debug("[OptimisationModel] initiated...")
-    model_builder = OptimisationModel(processed_data, **kwargs)
-    
-    # get the created model
-    opt_model = model_builder.model
-    
-    # solve the optimisation model
-    model_solver = ModelSolver(opt_model)
-    _logger.debug("[OptimisationModel] completed successfully.")
-
-    # post-processing of the solved model
-    _logger.debug("[PostProcessing] initiated...")
-    post_process_output = Postprocessing(opt_model, model_solver, processed_data, export=True)
-    _logger.debug("[PostProcessing] completed successfully.")
-
-    # logging results to mlflow
-    _logger.debug("[MLFlow Logging] initiated...")
-    MLFlowLogger.log(post_process_output)
-    _logger.debug("[MLFLow Logging] completed successfully.")
+    Config.make_dirs()
+    presolve = Config.PRESOLVE['ENABLED'] if presolve is None else presolve
+    aggregation_nodes = aggregation_nodes or Config.AGGREGATION['N_NODES']
+    decomposition = decomposition or Config.DECOMPOSITION['PARTITION']
+    solve_profile = solve_profile or Config.DEFAULT_SOLVE_PROFILE
+    if solve_profile is not None:
+        budget_deadline = time.time() + ProfileSolver.get_profile(solve_profile)['TIME_BUDGET_SECONDS']
+        deadline = min(deadline, budget_deadline) if deadline is not None else budget_deadline
+    cancel_token = cancel_token or CancelToken(deadline=deadline)
+    cancel_token.deadline = deadline if deadline is not None else cancel_token.deadline
+
+    with Tracer.span('main', solve_profile=solve_profile, presolve=presolve, aggregation_nodes=aggregation_nodes,
+                     decomposition=decomposition, **kwargs):
+
+        # process the data using Preprocessing class
+        _logger.debug("[MainPreprocessing] initiated...")
+        with Tracer.span('preprocessing', preloaded=processed_data is not None) as span:
+            if processed_data is None:
+                processed_data = Preprocessing()
+            span.set_attributes(W=len(processed_data.warehouse_df), T=len(processed_data.township_df))
+        _logger.debug("[MainPreprocessing] completed successfully.")
+
+        # reduce the warehouses and townships, results are mapped back in Postprocessing
+        if presolve:
+            with Tracer.span('presolve') as span:
+                processed_data = Presolve(
+                    processed_data, add_delivery_time_constraint=kwargs.get('add_delivery_time_constraint'),
+                    delivery_speed=kwargs.get('delivery_speed'),
+                    maximum_delivery_hrs_constraint=kwargs.get('maximum_delivery_hrs_constraint'),
+                )
+                span.set_attributes(**processed_data.summary)
+
+        # aggregate the townships into demand nodes, the model is solved on the nodes
+        aggregation = None
+        if aggregation_nodes is not None and aggregation_nodes < len(processed_data.township_list):
+            with Tracer.span('aggregation', n_nodes=aggregation_nodes):
+                processed_data = aggregation = Aggregation(processed_data, aggregation_nodes)
+
+        # solve the regions in parallel, the model built below is the repair solve over the warehouses they selected
+        if decomposition is not None:
+            with Tracer.span('decomposition', partition=decomposition) as span:
+                processed_data = Decomposition(processed_data, decomposition, model_inputs=kwargs, deadline=deadline,
+                                               cancel_token=cancel_token)
+                span.set_attributes(**{k: v for k, v in processed_data.report.items() if k != 'regions'})
+
+        # build the optimisation model, where objectives and constraints are defined.
+        _logger.debug("[OptimisationModel] initiated...")
+        with Tracer.span('model_build') as span:
+            model_builder = OptimisationModel(processed_data, **kwargs)
+
+            # get the created model
+            opt_model = model_builder.model
+            span.set_attributes(n_variables=opt_model.nvariables(), n_constraints=opt_model.nconstraints())
+
+        try:
+            # solve the optimisation model
+            with Tracer.span('solve') as span:
+                model_solver = ProfileSolver(opt_model, solve_profile=solve_profile, priority=priority,
+                                             deadline=deadline, cancel_token=cancel_token,
+                                             progress_callback=progress_callback, target_gap=target_gap,
+                                             model_builder=model_builder)
+                span.set_attributes(
+                    gap=model_solver.gap,
+                    threads=model_solver.threads,
+                    queue_seconds=model_solver.queue_seconds,
+                    solver_status=str(model_solver.results.solver.status),
+                    termination_condition=str(model_solver.results.solver.termination_condition),
+                )
+            # rounding to whole despatchers per warehouse-township pair, compared with the formulation's objective
+            model_solver.solve_summary.update(model_builder.round_despatchers())
+
+            # disaggregating the demand nodes' supply back to the townships
+            if aggregation is not None:
+                cancel_token.raise_if_cancelled()
+                with Tracer.span('disaggregation') as span:
+                    span.set_attributes(**aggregation.disaggregate(model_builder, cancel_token=cancel_token))
+            _logger.debug("[OptimisationModel] completed successfully.")
+
+            # post-processing of the solved model
+            cancel_token.raise_if_cancelled()
+            _logger.debug("[PostProcessing] initiated...")
+            with Tracer.span('postprocessing'):
+                post_process_output = Postprocessing(opt_model, model_solver, processed_data, export=True)
+            _logger.debug("[PostProcessing] completed successfully.")
+
+            # logging results to mlflow
+            cancel_token.raise_if_cancelled()
+            _logger.debug("[MLFlow Logging] initiated...")
+            with Tracer.span('mlflow_logging'):
+                MLFlowLogger.log(post_process_output)
+            _logger.debug("[MLFLow Logging] completed successfully.")
+        finally:
+            # The results have been extracted from the model, which is reset and reused by later runs
+            model_builder.release()
 
     return post_process_output
 
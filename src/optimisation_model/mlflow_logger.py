@@ -1,4 +1,3 @@
-import mlflow
 import shutil
 import inspect
 import collections
@@ -6,16 +5,25 @@ from conf import Config
 from pathlib import Path
 from src.data_connectors import PandasFileConnector
 
-mlflow.set_tracking_uri(Config.MLFLOW["TRACKING_URI"])  # Setting location to save models
-mlflow.set_experiment(Config.MLFLOW["EXPERIMENT_NAME"])
-
 
 class MLFlowLogger:
 
+    _mlflow = None
+
+    @classmethod
+    def _get_mlflow(cls):
+        # Importing and configuring mlflow on first use, as it is slow to import and not needed to start the API
+        if cls._mlflow is None:
+            import mlflow
+            mlflow.set_tracking_uri(Config.MLFLOW["TRACKING_URI"])  # Setting location to save models
+            mlflow.set_experiment(Config.MLFLOW["EXPERIMENT_NAME"])
+            cls._mlflow = mlflow
+        return cls._mlflow
+
     @classmethod
     def log(cls, post_process_output):
 
-        with mlflow.start_run():
+        with cls._get_mlflow().start_run():
             cls.__log_config()
             cls.__log_opt_model(post_process_output)
 
@@ -48,10 +56,39 @@ class MLFlowLogger:
         PandasFileConnector.save(despatchers_data,
                             Path(artifact_folder, "despatchers_data.csv"))
 
+        # Solver statistics parsed from the solver log
+        solver_statistics = getattr(post_process_output, 'solver_statistics', {})
+        params_results_dict.update({f"solver_statistics_{k}": v for k, v in solver_statistics.items()
+                                    if isinstance(v, str)})
+        metrics_results_dict.update({f"solver_statistics_{k}": v for k, v in solver_statistics.items()
+                                     if isinstance(v, (int, float))})
+
+        # Solve summary, incl. the despatcher formulation's objective difference
+        solve_summary = getattr(post_process_output, 'solve_summary', None) or {}
+        params_results_dict.update({f"solve_summary_{k}": v for k, v in solve_summary.items() if isinstance(v, str)})
+        metrics_results_dict.update({f"solve_summary_{k}": v for k, v in solve_summary.items()
+                                     if isinstance(v, (int, float))})
+
+        # Presolve reduction counts
+        presolve_reductions = getattr(post_process_output, 'presolve_reductions', None) or {}
+        metrics_results_dict.update({f"presolve_{k}": v for k, v in presolve_reductions.get('summary', {}).items()})
+
+        # Demand aggregation error
+        aggregation_report = getattr(post_process_output, 'aggregation_report', None) or {}
+        metrics_results_dict.update({f"aggregation_{k}": v for k, v in aggregation_report.items()})
+
+        # Decomposition timings
+        decomposition_report = getattr(post_process_output, 'decomposition_report', None) or {}
+        metrics_results_dict.update({f"decomposition_{k}": v for k, v in decomposition_report.items()
+                                     if isinstance(v, (int, float))})
+
         # Logging to mlflow
+        mlflow = cls._get_mlflow()
         mlflow.log_params(params_results_dict)
         mlflow.log_metrics(metrics_results_dict)
         mlflow.log_artifacts(artifact_folder, artifact_path='postprocessing')
+        for log_path in getattr(post_process_output.solver_results, 'log_paths', []):
+            mlflow.log_artifact(str(log_path), artifact_path='solver_logs')
 
         shutil.rmtree(artifact_folder)  # Deleting temp folder
 
@@ -66,14 +103,15 @@ class MLFlowLogger:
         # List of attributes that we want to log
         log_attributes = [
             'NAME', 'OPTIMISATION_MODEL_CONFIG', 'OPTIMISATION_SCENARIO', 'ADD_DELIVERY_TIME_CONSTRAINT',
-            'ADD_DESPATCHER_CONSTRAINT', 'OPT_PARAMS'
+            'ADD_DESPATCHER_CONSTRAINT', 'OPT_PARAMS', 'DESPATCHER_FORMULATION', 'PRESOLVE',
+            'AGGREGATION', 'DECOMPOSITION'
         ]
 
         # Subsetting the list of attributes
         attributes = {k: v for k, v in attributes.items() if k in log_attributes}
         attributes = cls.flatten(attributes)
 
-        mlflow.log_params(attributes)
+        cls._get_mlflow().log_params(attributes)
 
     @classmethod
     def flatten(cls, d, parent_key='', sep='_'):
@@ -1,27 +1,40 @@
+import math
 import pyomo.environ as pyo
 from conf import Config, Logger
-from haversine import haversine
 from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.model_cache import ModelCache
 
 
 class OptimisationModel(object):
     """
     This class defines the optimisation model objectives
     and its associated constraints.
+
+    The model structure only depends on the input data, the scenario and the objective/constraint toggles. The scalar
+    coefficients are mutable parameters, so built models are cached (see ModelCache) and reused with the coefficients
+    of later runs. Call `release()` once the run no longer uses the model.
     """
+
+    # Scalar coefficients, set as mutable parameters of the same name
+    SCALAR_COEFFICIENTS = [
+        'despatch_hiring_cost', 'delivery_speed', 'despatch_volume_limit', 'cost_of_delivery', 'working_hours_per_day',
+        'maximum_delivery_hrs_constraint', 'profit_per_sales_volume',
+    ]
+    MIN_DISTANCE_KM = 15  # Warehouse-township distances are at least this
     
     def __init__(
         self, processed_data: Preprocessing, optimisation_scenario: int = None, 
         add_delivery_time_constraint: bool = None, add_despatcher_hiring_cost: bool = None,
         add_delivery_cost: bool = None, despatch_hiring_cost: float = None, delivery_speed: float = None,
         despatch_volume_limit: float = None, cost_of_delivery: float = None, working_hours_per_day: float = None,
-        maximum_delivery_hrs_constraint: float = None, profit_per_sales_volume: float = None
+        maximum_delivery_hrs_constraint: float = None, profit_per_sales_volume: float = None,
+        despatcher_formulation: str = None
     ):
         """
         Initialisation
 
         Args:
-            processed_data (Preprocessing): Preprocessing class
+            processed_data (Preprocessing): Preprocessing class, or its reduction by Presolve
             optimisation_scenario (int, optional): Optimisation scenario to run. Defaults to Config setting.
             add_delivery_time_constraint (bool, optional): Whether to add delivery time constraint or not. 
                 Defaults to Config setting.
@@ -36,6 +49,9 @@ class OptimisationModel(object):
             maximum_delivery_hrs_constraint (float, optional): Maximum limit within which deliveries must be made to 
                 customers (hrs). Defaults to Config setting.
             profit_per_sales_volume (float, optional): Profit made per sales (RM/ft3). Defaults to Config setting.
+            despatcher_formulation (str, optional): 'per_arc' (integer despatchers per warehouse-township pair),
+                'per_warehouse' (integer despatchers per warehouse, continuous per pair) or 'relaxed' (continuous
+                despatchers, rounded up per pair after solving, see `round_despatchers()`). Defaults to Config setting.
         """
         self._logger = Logger().logger
         self.processed_data = processed_data
@@ -51,6 +67,10 @@ class OptimisationModel(object):
         self.working_hours_per_day = working_hours_per_day or Config.OPT_PARAMS['working_hours_per_day']
         self.maximum_delivery_hrs_constraint = maximum_delivery_hrs_constraint or Config.OPT_PARAMS['maximum_delivery_hrs_constraint']
         self.profit_per_sales_volume = profit_per_sales_volume or Config.OPT_PARAMS['profit_per_sales_volume']
+        self.despatcher_formulation = despatcher_formulation or Config.DESPATCHER_FORMULATION
+        if self.despatcher_formulation not in Config.DESPATCHER_FORMULATIONS:
+            raise ValueError(f"Unknown despatcher formulation '{self.despatcher_formulation}', choose from "
+                             f"{Config.DESPATCHER_FORMULATIONS}.")
 
         self._logger.info(
             f"[OptimisationModel] Initialised | optimisation_scenario: {self.optimisation_scenario} | "
@@ -61,12 +81,38 @@ class OptimisationModel(object):
             f"despatch_volume_limit: {self.despatch_volume_limit} | cost_of_delivery: {self.cost_of_delivery} | "
             f"working_hours_per_day: {self.working_hours_per_day} | "
             f"maximum_delivery_hrs_constraint: {self.maximum_delivery_hrs_constraint} | "
-            f"profit_per_sales_volume: {self.profit_per_sales_volume}"
+            f"profit_per_sales_volume: {self.profit_per_sales_volume} | "
+            f"despatcher_formulation: {self.despatcher_formulation}"
         )
 
+        self.model = ModelCache.acquire(self.structure, self.__new_model)
+        self.__set_coefficients()
+
+    def release(self):
+        """Hand the model back to the ModelCache for later runs with the same structure."""
+        ModelCache.release(self.structure, self.model)
+
+    @property
+    def structure(self):
+        """Inputs determining the model structure, i.e. its sets, variables, constraints and objective terms."""
+        return {
+            'data_fingerprint': self.processed_data.data_fingerprint,
+            'optimisation_scenario': self.optimisation_scenario,
+            'add_delivery_time_constraint': bool(self.add_delivery_time_constraint),
+            'add_despatcher_hiring_cost': bool(self.add_despatcher_hiring_cost),
+            'add_delivery_cost': bool(self.add_delivery_cost),
+            'despatcher_formulation': self.despatcher_formulation,
+        }
+
+    def __new_model(self):
         self.model = pyo.ConcreteModel()
         self.model.optimised = False
         self.__build_model()
+        return self.model
+
+    def __set_coefficients(self):
+        for coefficient in self.SCALAR_COEFFICIENTS:
+            getattr(self.model, coefficient).set_value(getattr(self, coefficient))
 
     def __build_model(self):
 
@@ -98,14 +144,14 @@ class OptimisationModel(object):
         # Warehouse-Township distances
         self.model.w_t_distance = pyo.Param(
             self.model.W, self.model.T,
-            initialize={
-                (w.name, t.name): max(15, haversine((w.latitude, w.longitude), (t.latitude, t.longitude)))
-                for t in self.processed_data.township_list
-                for w in self.processed_data.warehouse_list
-            },
+            initialize={k: max(self.MIN_DISTANCE_KM, v) for k, v in self.processed_data.distance_matrix.items()},
             domain=pyo.Any
         )
 
+        # Scalar coefficients
+        for coefficient in self.SCALAR_COEFFICIENTS:
+            setattr(self.model, coefficient, pyo.Param(initialize=getattr(self, coefficient), mutable=True))
+
         self._logger.info("[OptimisationModel] Defining model parameters completed successfully.")
 
         # ================================================================================
@@ -119,9 +165,15 @@ class OptimisationModel(object):
         # Warehouse-township assignment
         self.model.x_assign = pyo.Var(self.model.W, self.model.T, domain=pyo.NonNegativeReals)
         
-        # Number of despatchers assigned to township t from warehouse w
-        self.model.n_despatchers_real = pyo.Var(self.model.W, self.model.T, domain=pyo.NonNegativeReals)
-        self.model.n_despatchers = pyo.Var(self.model.W, self.model.T, domain=pyo.NonNegativeIntegers)
+        # Number of despatchers assigned to township t from warehouse w, only integer in the per-arc formulation
+        if self.despatcher_formulation == 'per_arc':
+            self.model.n_despatchers = pyo.Var(self.model.W, self.model.T, domain=pyo.NonNegativeIntegers)
+        else:
+            self.model.n_despatchers = pyo.Var(self.model.W, self.model.T, domain=pyo.NonNegativeReals)
+
+        # Number of despatchers hired by warehouse w, serving all its townships
+        if self.despatcher_formulation == 'per_warehouse':
+            self.model.n_warehouse_despatchers = pyo.Var(self.model.W, domain=pyo.NonNegativeIntegers)
 
         self._logger.info("[OptimisationModel] Defining model decision variables completed successfully.")
         
@@ -130,9 +182,9 @@ class OptimisationModel(object):
         # ================================================================================
         self._logger.debug("[OptimisationModel] Defining model objective function initiated...")
         if self.optimisation_scenario == 1:
-            self.model.obj = pyo.Objective(rule=self.cost_minimisation_objective, sense=pyo.minimize)
+            self.model.obj = pyo.Objective(expr=self.cost_minimisation_objective(self.model), sense=pyo.minimize)
         elif self.optimisation_scenario == 2:
-            self.model.obj = pyo.Objective(rule=self.profit_maximisation_objective, sense=pyo.maximize)
+            self.model.obj = pyo.Objective(expr=self.profit_maximisation_objective(self.model), sense=pyo.maximize)
         self._logger.info("[OptimisationModel] Defining model objective function completed successfully.")
 
         # set Constraints
@@ -163,6 +215,11 @@ class OptimisationModel(object):
         self.model.despatcher_requirement_constraint = pyo.ConstraintList()
         self.__despatcher_requirement_constraint()
 
+        # Despatchers hired per warehouse, covering the despatchers required by all its townships
+        if self.despatcher_formulation == 'per_warehouse':
+            self.model.warehouse_despatchers_constraint = pyo.ConstraintList()
+            self.__warehouse_despatchers_constraint()
+
         # Delivery speed constraint
         if self.add_delivery_time_constraint:
             self.model.delivery_time_constraint = pyo.ConstraintList()
@@ -178,35 +235,17 @@ class OptimisationModel(object):
             model (pyo.ConcreteModel): Model constructed from pyomo.
         """
         
-        monthly_warehouse_cost = 0
-        monthly_despatcher_hiring_cost = 0
-        monthly_delivery_travel_cost = 0
-
         # Warehouse Costs
-        for w in model.W:
-            monthly_warehouse_cost += model.x[w] * model.w_cost[w]
-        total_cost = monthly_warehouse_cost
+        total_cost = self.warehouse_cost(model)
 
         # Despatcher hiring costs
         if self.add_despatcher_hiring_cost:
-            for w in model.W:
-                for t in model.T:
-                    monthly_despatcher_hiring_cost += \
-                        model.n_despatchers[w, t] * self.despatch_hiring_cost
+            monthly_despatcher_hiring_cost = self.despatcher_hiring_cost(model)
             total_cost += monthly_despatcher_hiring_cost
 
         # Delivery/travelling cost
         if self.add_delivery_cost:
-            for w in model.W:
-                for t in model.T:
-                    # Time to complete a delivery (to-and-fro)
-                    time_per_delivery = (model.w_t_distance[w, t] / self.delivery_speed) * 2
-                    # Delivery trips required
-                    n_delivery_trips = model.x_assign[w, t] / self.despatch_volume_limit
-                    # Total cost of delivery
-                    monthly_delivery_travel_cost += \
-                        n_delivery_trips * time_per_delivery * self.cost_of_delivery
-            total_cost += monthly_delivery_travel_cost
+            total_cost += self.delivery_cost(model)
 
         return total_cost
         
@@ -218,47 +257,132 @@ class OptimisationModel(object):
             model (pyo.ConcreteModel): Model constructed from pyomo.
         """
         
-        monthly_warehouse_cost = 0
-        monthly_despatcher_hiring_cost = 0
-        monthly_delivery_travel_cost = 0
-        sales_revenue = 0 
-
         # Warehouse Costs
-        for w in model.W:
-            monthly_warehouse_cost += model.x[w] * model.w_cost[w]
-        total_cost = monthly_warehouse_cost
+        total_cost = self.warehouse_cost(model)
 
         # Despatcher hiring costs
         if self.add_despatcher_hiring_cost:
-            for w in model.W:
-                for t in model.T:
-                    monthly_despatcher_hiring_cost += \
-                        model.n_despatchers[w, t] * self.despatch_hiring_cost
+            monthly_despatcher_hiring_cost = self.despatcher_hiring_cost(model)
             total_cost += monthly_despatcher_hiring_cost
 
         # Delivery/travelling cost
         if self.add_delivery_cost:
-            for w in model.W:
-                for t in model.T:
-                    # Time to complete a delivery (to-and-fro)
-                    time_per_delivery = (model.w_t_distance[w, t] / self.delivery_speed) * 2
-                    # Delivery trips required
-                    n_delivery_trips = model.x_assign[w, t] / self.despatch_volume_limit
-                    # Total cost of delivery
-                    monthly_delivery_travel_cost += \
-                        n_delivery_trips * time_per_delivery * self.cost_of_delivery
-            total_cost += monthly_delivery_travel_cost
+            total_cost += self.delivery_cost(model)
 
         # Adding sales revenue
-        for w in model.W:
-            for t in model.T:
-                sales_revenue += model.x_assign[w, t] * self.profit_per_sales_volume
-
-        total_revenue = sales_revenue
+        total_revenue = self.sales_revenue(model)
         total_profit = total_revenue - total_cost
         
         return total_profit
-           
+
+    @staticmethod
+    def warehouse_cost(model):
+        """
+        Monthly cost of the selected warehouses.
+
+        Args:
+            model (pyo.ConcreteModel): Model constructed from pyomo.
+        """
+        return pyo.quicksum(model.x[w] * model.w_cost[w] for w in model.W)
+
+    @staticmethod
+    def delivery_cost(model):
+        """
+        Monthly delivery/travelling cost.
+
+        Args:
+            model (pyo.ConcreteModel): Model constructed from pyomo.
+        """
+        monthly_delivery_travel_cost = 0
+        for w in model.W:
+            for t in model.T:
+                # Time to complete a delivery (to-and-fro)
+                time_per_delivery = (model.w_t_distance[w, t] / model.delivery_speed) * 2
+                # Delivery trips required
+                n_delivery_trips = model.x_assign[w, t] / model.despatch_volume_limit
+                # Total cost of delivery
+                monthly_delivery_travel_cost += \
+                    n_delivery_trips * time_per_delivery * model.cost_of_delivery
+        return monthly_delivery_travel_cost
+
+    @staticmethod
+    def sales_revenue(model):
+        """
+        Monthly sales revenue of the supplied volume.
+
+        Args:
+            model (pyo.ConcreteModel): Model constructed from pyomo.
+        """
+        return pyo.quicksum(model.x_assign[w, t] * model.profit_per_sales_volume for w in model.W for t in model.T)
+
+    def despatcher_hiring_cost(self, model):
+        """
+        Monthly despatcher hiring cost, for the despatchers per warehouse in the per-warehouse formulation.
+
+        Args:
+            model (pyo.ConcreteModel): Model constructed from pyomo.
+        """
+        if self.despatcher_formulation == 'per_warehouse':
+            return pyo.quicksum(model.n_warehouse_despatchers[w] for w in model.W) * model.despatch_hiring_cost
+        return pyo.quicksum(model.n_despatchers[w, t] for w in model.W for t in model.T) * model.despatch_hiring_cost
+
+    def round_despatchers(self, tolerance=1e-6):
+        """
+        Round the solved despatchers per warehouse-township pair up to whole despatchers, which keeps the solution
+        feasible for the per-arc formulation, and compare the objectives. The per-warehouse and relaxed formulations
+        relax the per-arc one, so their objective bounds the exact per-arc optimum, and the difference bounds how far
+        the rounded solution can be from it.
+
+        Args:
+            tolerance (float, optional): Values within this of a whole number are rounded to it. Defaults to 1e-6.
+
+        Returns:
+            dict: despatcher_formulation, formulation_objective (as solved), per_arc_objective (of the rounded
+                solution), objective_difference and relative_objective_difference.
+        """
+        formulation_objective = pyo.value(self.model.obj)
+        hiring_cost = pyo.value(self.despatcher_hiring_cost(self.model)) if self.add_despatcher_hiring_cost else 0
+
+        if self.despatcher_formulation != 'per_arc':
+            for despatchers in self.model.n_despatchers.values():
+                despatchers.set_value(max(0, math.ceil((despatchers.value or 0) - tolerance)))
+
+        per_arc_objective = formulation_objective
+        if self.add_despatcher_hiring_cost:
+            per_arc_hiring_cost = sum(despatchers.value for despatchers in self.model.n_despatchers.values()) * \
+                pyo.value(self.model.despatch_hiring_cost)
+            sense = 1 if self.optimisation_scenario == 1 else -1  # Costs are subtracted from the profit
+            per_arc_objective += sense * (per_arc_hiring_cost - hiring_cost)
+
+        objective_difference = per_arc_objective - formulation_objective
+        summary = {
+            'despatcher_formulation': self.despatcher_formulation,
+            'formulation_objective': formulation_objective,
+            'per_arc_objective': per_arc_objective,
+            'objective_difference': objective_difference,
+            'relative_objective_difference': abs(objective_difference) / max(1e-10, abs(per_arc_objective)),
+        }
+        self._logger.info(f"[OptimisationModel] Despatchers rounded: {summary}")
+        return summary
+
+    def cost_components(self):
+        """
+        Objective terms of the solved model.
+
+        Returns:
+            dict: warehouse_cost, despatcher_hiring_cost and delivery_cost (0 when not part of the objective), and the
+                sales_revenue in scenario 2.
+        """
+        components = {
+            'warehouse_cost': pyo.value(self.warehouse_cost(self.model)),
+            'despatcher_hiring_cost':
+                pyo.value(self.despatcher_hiring_cost(self.model)) if self.add_despatcher_hiring_cost else 0,
+            'delivery_cost': pyo.value(self.delivery_cost(self.model)) if self.add_delivery_cost else 0,
+        }
+        if self.optimisation_scenario == 2:
+            components['sales_revenue'] = pyo.value(self.sales_revenue(self.model))
+        return components
+
     @property
     def optimisation_model(self):
         return self.model
@@ -306,17 +430,27 @@ class OptimisationModel(object):
         for w in self.model.W:
             for t in self.model.T:
                 # Time to complete a delivery (to-and-fro)
-                time_per_delivery = (self.model.w_t_distance[w, t] / self.delivery_speed) * 2
+                time_per_delivery = (self.model.w_t_distance[w, t] / self.model.delivery_speed) * 2
                 # Frequency of deliveries in a month
-                monthly_delivery_freq = 30 * self.working_hours_per_day / time_per_delivery
+                monthly_delivery_freq = 30 * self.model.working_hours_per_day / time_per_delivery
                 # Minimum required despatchers
                 min_required_despatchers = \
-                    self.model.x_assign[w, t] / (self.despatch_volume_limit * monthly_delivery_freq)
+                    self.model.x_assign[w, t] / (self.model.despatch_volume_limit * monthly_delivery_freq)
                 # Constraint
                 self.model.despatcher_requirement_constraint.add(
                     self.model.n_despatchers[w, t] >= min_required_despatchers
                 )
 
+    def __warehouse_despatchers_constraint(self):
+        """
+        Despatchers hired by each warehouse must cover the (fractional) despatchers required for its townships.
+        """
+        for w in self.model.W:
+            self.model.warehouse_despatchers_constraint.add(
+                self.model.n_warehouse_despatchers[w] >=
+                pyo.quicksum(self.model.n_despatchers[w, t] for t in self.model.T)
+            )
+
     def __delivery_time_constraint(self):
         """
         All deliveries should be completed within the time constraint given.
@@ -324,6 +458,6 @@ class OptimisationModel(object):
         for w in self.model.W:
             for t in self.model.T:
                 self.model.delivery_time_constraint.add(
-                    (self.model.w_t_distance[w, t] / self.delivery_speed) * self.model.x[w] <=
-                    self.maximum_delivery_hrs_constraint
+                    (self.model.w_t_distance[w, t] / self.model.delivery_speed) * self.model.x[w] <=
+                    self.model.maximum_delivery_hrs_constraint
                 )
@@ -0,0 +1,162 @@
+"""
+Cache of built optimisation models.
+
+Building OptimisationModel is repeated for every run although the model structure only depends on the input data,
+the scenario and the objective/constraint toggles (see OptimisationModel.structure), while the scalar coefficients
+are mutable parameters. Built models are kept per structure once their run has finished, reset (values cleared,
+variables unfixed, constraints reactivated) and handed to the next run with the same structure, which only sets its
+coefficients. Each model is used by one run at a time, concurrent runs of the same structure get a model each.
+
+The cache is held in memory: pickled pyomo models take as long to load as to build, so there is nothing to gain from
+keeping them on disk. Under gunicorn's preload the API warm-up builds the default model in the master process, so
+forked workers start with it. The least recently used structures are evicted beyond Config.MODEL_CACHE
+['MAX_ELEMENTS'] variables and constraints.
+"""
+
+import gc
+import time
+import threading
+import pyomo.environ as pyo
+from collections import OrderedDict
+from contextlib import contextmanager
+from conf import Config, Logger
+
+
+@contextmanager
+def gc_paused():
+    """Pause the cyclic garbage collector, which otherwise runs many times over the objects of a model being built."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class _CachedModels:
+
+    def __init__(self, n_elements, build_seconds):
+        self.idle_models = []
+        self.n_elements = n_elements  # Variables and constraints per model
+        self.build_seconds = build_seconds
+        self.hits = 0
+
+
+class ModelCache:
+
+    _logger = Logger().logger
+    _lock = threading.Lock()
+    _entries = OrderedDict()  # Structure key -> _CachedModels, least recently used first
+    _stats = dict(hits=0, misses=0, evictions=0, build_seconds=0.0, seconds_saved=0.0)
+
+    @classmethod
+    def acquire(cls, structure, build_function):
+        """
+        Return an idle model of the structure, or build one. The model is not handed to other runs until released.
+
+        Args:
+            structure (dict): JSON-serialisable inputs determining the model structure.
+            build_function (callable): Function returning a newly built model.
+
+        Returns:
+            pyo.ConcreteModel: Model with its variable values cleared.
+        """
+        structure_key = cls.structure_key(structure)
+        with cls._lock:
+            entry = cls._entries.get(structure_key) if Config.MODEL_CACHE['ENABLED'] else None
+            if entry is not None and entry.idle_models:
+                cls._entries.move_to_end(structure_key)
+                entry.hits += 1
+                cls._stats['hits'] += 1
+                cls._stats['seconds_saved'] += entry.build_seconds
+                cls._logger.info(f"[ModelCache] Cache hit, reusing model (built in {entry.build_seconds:.2f}s).")
+                return entry.idle_models.pop()
+
+        start_time = time.perf_counter()
+        with gc_paused():
+            model = build_function()
+        build_seconds = time.perf_counter() - start_time
+        with cls._lock:
+            cls._stats['misses'] += 1
+            cls._stats['build_seconds'] += build_seconds
+        cls._logger.info(f"[ModelCache] Cache miss, model built in {build_seconds:.2f}s.")
+        model.cache_build_seconds = build_seconds
+        return model
+
+    @classmethod
+    def release(cls, structure, model):
+        """
+        Reset a model acquired for the structure and keep it for the next run, evicting the least recently used
+        structures beyond Config.MODEL_CACHE['MAX_ELEMENTS'].
+
+        Args:
+            structure (dict): Structure the model was acquired for.
+            model (pyo.ConcreteModel): Model, no longer used by its run.
+        """
+        if not Config.MODEL_CACHE['ENABLED']:
+            return
+        cls._reset(model)
+        structure_key = cls.structure_key(structure)
+        with cls._lock:
+            entry = cls._entries.get(structure_key)
+            if entry is None:
+                entry = cls._entries[structure_key] = _CachedModels(
+                    n_elements=model.nvariables() + model.nconstraints(), build_seconds=model.cache_build_seconds
+                )
+            if len(entry.idle_models) < Config.MODEL_CACHE['MAX_MODELS_PER_STRUCTURE']:
+                entry.idle_models.append(model)
+            cls._entries.move_to_end(structure_key)
+            cls._evict()
+
+    @classmethod
+    def stats(cls):
+        """
+        Cache statistics of this process: hits, misses, evictions, total build seconds and build seconds saved by the
+        hits, number of structures and models cached and their variables and constraints, with one line per
+        structure.
+        """
+        with cls._lock:
+            structures = [
+                dict(structure_key=structure_key, n_models=len(entry.idle_models), n_elements=entry.n_elements,
+                     build_seconds=entry.build_seconds, hits=entry.hits)
+                for structure_key, entry in reversed(cls._entries.items())
+            ]
+            return dict(
+                cls._stats,
+                n_structures=len(structures),
+                n_models=sum(structure['n_models'] for structure in structures),
+                n_elements=sum(structure['n_models'] * structure['n_elements'] for structure in structures),
+                max_elements=Config.MODEL_CACHE['MAX_ELEMENTS'],
+                structures=structures,
+            )
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+
+    @staticmethod
+    def structure_key(structure):
+        return tuple(sorted(structure.items()))
+
+    @staticmethod
+    def _reset(model):
+        """Undo what a run changes on the model: variable values and fixings and deactivated constraints."""
+        for var in model.component_data_objects(pyo.Var):
+            var.unfix()
+            var.value = None
+        for constraint in model.component_data_objects(pyo.Constraint):
+            if not constraint.active:
+                constraint.activate()
+        model.optimised = False
+
+    @classmethod
+    def _evict(cls):
+        n_elements = sum(len(entry.idle_models) * entry.n_elements for entry in cls._entries.values())
+        while n_elements > Config.MODEL_CACHE['MAX_ELEMENTS'] and cls._entries:
+            structure_key, entry = cls._entries.popitem(last=False)
+            n_elements -= len(entry.idle_models) * entry.n_elements
+            cls._stats['evictions'] += len(entry.idle_models)
+            cls._logger.debug("[ModelCache] Evicted %s model(s) of %s elements.", len(entry.idle_models),
+                              entry.n_elements)
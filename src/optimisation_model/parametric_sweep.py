@@ -0,0 +1,200 @@
+"""
+Parametric sweep of the model along one scalar coefficient (Config.PARAMETRIC_SWEEP['PARAMETERS']).
+
+The model is built once, the coefficient being a mutable parameter, and solved at INITIAL_POINTS evenly spaced values,
+each solve warm started from the previous solution. Intervals whose ends select different warehouses are then bisected,
+depth-first so that each solve is warm started from a neighbouring value, until the breakpoint is located within
+TOLERANCE of the range. Intervals whose ends select the same warehouses are not bisected: a selection changing and
+changing back within one interval is only found if the initial points split it.
+
+The result is piecewise: the breakpoints, and per interval between them its warehouse selection and the objective
+and cost components at the values solved within it.
+"""
+
+import math
+import pyomo.environ as pyo
+from conf import Config, Logger, Tracer
+from src.optimisation_model.preprocessing import Preprocessing
+from src.optimisation_model.presolve import Presolve
+from src.optimisation_model.model import OptimisationModel
+from src.optimisation_model.solver import ModelSolver
+
+# Coefficients the presolve depends on when the delivery time constraint is added
+PRESOLVE_PARAMETERS = ['delivery_speed', 'maximum_delivery_hrs_constraint']
+
+
+class ParametricSweep:
+
+    def __init__(self, parameter: str, start: float, stop: float, processed_data: Preprocessing = None,
+                 presolve: bool = None, priority=0, deadline=None, cancel_token=None, tolerance: float = None,
+                 max_solves: int = None, **model_inputs):
+        """
+        Initialisation, which runs the sweep.
+
+        Args:
+            parameter (str): Coefficient to sweep, see Config.PARAMETRIC_SWEEP['PARAMETERS'].
+            start (float): First value of the coefficient.
+            stop (float): Last value of the coefficient.
+            processed_data (Preprocessing, optional): Pre-loaded input snapshot. Defaults to loading the inputs.
+            presolve (bool, optional): Reduce the warehouses and townships first, see Presolve. Skipped when the
+                presolve depends on the swept coefficient. Defaults to Config.PRESOLVE['ENABLED'].
+            priority (int, optional): Solve scheduling priority. Defaults to 0.
+            deadline (float, optional): Unix time by which the sweep must have finished. Defaults to None.
+            cancel_token (CancelToken, optional): Checked before and during each solve. Defaults to None.
+            tolerance (float, optional): Width, as a fraction of the range, within which breakpoints are located.
+                Defaults to Config.PARAMETRIC_SWEEP['TOLERANCE'].
+            max_solves (int, optional): Bisection stops after this many solves, leaving wider brackets around the
+                remaining breakpoints. Defaults to Config.PARAMETRIC_SWEEP['MAX_SOLVES'].
+            **model_inputs: Other optimisation model inputs, see OptimisationModel.
+
+        Raises:
+            ValueError: Unknown parameter or empty range.
+        """
+        self._logger = Logger().logger
+        if parameter not in Config.PARAMETRIC_SWEEP['PARAMETERS']:
+            raise ValueError(f"Unknown sweep parameter '{parameter}', choose from "
+                             f"{Config.PARAMETRIC_SWEEP['PARAMETERS']}.")
+        if not start < stop:
+            raise ValueError(f"Sweep start ({start}) must be below its stop ({stop}).")
+        self.parameter = parameter
+        self.start = start
+        self.stop = stop
+        self.priority = priority
+        self.deadline = deadline
+        self.cancel_token = cancel_token
+        self.tolerance = (tolerance or Config.PARAMETRIC_SWEEP['TOLERANCE']) * (stop - start)
+        self.max_solves = max_solves or Config.PARAMETRIC_SWEEP['MAX_SOLVES']
+        model_inputs.pop(parameter, None)
+
+        presolve = Config.PRESOLVE['ENABLED'] if presolve is None else presolve
+        if presolve and parameter in PRESOLVE_PARAMETERS and \
+                (model_inputs.get('add_delivery_time_constraint') or Config.ADD_DELIVERY_TIME_CONSTRAINT):
+            self._logger.info(f"[ParametricSweep] Presolve skipped, it depends on {parameter}.")
+            presolve = False
+        processed_data = processed_data if processed_data is not None else Preprocessing()
+        if presolve:
+            processed_data = Presolve(
+                processed_data, add_delivery_time_constraint=model_inputs.get('add_delivery_time_constraint'),
+                delivery_speed=model_inputs.get('delivery_speed'),
+                maximum_delivery_hrs_constraint=model_inputs.get('maximum_delivery_hrs_constraint'),
+            )
+        self.processed_data = processed_data
+        self.model_inputs = model_inputs
+
+        self.points = []  # One dict per solve, by increasing value once the sweep is done
+        self.breakpoints = []
+        self.intervals = []
+        with Tracer.span('parametric_sweep', parameter=parameter, start=start, stop=stop) as span:
+            self.model_builder = OptimisationModel(processed_data, **model_inputs)
+            try:
+                self.__sweep()
+            finally:
+                self.model_builder.release()
+            span.set_attributes(n_solves=self.n_solves, n_breakpoints=len(self.breakpoints))
+        self._logger.info(f"[ParametricSweep] {parameter} from {start} to {stop}: {len(self.breakpoints)} breakpoints "
+                          f"in {self.n_solves} solves, against {self.uniform_grid_solves} on a uniform grid.")
+
+    @property
+    def n_solves(self):
+        return len(self.points)
+
+    @property
+    def uniform_grid_solves(self):
+        """Solves of a uniform grid locating the breakpoints as precisely."""
+        return math.ceil((self.stop - self.start) / self.tolerance) + 1
+
+    @property
+    def result(self):
+        return {
+            'parameter': self.parameter,
+            'start': self.start,
+            'stop': self.stop,
+            'n_solves': self.n_solves,
+            'uniform_grid_solves': self.uniform_grid_solves,
+            'breakpoints': self.breakpoints,
+            'intervals': self.intervals,
+        }
+
+    def __sweep(self):
+        n_points = max(2, Config.PARAMETRIC_SWEEP['INITIAL_POINTS'])
+        initial_points = [self.__solve_at(self.start + (self.stop - self.start) * i / (n_points - 1))
+                          for i in range(n_points)]
+
+        # Depth-first from the last solved value, so the next midpoint is next to the previous solve
+        unresolved = list(zip(initial_points[:-1], initial_points[1:]))
+        while unresolved:
+            lower, upper = unresolved.pop()
+            if lower['selection'] == upper['selection']:
+                continue
+            if upper['value'] - lower['value'] <= self.tolerance or self.n_solves >= self.max_solves:
+                self.breakpoints.append(self.__breakpoint(lower, upper))
+                continue
+            middle = self.__solve_at((lower['value'] + upper['value']) / 2)
+            unresolved.extend([(lower, middle), (middle, upper)])
+
+        self.points.sort(key=lambda point: point['value'])
+        self.breakpoints.sort(key=lambda breakpoint: breakpoint['value'])
+        self.intervals = self.__intervals()
+
+    def __solve_at(self, value):
+        """Solve with the coefficient at the value, warm started from the current solution."""
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+        model = self.model_builder.model
+        getattr(model, self.parameter).set_value(value)
+        setattr(self.model_builder, self.parameter, value)
+
+        point = {'value': value}
+        with Tracer.span('sweep_solve', value=value) as span:
+            try:
+                model_solver = self.__run_solver(warm_start=bool(self.points))
+                if self.points and (model_solver.gap or 0) > Config.PARAMETRIC_SWEEP['TARGET_GAP']:
+                    # CBC can stop early on a poor solution when warm started from another value's solution
+                    self._logger.debug(f"[ParametricSweep] Gap {model_solver.gap} with {self.parameter} = {value} "
+                                       f"when warm started, solving again without.")
+                    model_solver = self.__run_solver(warm_start=False)
+            except ValueError as error:
+                # Infeasible at this value, e.g. too slow for the delivery time constraint
+                self._logger.warning(f"[ParametricSweep] No solution with {self.parameter} = {value}: {error}")
+                point.update(selection=None, objective=None, gap=None)
+            else:
+                point.update(
+                    selection=tuple(w for w in model.W if (model.x[w].value or 0) > 0.5),
+                    objective=pyo.value(model.obj), gap=model_solver.gap, **self.model_builder.cost_components(),
+                )
+            span.set_attributes(objective=point['objective'])
+        self.points.append(point)
+        return point
+
+    def __run_solver(self, warm_start):
+        return ModelSolver(
+            self.model_builder.model, priority=self.priority, deadline=self.deadline, cancel_token=self.cancel_token,
+            target_gap=Config.PARAMETRIC_SWEEP['TARGET_GAP'], warm_start=warm_start,
+        )
+
+    def __breakpoint(self, lower, upper):
+        lower_selection, upper_selection = set(lower['selection'] or []), set(upper['selection'] or [])
+        return {
+            'value': (lower['value'] + upper['value']) / 2,
+            'lower': lower['value'],  # The selection changes between lower and upper
+            'upper': upper['value'],
+            'opened': sorted(upper_selection - lower_selection),
+            'closed': sorted(lower_selection - upper_selection),
+            'feasible': (lower['selection'] is not None, upper['selection'] is not None),
+        }
+
+    def __intervals(self):
+        """Consecutive solved values with the same selection, bounded by the breakpoints around them."""
+        intervals = []
+        for point in self.points:
+            if intervals and intervals[-1]['selection'] == point['selection']:
+                intervals[-1]['points'].append(point)
+            else:
+                intervals.append({'selection': point['selection'], 'points': [point]})
+
+        bounds = [self.start] + [breakpoint['value'] for breakpoint in self.breakpoints] + [self.stop]
+        for interval, lower, upper in zip(intervals, bounds[:-1], bounds[1:]):
+            interval.update(lower=lower, upper=upper, feasible=interval['selection'] is not None,
+                            selection=list(interval['selection'] or []))
+            interval['points'] = [{k: v for k, v in point.items() if k != 'selection'} for point in interval['points']]
+        return intervals
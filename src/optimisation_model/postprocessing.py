@@ -4,6 +4,9 @@ from pathlib import Path
 import pyomo.environ as aml
 from conf import Config, Logger
 from src.data_connectors import PandasFileConnector
+from src.optimisation_model.presolve import Presolve
+from src.optimisation_model.aggregation import Aggregation
+from src.optimisation_model.decomposition import Decomposition
 
 
 class Postprocessing:
@@ -18,6 +21,23 @@ class Postprocessing:
         self.warehouse_selection_data = self.__warehouse_selection_data()
         self.warehouse_township_assignment_data = self.__warehouse_township_assignment_data()
         self.despatchers_data = self.__despatchers_data()
+        self.decomposition_report = None
+        self.aggregation_report = None
+        self.presolve_reductions = None
+        # Mapping the results of decomposed, aggregated or reduced inputs back to the original warehouses and townships
+        while isinstance(processed_data, (Decomposition, Aggregation, Presolve)):
+            self.warehouse_selection_data, self.warehouse_township_assignment_data, self.despatchers_data = \
+                processed_data.map_results(self.warehouse_selection_data, self.warehouse_township_assignment_data,
+                                           self.despatchers_data)
+            if isinstance(processed_data, Decomposition):
+                self.decomposition_report = processed_data.report
+            elif isinstance(processed_data, Aggregation):
+                self.aggregation_report = processed_data.report
+            else:
+                self.presolve_reductions = processed_data.reductions
+            processed_data = processed_data.original_data
+        self.solve_summary = getattr(solver_results, 'solve_summary', None)
+        self.solver_statistics = getattr(solver_results, 'statistics', {})
 
         # Converting results into a JSON format
         self.compiled_json_results = {
@@ -26,6 +46,11 @@ class Postprocessing:
             "warehouse_selection_data": self.warehouse_selection_data.to_dict(orient='records'),
             "warehouse_township_assignment_data": self.warehouse_township_assignment_data.to_dict(orient='records'),
             "despatchers_data": self.despatchers_data.to_dict(orient='records'),
+            "solve_summary": self.solve_summary,
+            "solver_statistics": self.solver_statistics,
+            "presolve_reductions": self.presolve_reductions,
+            "aggregation_report": self.aggregation_report,
+            "decomposition_report": self.decomposition_report,
         }
 
         # Exporting results
@@ -39,16 +64,23 @@ class Postprocessing:
                                      Path(Config.FILES['MODEL_OUTPUT'], "Despatcher Requirements.csv"))
             self._logger.debug("[Data Export] completed successfully.")
 
+    @property
+    def result_tables(self):
+        """Result tables by name, as returned in binary formats (e.g. Arrow) by the API."""
+        return {
+            "warehouse_selection_data": self.warehouse_selection_data,
+            "warehouse_township_assignment_data": self.warehouse_township_assignment_data,
+            "despatchers_data": self.despatchers_data,
+        }
+
     def __warehouse_selection_data(self):
         self._logger.debug("[PostProcessing] Warehouses' assignment detail is as such:")
-        warehouse_data = pd.DataFrame()
+        warehouse_rows = []
         for w in self.model.W:
-            append_row = pd.DataFrame({
-                'Name': w,
-                'Selected': True if self.model.x[w]() == 1 else False,
-            }, index=[0])
-            warehouse_data = pd.concat([warehouse_data, append_row], axis=0)
-            self._logger.debug(f"--> Warehouse: {append_row['Name'].values[0]} | Selected: {append_row['Selected'].values[0]}")
+            selected = True if self.model.x[w]() == 1 else False
+            warehouse_rows.append({'Name': w, 'Selected': selected})
+            self._logger.debug("--> Warehouse: %s | Selected: %s", w, selected)
+        warehouse_data = pd.DataFrame(warehouse_rows, columns=['Name', 'Selected'])
         return warehouse_data
 
     def __warehouse_township_assignment_data(self):
@@ -1,4 +1,5 @@
 import sys
+import hashlib
 import pandas as pd
 from typing import List, Dict
 from conf import Config, Logger
@@ -48,10 +49,15 @@ class Preprocessing:
         self.township_list: List[Township] = []
         self.warehouse_df = None
         self.township_df = None
-        self.__process_warehouses()
-        self.__process_townships()
+        self._distance_matrix = None
+        self._data_fingerprint = None
 
-    def __process_warehouses(self):
+        # Loading all input files concurrently
+        model_inputs = InputHandler.get_model_inputs()
+        self.__process_warehouses(model_inputs['warehouse_options'])
+        self.__process_townships(model_inputs['districts'])
+
+    def __process_warehouses(self, warehouses_df):
         """
         This function processes the technician dataset
         and save the data into the technician list.
@@ -59,7 +65,6 @@ class Preprocessing:
         self._logger.debug("[Preprocessing] __process_warehouses() initiated.")
 
         # Loading warehouse data
-        warehouses_df = InputHandler.get_warehouse_options()
         self.warehouse_df = warehouses_df
 
         # Selecting required columns and appending them to self.warehouse_list
@@ -75,7 +80,7 @@ class Preprocessing:
             
         self._logger.debug("[Preprocessing] __process_warehouses() completed.")
             
-    def __process_townships(self):
+    def __process_townships(self, townships_df):
         """
         This function processes the technician dataset
         and save the job details into the job list.
@@ -83,7 +88,6 @@ class Preprocessing:
         self._logger.debug("[Preprocessing] __process_townships() initiated.")
 
         # Loading townships data
-        townships_df = InputHandler.get_districts_data()
         self.township_df = townships_df
         
         # Selecting required columns and appending them to self.township_list
@@ -103,7 +107,36 @@ class Preprocessing:
     @property
     def township_data(self):
         return self.township_list
-        
+
+    @property
+    def distance_matrix(self) -> Dict[tuple, float]:
+        """
+        Haversine distances (km) between every warehouse and township, keyed by (warehouse name, township name).
+        Computed on first access and kept with the snapshot.
+        """
+        if self._distance_matrix is None:
+            from haversine import haversine
+            self._distance_matrix = {
+                (w.name, t.name): haversine((w.latitude, w.longitude), (t.latitude, t.longitude))
+                for t in self.township_list
+                for w in self.warehouse_list
+            }
+        return self._distance_matrix
+
+    @property
+    def data_fingerprint(self) -> str:
+        """
+        Hash of the warehouse and township inputs, identifying the snapshot's data. Computed on first access and kept
+        with the snapshot.
+        """
+        if self._data_fingerprint is None:
+            data_hash = hashlib.sha256()
+            for input_df in [self.warehouse_df, self.township_df]:
+                data_hash.update(','.join(map(str, input_df.columns)).encode())
+                data_hash.update(pd.util.hash_pandas_object(input_df, index=True).values.tobytes())
+            self._data_fingerprint = data_hash.hexdigest()
+        return self._data_fingerprint
+
 
 if __name__ == "__main__":
 
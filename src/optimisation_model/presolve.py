@@ -0,0 +1,260 @@
+"""
+Domain-specific presolve of the model inputs, between Preprocessing and OptimisationModel.
+
+Reductions, in this order:
+
+- Zero-demand townships are removed, nothing is assigned to them.
+- Co-located townships (within Config.PRESOLVE['MERGE_TOWNSHIPS_WITHIN_KM']) are merged into the one with the
+  largest demand, with the demand of the group.
+- Unreachable warehouses are removed when the delivery time constraint is added: the constraint applies to every
+  township, so a warehouse farther than the delivery time limit from any township cannot be selected.
+- Dominated warehouses are removed, only when Config.PRESOLVE['DOMINANCE_WITHIN_KM'] is set: those within that
+  distance of a warehouse that costs no more and holds no less. Unlike the reductions above this is not exact, a
+  dominated warehouse could still be worth opening on top of the warehouse dominating it when that one is full, which
+  is checked (and logged) when mapping the results back.
+
+Presolve exposes the same attributes as the Preprocessing snapshot it reduces, so OptimisationModel builds the
+reduced model from it. Postprocessing maps the results back to the original warehouses and townships with
+`map_results()`.
+"""
+
+import math
+import json
+import hashlib
+import pandas as pd
+from conf import Config, Logger
+from src.optimisation_model.preprocessing import Preprocessing, Township
+
+REMOVED_ZERO_DEMAND = 'zero_demand'
+REMOVED_UNREACHABLE = 'unreachable'
+REMOVED_DOMINATED = 'dominated'
+
+
+class Presolve:
+
+    def __init__(self, processed_data: Preprocessing, add_delivery_time_constraint: bool = None,
+                 delivery_speed: float = None, maximum_delivery_hrs_constraint: float = None):
+        """
+        Initialisation
+
+        Args:
+            processed_data (Preprocessing): Input snapshot to reduce. It is only read, never modified.
+            add_delivery_time_constraint (bool, optional): Whether the delivery time constraint is added, unreachable
+                warehouses are only removed if so. Defaults to Config setting.
+            delivery_speed (float, optional): Delivery speed of despatchers (km/h). Defaults to Config setting.
+            maximum_delivery_hrs_constraint (float, optional): Maximum limit within which deliveries must be made to
+                customers (hrs). Defaults to Config setting.
+        """
+        self._logger = Logger().logger
+        self.original_data = processed_data
+        self.add_delivery_time_constraint = add_delivery_time_constraint or Config.ADD_DELIVERY_TIME_CONSTRAINT
+        self.delivery_speed = delivery_speed or Config.OPT_PARAMS['delivery_speed']
+        self.maximum_delivery_hrs_constraint = \
+            maximum_delivery_hrs_constraint or Config.OPT_PARAMS['maximum_delivery_hrs_constraint']
+
+        # Input data is kept as loaded, the reduced warehouses and townships are listed in warehouse/township_list
+        self.warehouse_df = processed_data.warehouse_df
+        self.township_df = processed_data.township_df
+        self.removed_warehouses = {}  # Warehouse -> reason
+        self.dominated_by = {}  # Dominated warehouse -> warehouse dominating it
+        self.removed_townships = {}  # Township -> reason
+        self.merged_townships = {}  # Township -> township it was merged into, for the merged (non-kept) townships
+        self.dominance_binding = []  # Dominating warehouses found full after solving, see map_results()
+        self._distance_matrix = None
+        self._data_fingerprint = None
+
+        self.township_list = self.__reduce_townships(processed_data.township_list)
+        self.warehouse_list = self.__reduce_warehouses(processed_data.warehouse_list)
+        self._logger.info(f"[Presolve] Completed | {self.summary}")
+
+    @property
+    def summary(self):
+        """Numbers of warehouses and townships before and after the presolve, and of each reduction."""
+        return {
+            'n_warehouses': len(self.original_data.warehouse_list),
+            'n_warehouses_kept': len(self.warehouse_list),
+            'n_unreachable_warehouses': sum(r == REMOVED_UNREACHABLE for r in self.removed_warehouses.values()),
+            'n_dominated_warehouses': sum(r == REMOVED_DOMINATED for r in self.removed_warehouses.values()),
+            'n_townships': len(self.original_data.township_list),
+            'n_townships_kept': len(self.township_list),
+            'n_zero_demand_townships': len(self.removed_townships),
+            'n_merged_townships': len(self.merged_townships),
+        }
+
+    @property
+    def reductions(self):
+        """What the presolve eliminated, by original warehouse and township names."""
+        return {
+            'summary': self.summary,
+            'removed_warehouses': self.removed_warehouses,
+            'dominated_by': self.dominated_by,
+            'removed_townships': self.removed_townships,
+            'merged_townships': self.merged_townships,
+            'dominance_binding': self.dominance_binding,
+        }
+
+    @property
+    def distance_matrix(self):
+        """Distances of the original snapshot between the kept warehouses and townships."""
+        if self._distance_matrix is None:
+            original_distances = self.original_data.distance_matrix
+            self._distance_matrix = {
+                (w.name, t.name): original_distances[w.name, t.name]
+                for t in self.township_list
+                for w in self.warehouse_list
+            }
+        return self._distance_matrix
+
+    @property
+    def data_fingerprint(self):
+        """Hash of the original snapshot's fingerprint and the reductions, identifying the reduced model inputs."""
+        if self._data_fingerprint is None:
+            reduced_inputs = {
+                'warehouses': [w.name for w in self.warehouse_list],
+                'townships': [(t.name, t.demand) for t in self.township_list],
+            }
+            self._data_fingerprint = hashlib.sha256(
+                f"{self.original_data.data_fingerprint}:{json.dumps(reduced_inputs, default=str)}".encode()
+            ).hexdigest()
+        return self._data_fingerprint
+
+    def __reduce_townships(self, township_list):
+        kept_townships = []
+        for t in township_list:
+            if not t.demand > 0:
+                self.removed_townships[t.name] = REMOVED_ZERO_DEMAND
+            else:
+                kept_townships.append(t)
+
+        # Merging co-located townships into the one with the largest demand
+        merge_distance = Config.PRESOLVE['MERGE_TOWNSHIPS_WITHIN_KM']
+        if merge_distance is None:
+            return kept_townships
+        groups = []  # [(representative, [members])], members including the representative
+        for t in sorted(kept_townships, key=lambda t: -t.demand):
+            for representative, members in groups:
+                if self._distance(representative, t) <= merge_distance:
+                    members.append(t)
+                    self.merged_townships[t.name] = representative.name
+                    break
+            else:
+                groups.append((t, [t]))
+
+        merged = {
+            representative.name: Township(name=representative.name, district=representative.district,
+                                          latitude=representative.latitude, longitude=representative.longitude,
+                                          demand=sum(member.demand for member in members))
+            for representative, members in groups
+        }
+        return [merged[t.name] for t in kept_townships if t.name in merged]  # In input order
+
+    def __reduce_warehouses(self, warehouse_list):
+        kept_warehouses = []
+        for w in warehouse_list:
+            if self.add_delivery_time_constraint and self.__exceeds_delivery_time(w):
+                self.removed_warehouses[w.name] = REMOVED_UNREACHABLE
+            else:
+                kept_warehouses.append(w)
+
+        # Checking cheaper and larger warehouses first, so a warehouse is only dominated by a kept one
+        dominance_distance = Config.PRESOLVE['DOMINANCE_WITHIN_KM']
+        if dominance_distance is None:
+            return kept_warehouses
+        non_dominated = []
+        for w in sorted(kept_warehouses, key=lambda w: (w.monthly_cost, -w.capacity)):
+            dominating = next((
+                other for other in non_dominated
+                if other.monthly_cost <= w.monthly_cost and other.capacity >= w.capacity
+                and self._distance(other, w) <= dominance_distance
+            ), None)
+            if dominating is None:
+                non_dominated.append(w)
+            else:
+                self.removed_warehouses[w.name] = REMOVED_DOMINATED
+                self.dominated_by[w.name] = dominating.name
+        return [w for w in kept_warehouses if w.name not in self.removed_warehouses]  # In input order
+
+    def __exceeds_delivery_time(self, warehouse):
+        from src.optimisation_model.model import OptimisationModel
+
+        original_distances = self.original_data.distance_matrix
+        max_distance = max(
+            max(OptimisationModel.MIN_DISTANCE_KM, original_distances[warehouse.name, t.name])
+            for t in self.township_list
+        ) if self.township_list else 0
+        return max_distance / self.delivery_speed > self.maximum_delivery_hrs_constraint
+
+    @staticmethod
+    def _distance(location_1, location_2):
+        from haversine import haversine
+        return haversine((location_1.latitude, location_1.longitude), (location_2.latitude, location_2.longitude))
+
+    def map_results(self, warehouse_selection_data, warehouse_township_assignment_data, despatchers_data):
+        """
+        Map results of the reduced model back to the original warehouses and townships. Removed warehouses are not
+        selected, removed townships get nothing, and the supply and despatchers of merged townships are split by
+        demand (despatchers in whole numbers, keeping their total).
+
+        Args:
+            warehouse_selection_data (pd.DataFrame): Warehouse selection, one row per kept warehouse.
+            warehouse_township_assignment_data (pd.DataFrame): Supply per kept township (rows) and warehouse (columns).
+            despatchers_data (pd.DataFrame): Despatchers per kept township (rows) and warehouse (columns).
+
+        Returns:
+            tuple: The three DataFrames, with the original warehouses and townships in input order.
+        """
+        warehouse_names = [w.name for w in self.original_data.warehouse_list]
+        township_names = [t.name for t in self.original_data.township_list]
+        township_demands = {t.name: t.demand for t in self.original_data.township_list}
+
+        warehouse_selection_data = warehouse_selection_data.set_index('Name').reindex(warehouse_names) \
+            .fillna({'Selected': False}).astype({'Selected': bool}).rename_axis('Name').reset_index()
+
+        # Splitting the merged townships' supply and despatchers by demand
+        merge_groups = {}  # Representative -> townships merged into it, starting with itself
+        for township, representative in self.merged_townships.items():
+            merge_groups.setdefault(representative, [representative]).append(township)
+        assignment_rows = {t: row for t, row in warehouse_township_assignment_data.iterrows()}
+        despatcher_rows = {t: row for t, row in despatchers_data.iterrows()}
+        for representative, members in merge_groups.items():
+            demands = [township_demands[t] for t in members]
+            despatcher_splits = self._apportion(despatchers_data.loc[representative], demands)
+            representative_assignment = warehouse_township_assignment_data.loc[representative]
+            for township, demand, despatchers in zip(members, demands, despatcher_splits):
+                assignment_rows[township] = representative_assignment * demand / sum(demands)
+                despatcher_rows[township] = despatchers
+
+        warehouse_township_assignment_data = pd.DataFrame.from_dict(assignment_rows, orient='index') \
+            .reindex(index=township_names, columns=warehouse_names).fillna(0)
+        despatchers_data = pd.DataFrame.from_dict(despatcher_rows, orient='index') \
+            .reindex(index=township_names, columns=warehouse_names).fillna(0)
+
+        self.__check_dominance(warehouse_selection_data, warehouse_township_assignment_data)
+        return warehouse_selection_data, warehouse_township_assignment_data, despatchers_data
+
+    @staticmethod
+    def _apportion(despatchers, demands):
+        """Split each warehouse's despatchers by demand in whole numbers, keeping their total (largest remainder)."""
+        splits = [{} for _ in demands]
+        for warehouse, n_despatchers in despatchers.fillna(0).items():
+            exact = [n_despatchers * demand / sum(demands) for demand in demands]
+            whole = [math.floor(value) for value in exact]
+            by_remainder = sorted(range(len(exact)), key=lambda i: whole[i] - exact[i])
+            for i in by_remainder[:max(0, int(round(n_despatchers)) - sum(whole))]:
+                whole[i] += 1
+            for split, value in zip(splits, whole):
+                split[warehouse] = value
+        return [pd.Series(split, dtype=float) for split in splits]
+
+    def __check_dominance(self, warehouse_selection_data, warehouse_township_assignment_data):
+        """Dominated warehouses could have been worth opening if the warehouse dominating them is full."""
+        selected = set(warehouse_selection_data.loc[warehouse_selection_data['Selected'], 'Name'])
+        capacities = {w.name: w.capacity for w in self.original_data.warehouse_list}
+        supplied = warehouse_township_assignment_data.sum(axis=0)
+        self.dominance_binding = sorted(set(
+            dominating for dominating in self.dominated_by.values()
+            if dominating in selected and supplied[dominating] >= capacities[dominating] * (1 - 1e-6)
+        ))
+        if self.dominance_binding:
+            self._logger.warning(f"[Presolve] Warehouses {self.dominance_binding} are full and dominate removed "
+                                 f"warehouses, solve without presolve to check if opening those pays off.")
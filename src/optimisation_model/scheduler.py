@@ -0,0 +1,248 @@
+"""
+Node-level solve scheduler shared by all API workers on a machine.
+
+The number of concurrent solver processes is capped by a fixed set of slot lock files, and each solve is given CBC
+threads from the cores not used by the solves already running, so that the threads of all solves never exceed the
+number of cores. Solves are admitted one at a time by the head of the queue, which waits while fewer than
+MIN_THREADS_PER_SOLVE cores are free. Excess solves wait in a priority queue of ticket
+files (higher priority first, then first come first served) until a slot frees up or their deadline passes, and are
+rejected straight away once the queue is full. All locks are advisory file locks held by the owning process, so the
+slots and tickets of a crashed worker are released by the operating system.
+"""
+
+import os
+import math
+import time
+import uuid
+from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+from conf import Config, Logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock(file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SolveQueueFull(Exception):
+    """Raised when a solve is submitted while the queue is full."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SolveDeadlineExceeded(TimeoutError):
+    """Raised when a queued solve does not get a slot before its deadline."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SolveSlot:
+
+    def __init__(self, index, threads, deadline=None, queue_seconds=0.0):
+        self.index = index
+        self.threads = threads
+        self.deadline = deadline
+        self.queue_seconds = queue_seconds
+
+    def seconds_remaining(self):
+        """Seconds left until the deadline, None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+
+class SolveScheduler:
+
+    TICKET_SUFFIX = '.ticket'
+
+    _logger = Logger().logger
+    _recent_solve_seconds = deque(maxlen=20)
+
+    @classmethod
+    def max_concurrent_solves(cls):
+        settings = Config.SOLVE_SCHEDULER
+        return settings['MAX_CONCURRENT_SOLVES'] or max(1, (os.cpu_count() or 1) // settings['MIN_THREADS_PER_SOLVE'])
+
+    @classmethod
+    @contextmanager
+    def slot(cls, priority=0, deadline=None, cancel_token=None):
+        """
+        Wait for a solver slot and hold it for the duration of the `with` block.
+
+        Args:
+            priority (int, optional): Higher priorities are admitted first. Defaults to 0.
+            deadline (float, optional): Unix time by which the solve must have started (and should finish).
+                Defaults to waiting for up to Config.SOLVE_SCHEDULER['QUEUE_TIMEOUT_SECONDS'].
+            cancel_token (CancelToken, optional): Stops waiting when the job is cancelled. Defaults to None.
+
+        Raises:
+            SolveQueueFull: The queue already holds MAX_QUEUE_LENGTH solves.
+            SolveDeadlineExceeded: No slot became available before the deadline.
+            SolveCancelled: The job was cancelled while waiting.
+        """
+        lock_dir = Path(Config.SOLVE_SCHEDULER['LOCK_DIR'])
+        Path(lock_dir, 'queue').mkdir(parents=True, exist_ok=True)
+
+        start_time = time.perf_counter()
+        queue_deadline = deadline or time.time() + Config.SOLVE_SCHEDULER['QUEUE_TIMEOUT_SECONDS']
+        ticket_path, ticket_file = cls._enqueue(lock_dir, priority)
+        try:
+            slot_index, slot_file, threads = cls._wait_for_slot(lock_dir, ticket_path, queue_deadline, cancel_token)
+        finally:
+            cls._remove_ticket(ticket_path, ticket_file)
+        queue_seconds = time.perf_counter() - start_time
+
+        solve_start_time = time.perf_counter()
+        try:
+            cls._logger.info(f"[SolveScheduler] Slot {slot_index} acquired after {queue_seconds:.2f}s in queue, "
+                             f"solving with {threads} thread(s).")
+            yield SolveSlot(slot_index, threads, deadline, queue_seconds)
+        finally:
+            cls._recent_solve_seconds.append(time.perf_counter() - solve_start_time)
+            slot_file.seek(0)
+            slot_file.truncate()
+            _unlock(slot_file)
+            slot_file.close()
+            cls._logger.debug("[SolveScheduler] Slot %s released.", slot_index)
+
+    @classmethod
+    def queue_length(cls):
+        return len(cls._live_tickets(Path(Config.SOLVE_SCHEDULER['LOCK_DIR'])))
+
+    @classmethod
+    def retry_after(cls, queue_length=None):
+        """Estimated seconds until a solve submitted now would be admitted."""
+        queue_length = cls.queue_length() if queue_length is None else queue_length
+        if cls._recent_solve_seconds:
+            average_solve_seconds = sum(cls._recent_solve_seconds) / len(cls._recent_solve_seconds)
+        else:
+            average_solve_seconds = Config.SOLVE_SCHEDULER['DEFAULT_RETRY_AFTER_SECONDS']
+        return max(1, math.ceil(average_solve_seconds * math.ceil((queue_length + 1) / cls.max_concurrent_solves())))
+
+    @classmethod
+    def _enqueue(cls, lock_dir, priority):
+        live_tickets = cls._live_tickets(lock_dir)
+        if len(live_tickets) >= Config.SOLVE_SCHEDULER['MAX_QUEUE_LENGTH']:
+            raise SolveQueueFull(f"[SolveScheduler] Solve queue is full ({len(live_tickets)} waiting).",
+                                 retry_after=cls.retry_after(len(live_tickets)))
+
+        ticket_path = Path(lock_dir, 'queue', f"{priority}_{time.time_ns()}_{uuid.uuid4().hex[:8]}{cls.TICKET_SUFFIX}")
+        ticket_file = open(ticket_path, 'a+')
+        _try_lock(ticket_file)  # Held while waiting, so tickets of crashed workers can be told apart
+        return ticket_path, ticket_file
+
+    @classmethod
+    def _remove_ticket(cls, ticket_path, ticket_file):
+        _unlock(ticket_file)
+        ticket_file.close()
+        try:
+            ticket_path.unlink()
+        except OSError:
+            pass
+
+    @classmethod
+    def _live_tickets(cls, lock_dir):
+        """Return queued ticket paths in admission order, removing tickets left behind by crashed processes."""
+        tickets = []
+        grace_ns = Config.SOLVE_SCHEDULER['TICKET_GRACE_SECONDS'] * 1e9
+        for ticket_path in Path(lock_dir, 'queue').glob('*' + cls.TICKET_SUFFIX):
+            priority, enqueued_ns, _ = ticket_path.name.split('_', 2)
+            # Not locked by others while young, the enqueuing process may be about to lock it (see _enqueue)
+            if time.time_ns() - int(enqueued_ns) < grace_ns:
+                tickets.append((-int(priority), int(enqueued_ns), ticket_path))
+                continue
+            try:
+                with open(ticket_path, 'a+') as ticket_file:
+                    is_stale = _try_lock(ticket_file)
+                    if is_stale:
+                        _unlock(ticket_file)
+                if is_stale:
+                    ticket_path.unlink()
+                    continue
+            except OSError:
+                continue
+            tickets.append((-int(priority), int(enqueued_ns), ticket_path))
+        return [ticket_path for _, _, ticket_path in sorted(tickets)]
+
+    @classmethod
+    def _wait_for_slot(cls, lock_dir, ticket_path, deadline, cancel_token=None):
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+
+            live_tickets = cls._live_tickets(lock_dir)
+            # Only the head of the queue competes for a slot, so higher priorities and earlier arrivals go first, and
+            # it records its threads before leaving the queue, so the next head sees them
+            if not live_tickets or live_tickets[0] == ticket_path:
+                for slot_index in range(cls.max_concurrent_solves()):
+                    slot_file = open(Path(lock_dir, f"slot_{slot_index}.lock"), 'a+')
+                    if not _try_lock(slot_file):
+                        slot_file.close()
+                        continue
+                    threads = cls._assign_threads(lock_dir, slot_index)
+                    if threads:
+                        slot_file.seek(0)
+                        slot_file.truncate()
+                        slot_file.write(str(threads))
+                        slot_file.flush()
+                        return slot_index, slot_file, threads
+                    _unlock(slot_file)  # Too few free cores, waiting for a running solve to finish
+                    slot_file.close()
+                    break
+
+            if time.time() >= deadline:
+                raise SolveDeadlineExceeded("[SolveScheduler] No solver slot became available before the deadline.",
+                                            retry_after=cls.retry_after(len(live_tickets)))
+            time.sleep(Config.SOLVE_SCHEDULER['POLL_INTERVAL_SECONDS'])
+
+    @classmethod
+    def _assign_threads(cls, lock_dir, own_slot_index):
+        """
+        Give the solve the cores not used by the other running solves, up to MAX_THREADS_PER_SOLVE. Returns 0 while
+        fewer than MIN_THREADS_PER_SOLVE cores are free (or, on machines with fewer cores, while any solve runs).
+        """
+        busy_threads = 0
+        for slot_index in range(cls.max_concurrent_solves()):
+            if slot_index == own_slot_index:
+                continue
+            try:
+                with open(Path(lock_dir, f"slot_{slot_index}.lock"), 'a+') as slot_file:
+                    if _try_lock(slot_file):
+                        _unlock(slot_file)  # Slot is free
+                        continue
+                    slot_file.seek(0)
+                    busy_threads += int(slot_file.read().strip() or Config.SOLVE_SCHEDULER['MIN_THREADS_PER_SOLVE'])
+            except (OSError, ValueError):
+                busy_threads += Config.SOLVE_SCHEDULER['MIN_THREADS_PER_SOLVE']
+
+        cores = os.cpu_count() or 1
+        free_cores = cores - busy_threads
+        if free_cores < min(Config.SOLVE_SCHEDULER['MIN_THREADS_PER_SOLVE'], cores):
+            return 0
+        return int(min(Config.SOLVE_SCHEDULER['MAX_THREADS_PER_SOLVE'], free_cores))
@@ -0,0 +1,264 @@
+"""
+Single-flight coalescing of identical concurrent optimisation runs.
+
+Runs are identified by a fingerprint of their canonical parameters and input data. The first run of a fingerprint
+(the leader) computes the result, and identical runs submitted while it is in flight (the followers) wait for that
+result instead of starting their own solve. Within a worker they attach to the leader's in-memory flight. Across the
+workers of a machine the leading worker holds an advisory lock file per fingerprint and writes its result next to it
+before releasing the lock. Only in-flight runs are shared: a run submitted after the leader has finished starts a new
+flight.
+
+Errors raised for the leader's own request (cancellation, deadline, full solve queue) are not passed on, the next
+follower takes over as leader instead. Other errors, e.g. an infeasible model, are shared like results.
+"""
+
+import os
+import json
+import stat
+import time
+import uuid
+import pickle
+import hashlib
+import threading
+from pathlib import Path
+from conf import Config, Logger
+from src.optimisation_model.scheduler import SolveQueueFull, SolveDeadlineExceeded, _try_lock, _unlock
+from src.optimisation_model.cancellation import SolveCancelled
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed = False  # Whether result (or error) can be shared with the followers
+
+
+class SingleFlight:
+
+    LEADER = 'leader'
+    FOLLOWER = 'follower'
+    RESULT_SUFFIX = '.result'
+    REQUEST_ERRORS = (SolveCancelled, SolveQueueFull, SolveDeadlineExceeded)  # Specific to the leader's request
+
+    _logger = Logger().logger
+    _flights = {}
+    _flights_lock = threading.Lock()
+    _metrics = {}
+    _metrics_lock = threading.Lock()
+    _metrics_pid = None
+    _metrics_path = None
+    _private_dirs = set()
+
+    @staticmethod
+    def fingerprint(processed_data, **params):
+        """
+        Args:
+            processed_data (Preprocessing): Input snapshot the run is solved on.
+            **params: Parameters that change the run's result, e.g. the optimisation model inputs, solve profile and
+                target gap.
+
+        Returns:
+            str: Hash of the input data and the canonical (key-sorted) JSON of the parameters.
+        """
+        canonical_params = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(f"{processed_data.data_fingerprint}:{canonical_params}".encode()).hexdigest()
+
+    @classmethod
+    def run(cls, fingerprint, function, cancel_token=None):
+        """
+        Run `function` once for all concurrent calls with the same fingerprint on this machine.
+
+        Args:
+            fingerprint (str): Run fingerprint, see `SingleFlight.fingerprint()`.
+            function (callable): Computes the result, called without arguments. Results shared across workers must be
+                picklable.
+            cancel_token (CancelToken, optional): Stops waiting for the leader when the caller's job is cancelled or
+                its deadline passes. Defaults to None.
+
+        Returns:
+            tuple: Result and role of the call, SingleFlight.LEADER or SingleFlight.FOLLOWER.
+
+        Raises:
+            SolveCancelled: The caller's job was cancelled while waiting for the leader.
+        """
+        if not Config.SINGLE_FLIGHT['ENABLED']:
+            return function(), cls.LEADER
+
+        while True:
+            with cls._flights_lock:
+                flight = cls._flights.get(fingerprint)
+                is_leader = flight is None
+                if is_leader:
+                    flight = cls._flights[fingerprint] = _Flight()
+
+            if is_leader:
+                return cls._lead(fingerprint, flight, function, cancel_token)
+
+            cls._logger.info(f"[SingleFlight] Waiting for the identical run {fingerprint[:12]} in this worker.")
+            cls._wait_until(flight.done.is_set, cancel_token)
+            if flight.completed:
+                cls._count('local_followers')
+                return cls._shared_result(flight.result, flight.error), cls.FOLLOWER
+            cls._count('takeovers')  # Leader failed for its own request, competing to lead again
+
+    @classmethod
+    def metrics(cls):
+        """
+        Coalescing counts summed over the workers of this machine: leader_runs (runs that computed their result),
+        local_followers and remote_followers (runs that received the result of a leader in the same or another
+        worker), takeovers (followers retrying after their leader failed) and solves_saved.
+        """
+        metrics = dict(leader_runs=0, local_followers=0, remote_followers=0, takeovers=0, workers=0)
+        for metrics_path in Path(cls._lock_dir(), 'metrics').glob('*.json'):
+            try:
+                worker_metrics = json.loads(metrics_path.read_text())
+            except (OSError, ValueError):
+                continue
+            metrics['workers'] += 1
+            for key, value in worker_metrics.items():
+                metrics[key] = metrics.get(key, 0) + value
+        metrics['solves_saved'] = metrics['local_followers'] + metrics['remote_followers']
+        return metrics
+
+    @classmethod
+    def _lead(cls, fingerprint, flight, function, cancel_token):
+        lock_file = open(Path(cls._lock_dir(), fingerprint + '.lock'), 'a+')
+        joined_at = time.time()
+        is_locked = _try_lock(lock_file)
+        try:
+            if not is_locked:
+                # Another worker is running it, waiting for its result or, if it fails, to take over
+                cls._logger.info(f"[SingleFlight] Waiting for the identical run {fingerprint[:12]} in another worker.")
+                shared = {}
+                cls._wait_until(lambda: cls._read_result(fingerprint, joined_at, shared) or _try_lock(lock_file),
+                                cancel_token)
+                is_locked = not shared
+                if shared or cls._read_result(fingerprint, joined_at, shared):
+                    flight.result, flight.error, flight.completed = shared['result'], shared['error'], True
+                    cls._count('remote_followers')
+                    return cls._shared_result(flight.result, flight.error), cls.FOLLOWER
+                cls._count('takeovers')
+
+            cls._logger.debug(f"[SingleFlight] Leading run {fingerprint[:12]}.")
+            cls._count('leader_runs')
+            try:
+                flight.result = function()
+                flight.completed = True
+            except cls.REQUEST_ERRORS:
+                raise
+            except Exception as error:
+                flight.error, flight.completed = error, True
+                raise
+            finally:
+                if flight.completed:
+                    cls._write_result(fingerprint, flight.result, flight.error)
+            return flight.result, cls.LEADER
+        finally:
+            if is_locked:
+                _unlock(lock_file)
+            lock_file.close()
+            # Later runs start a new flight, results are not reused once the leader has finished
+            with cls._flights_lock:
+                del cls._flights[fingerprint]
+            flight.done.set()
+
+    @staticmethod
+    def _shared_result(result, error):
+        if error is not None:
+            raise error
+        return result
+
+    @classmethod
+    def _wait_until(cls, condition, cancel_token=None):
+        while not condition():
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            time.sleep(Config.SINGLE_FLIGHT['POLL_INTERVAL_SECONDS'])
+
+    @classmethod
+    def _write_result(cls, fingerprint, result, error):
+        """Write the leader's result for the other workers' followers, replacing it atomically."""
+        lock_dir = cls._lock_dir()
+        result_path = Path(lock_dir, fingerprint + cls.RESULT_SUFFIX)
+        temp_path = Path(lock_dir, f"{fingerprint}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(temp_path, 'wb') as temp_file:
+                pickle.dump({'finished_at': time.time(), 'result': result, 'error': error}, temp_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, result_path)
+        except Exception as write_error:
+            # e.g. an unpicklable error, the other workers' followers then take over
+            cls._logger.warning(f"[SingleFlight] Result of run {fingerprint[:12]} not shared: {write_error}")
+            if temp_path.exists():
+                temp_path.unlink()
+        cls._remove_expired_results(lock_dir)
+
+    @classmethod
+    def _read_result(cls, fingerprint, joined_at, shared):
+        """Load the result into `shared` if it was written after `joined_at`, i.e. by the run we waited for."""
+        result_path = Path(cls._lock_dir(), fingerprint + cls.RESULT_SUFFIX)
+        try:
+            if result_path.stat().st_mtime < joined_at - 1:  # Cheap check first, the timestamp inside is exact
+                return False
+            with open(result_path, 'rb') as result_file:
+                stored = pickle.load(result_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        if stored['finished_at'] < joined_at:
+            return False
+        shared.update(result=stored['result'], error=stored['error'])
+        return True
+
+    @classmethod
+    def _remove_expired_results(cls, lock_dir):
+        expiry_time = time.time() - Config.SINGLE_FLIGHT['RESULT_TTL_SECONDS']
+        for path in list(lock_dir.glob('*' + cls.RESULT_SUFFIX)) + list(lock_dir.glob('*.tmp')):
+            try:
+                if path.stat().st_mtime < expiry_time:
+                    path.unlink()
+            except OSError:
+                pass
+
+    @classmethod
+    def _lock_dir(cls):
+        """
+        Return Config.SINGLE_FLIGHT['LOCK_DIR'], created private to the user if missing.
+
+        Raises:
+            PermissionError: The directory or its parent is accessible to other users, or owned by another user. The
+                other workers' results are unpickled from it, so it must not be writable by anyone else.
+        """
+        lock_dir = Path(Config.SINGLE_FLIGHT['LOCK_DIR'])
+        if lock_dir in cls._private_dirs:
+            return lock_dir
+        for directory in (lock_dir.parent, lock_dir):
+            directory.mkdir(mode=0o700, parents=True, exist_ok=True)  # The ancestors of the parent are left as they are
+            if not hasattr(os, 'getuid'):  # Windows, the user's temp directory is private
+                continue
+            status = os.lstat(directory)
+            if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+                raise PermissionError(f"[SingleFlight] {directory} must be a directory owned by the current user "
+                                      f"with mode 0o700, results are not shared through it.")
+        cls._private_dirs.add(lock_dir)
+        return lock_dir
+
+    @classmethod
+    def _count(cls, metric):
+        """Increment this worker's count and publish the worker's counts for `SingleFlight.metrics()`."""
+        with cls._metrics_lock:
+            if cls._metrics_pid != os.getpid():  # New process, e.g. a forked worker
+                cls._metrics_pid = os.getpid()
+                cls._metrics = {}
+                cls._metrics_path = None
+            cls._metrics[metric] = cls._metrics.get(metric, 0) + 1
+            try:
+                if cls._metrics_path is None:
+                    cls._metrics_path = Path(cls._lock_dir(), 'metrics', f"{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+                    cls._metrics_path.parent.mkdir(exist_ok=True)
+                temp_path = cls._metrics_path.with_suffix('.tmp')
+                temp_path.write_text(json.dumps(cls._metrics))
+                os.replace(temp_path, cls._metrics_path)
+            except OSError as error:
+                cls._logger.warning(f"[SingleFlight] Metrics not published: {error}")
@@ -0,0 +1,199 @@
+"""
+Latency-tiered solve profiles (Config.SOLVE_PROFILES).
+
+'fast' solves the LP relaxation and then the MIP over only the warehouses the relaxation uses, 'balanced' solves the
+full MIP to a moderate gap, warm started from the 'fast' solution, and 'exact' solves the full MIP to a tight gap.
+'lagrangian' skips the solver, loading the best feasible solution of the Lagrangian relaxation (see LagrangianSolver).
+Without a profile the model is solved once with the default solver settings.
+"""
+
+import time
+import pyomo.environ as pyo
+from conf import Config, Logger
+from src.optimisation_model.solver import ModelSolver
+from src.optimisation_model.lagrangian import LagrangianSolver
+from src.optimisation_model.solver_log import relative_gap
+
+
+class ProfileSolver:
+
+    def __init__(self, model, solve_profile=None, priority=0, deadline=None, cancel_token=None,
+                 progress_callback=None, target_gap=None, model_builder=None) -> None:
+        """
+        Initialisation
+
+        Args:
+            model (pyo.ConcreteModel): Optimisation model to solve.
+            solve_profile (str, optional): Profile name, see Config.SOLVE_PROFILES. Defaults to solving once with
+                Config.OPTIMISATION_MODEL_CONFIG['SOLVER_OPTION'].
+            priority (int, optional): Scheduling priority, higher priorities are solved first. Defaults to 0.
+            deadline (float, optional): Unix time by which the run must have finished. The solver must finish the
+                profile's RESERVE_SECONDS earlier, leaving time for postprocessing. Defaults to None.
+            cancel_token (CancelToken, optional): See ModelSolver. Defaults to None.
+            progress_callback (callable, optional): See ModelSolver. Defaults to None.
+            target_gap (float, optional): See ModelSolver. Defaults to the profile's gap.
+            model_builder (OptimisationModel, optional): Builder of the model, whose inputs the Lagrangian relaxation
+                needs for the 'lagrangian' method and LAGRANGIAN_BOUND. Defaults to None.
+        """
+        self._logger = Logger().logger
+        self.model = model
+        self.solve_profile = solve_profile
+        self.profile = self.get_profile(solve_profile) if solve_profile is not None else {}
+        self.priority = priority
+        self.deadline = deadline
+        self.solver_deadline = deadline - self.profile.get('RESERVE_SECONDS', 0) if deadline is not None else None
+        self.cancel_token = cancel_token
+        self.progress_callback = progress_callback
+        self.target_gap = target_gap
+        self.model_builder = model_builder
+
+        self.model_solver = None
+        self.lagrangian = None
+        self.results = None
+        self.gap = None
+        self.lp_bound = None
+        self.threads = None
+        self.queue_seconds = 0.0
+        self.statistics = {}
+        self.log_paths = []
+        self.solve_summary = None
+        self.__solve()
+
+    @staticmethod
+    def get_profile(solve_profile):
+        """
+        Args:
+            solve_profile (str): Profile name.
+
+        Raises:
+            ValueError: Unknown profile.
+        """
+        if solve_profile not in Config.SOLVE_PROFILES:
+            raise ValueError(f"Unknown solve profile '{solve_profile}', choose from {list(Config.SOLVE_PROFILES)}.")
+        return Config.SOLVE_PROFILES[solve_profile]
+
+    def __solve(self):
+        start_time = time.perf_counter()
+        method = self.profile.get('METHOD', 'mip')
+        self._logger.info(f"[ProfileSolver] Solving with profile {self.solve_profile or 'default'} ({method}).")
+
+        if method == 'lp_rounding':
+            self.__solve_lp_rounding()
+            self.gap = relative_gap(pyo.value(self.model.obj), self.lp_bound)
+        elif method == 'mip':
+            if self.profile.get('WARM_START', False):
+                self.__solve_lp_rounding()
+                self.__release_warehouses()
+            self.model_solver = self.__run_solver(warm_start=self.profile.get('WARM_START', False))
+            self.gap = self.model_solver.gap
+        elif method == 'lagrangian':
+            self.model_solver = self.lagrangian = self.__run_lagrangian()
+            self.lagrangian.load_solution(self.model)
+            self.threads = 1
+            self.gap = self.lagrangian.gap
+        else:
+            raise ValueError(f"Unknown solve method '{method}' in profile {self.solve_profile}.")
+
+        # Bound from the Lagrangian relaxation, tighter than the LP relaxation's for the 'lp_rounding' gap, and its
+        # repaired solution if better than the solver's
+        if self.profile.get('LAGRANGIAN_BOUND', False) and self.lagrangian is None:
+            self.lagrangian = self.__run_lagrangian()
+            objective = pyo.value(self.model.obj)
+            sense = 1 if self.model.obj.sense == pyo.minimize else -1
+            if sense * (self.lagrangian.objective - objective) < 0:
+                self._logger.info(f"[ProfileSolver] Loading the Lagrangian solution ({self.lagrangian.objective}), "
+                                  f"better than the solver's ({objective}).")
+                self.lagrangian.load_solution(self.model)
+                self.gap = self.lagrangian.gap
+            else:
+                lagrangian_gap = relative_gap(objective, self.lagrangian.bound)
+                self.gap = lagrangian_gap if self.gap is None else min(self.gap, lagrangian_gap)
+
+        self.results = self.model_solver.results
+        self.statistics = dict(self.model_solver.statistics, queue_seconds=self.queue_seconds)
+        self.solve_summary = {
+            'solve_profile': self.solve_profile or 'default',
+            'method': method,
+            'objective': pyo.value(self.model.obj),
+            'gap': self.gap,
+            'termination_condition': str(self.results.solver.termination_condition),
+            'solve_seconds': time.perf_counter() - start_time,
+        }
+        if self.lagrangian is not None:
+            self.solve_summary.update(self.lagrangian.statistics)
+        self._logger.info(f"[ProfileSolver] Solved with profile {self.solve_summary['solve_profile']} in "
+                          f"{self.solve_summary['solve_seconds']:.2f}s, gap: {self.gap}.")
+
+    def __solve_lp_rounding(self):
+        """
+        Solve the LP relaxation, close the warehouses it leaves unused and solve the MIP over the remaining ones.
+        """
+        relaxed_vars = self.__relax_integer_vars()
+        try:
+            self.__run_solver()
+            self.lp_bound = pyo.value(self.model.obj)
+        finally:
+            self.__restore_integer_vars(relaxed_vars)
+
+        threshold = self.profile.get('ROUNDING_THRESHOLD', 1e-6)
+        closed_warehouses = [w for w in self.model.W if (self.model.x[w].value or 0) <= threshold]
+        self._logger.debug(f"[ProfileSolver] LP relaxation bound: {self.lp_bound}, closing "
+                           f"{len(closed_warehouses)}/{len(self.model.W)} warehouses.")
+        for w in closed_warehouses:
+            self.model.x[w].fix(0)
+
+        try:
+            self.model_solver = self.__run_solver()
+        except ValueError as error:
+            # Infeasible with those warehouses closed, e.g. when the delivery time constraint forbids opening the
+            # warehouses the relaxation used, or no solution was found in time
+            self._logger.warning(f"[ProfileSolver] Rounded model not solved ({error}), solving over all warehouses.")
+            self.__release_warehouses()
+            self.model_solver = self.__run_solver()
+
+    def __run_solver(self, warm_start=False):
+        solver = Config.OPTIMISATION_MODEL_CONFIG['SOLVER_TYPE']
+        model_solver = ModelSolver(
+            self.model, priority=self.priority, deadline=self.solver_deadline, cancel_token=self.cancel_token,
+            progress_callback=self.progress_callback, target_gap=self.target_gap,
+            solver_options=self.profile.get('SOLVER_OPTION', {}).get(solver), warm_start=warm_start,
+        )
+        self.queue_seconds += model_solver.queue_seconds
+        self.threads = model_solver.threads
+        if model_solver.log_path is not None:
+            self.log_paths.append(model_solver.log_path)
+        return model_solver
+
+    def __run_lagrangian(self):
+        if self.model_builder is None:
+            raise ValueError(f"Profile {self.solve_profile} uses the Lagrangian relaxation, which needs the model "
+                             f"builder.")
+        return LagrangianSolver.from_model_builder(self.model_builder, deadline=self.solver_deadline,
+                                                   cancel_token=self.cancel_token, target_gap=self.target_gap)
+
+    def __relax_integer_vars(self):
+        relaxed_vars = []
+        for var in self.model.component_data_objects(pyo.Var):
+            if var.is_integer() and not var.fixed:
+                relaxed_vars.append((var, var.domain, var.lb, var.ub))
+                lower_bound, upper_bound = var.lb, var.ub
+                var.domain = pyo.Reals
+                var.setlb(lower_bound)
+                var.setub(upper_bound)
+        return relaxed_vars
+
+    @staticmethod
+    def __restore_integer_vars(relaxed_vars):
+        for var, domain, lower_bound, upper_bound in relaxed_vars:
+            var.domain = domain
+            var.setlb(lower_bound)
+            var.setub(upper_bound)
+
+    def __release_warehouses(self):
+        """Undo the warehouse closures, keeping the current values as a starting solution."""
+        for w in self.model.W:
+            self.model.x[w].unfix()
+        # ModelSolver deactivates the constraints left without free variables by the closures
+        for constraint in self.model.component_data_objects(pyo.Constraint):
+            if not constraint.active:
+                constraint.activate()
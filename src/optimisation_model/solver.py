@@ -1,15 +1,61 @@
+import os
+import sys
+import time
+import threading
+import uuid
+import subprocess
 import pyomo.environ as pyo
+from pathlib import Path
 from datetime import datetime
-from conf import Config, Logger
+from contextlib import nullcontext
+from conf import Config, Logger, Tracer
+from pyomo.common.tempfiles import TempfileManager
 from pyomo.opt import SolverStatus, TerminationCondition
+from src.optimisation_model.scheduler import SolveScheduler
+from src.optimisation_model.cancellation import SolveCancelled
+from src.optimisation_model.solver_log import CbcLogParser, relative_gap
 
 
 class ModelSolver:
 
-    def __init__(self, model) -> None:
+    def __init__(self, model, threads=None, priority=0, deadline=None, cancel_token=None, progress_callback=None,
+                 target_gap=None, solver_options=None, warm_start=False) -> None:
+        """
+        Initialisation
+
+        Args:
+            model (pyo.ConcreteModel): Optimisation model to solve.
+            threads (int, optional): Solver threads. Defaults to the threads assigned by the SolveScheduler.
+            priority (int, optional): Scheduling priority, higher priorities are solved first. Defaults to 0.
+            deadline (float, optional): Unix time by which the solve must have finished. The solver time limit is
+                capped accordingly. Defaults to None.
+            cancel_token (CancelToken, optional): Token to cancel the queued or running solve. The solver process is
+                terminated and its files removed. Defaults to None.
+            progress_callback (callable, optional): Called from the solver output thread with each progress event
+                (incumbent, bound, gap, nodes) parsed from the CBC log, see CbcLogParser. Defaults to None.
+            target_gap (float, optional): Relative gap at which the solver stops with its incumbent, overriding the
+                configured ratioGap. Defaults to None.
+            solver_options (dict, optional): Solver options overriding Config.OPTIMISATION_MODEL_CONFIG['SOLVER_OPTION']
+                for this solve. Defaults to None.
+            warm_start (bool, optional): Pass the current variable values to the solver as a starting solution, if
+                the solver supports it. Defaults to False.
+        """
         self._logger = Logger().logger
         self.model = model
+        self.threads = threads
+        self.priority = priority
+        self.deadline = deadline
+        self.cancel_token = cancel_token
+        self.progress_callback = progress_callback
+        self.target_gap = target_gap
+        self.solver_options = solver_options or {}
+        self.warm_start = warm_start
+        self.queue_seconds = 0.0
         self.results = None
+        self.gap = None
+        self.statistics = {}
+        self.log_path = None
+        self._log_parser = None
         self.__solve()
 
     def __solve(self) -> None:
@@ -28,25 +74,201 @@ class ModelSolver:
         if Config.OPTIMISATION_MODEL_CONFIG['SOLVER_OPTION'].get(solver) is not None:
             for k, v in Config.OPTIMISATION_MODEL_CONFIG['SOLVER_OPTION'].get(solver).items():
                 opt.options[k] = v
+        for k, v in self.solver_options.items():
+            opt.options[k] = v
+        if self.target_gap is not None:
+            if solver == 'cbc':
+                opt.options['ratioGap'] = self.target_gap
+            else:
+                self._logger.warning(f"[ModelSolver] target_gap is only supported for cbc, ignored for {solver}.")
 
-        try:
-            start_time = datetime.now()
-            self._logger.debug("[ModelSolver] Solver starting...")
-            results = opt.solve(self.model, tee=True)
-            self.results = results
-            end_time = datetime.now()
-            self._logger.info(f"[ModelSolver] Solver completed in {end_time - start_time}.")
-        except Exception as e:
-            raise Exception(f"Model optimisation failed with {solver} with error message {e}.")
+        # Waiting for a solver slot, shared with the other workers on this machine
+        if Config.SOLVE_SCHEDULER['ENABLED']:
+            solve_slot = SolveScheduler.slot(priority=self.priority, deadline=self.deadline,
+                                             cancel_token=self.cancel_token)
+        else:
+            solve_slot = nullcontext()
+
+        with solve_slot as slot:
+            if slot is not None:
+                self.queue_seconds = slot.queue_seconds
+                self.threads = self.threads or slot.threads
+            if self.threads is not None and solver == 'cbc':
+                opt.options['threads'] = self.threads
+            if self.deadline is not None and solver == 'cbc':
+                seconds_remaining = max(1, int(self.deadline - datetime.now().timestamp()))
+                opt.options['seconds'] = min(opt.options.get('seconds', seconds_remaining), seconds_remaining)
+
+            # Running shell solvers (e.g. CBC) through our own subprocess runner, so they can be terminated, and their
+            # output logged and parsed while running
+            if hasattr(opt, '_execute_command'):
+                opt._execute_command = lambda command: self._run_solver_command(opt, command)
+
+            try:
+                start_time = datetime.now()
+                self._logger.debug("[ModelSolver] Solver starting...")
+                solve_kwargs = {}
+                if self.warm_start and opt.warm_start_capable():
+                    solve_kwargs['warmstart'] = True
+                results = opt.solve(self.model, tee=Config.OPTIMISATION_MODEL_CONFIG['SOLVER_TEE'], **solve_kwargs)
+                self.results = results
+                end_time = datetime.now()
+                self.statistics['wall_seconds'] = (end_time - start_time).total_seconds()
+                self._logger.info(f"[ModelSolver] Solver completed in {end_time - start_time}.")
+            except SolveCancelled:
+                raise
+            except Exception as e:
+                raise Exception(f"Model optimisation failed with {solver} with error message {e}.")
 
         if (results.solver.status == SolverStatus.ok) and (results.solver.termination_condition == TerminationCondition.optimal):
             self._logger.info("Solution is feasible and optimal")
-            results.write()
         elif results.solver.termination_condition == TerminationCondition.infeasible:
             raise ValueError("Model optimisation resulted into an infeasible solution")
+        elif self._log_parser is not None and self._log_parser.incumbent is None:
+            # Stopped (e.g. on the time limit) before finding a solution, the model still holds its previous values
+            raise ValueError(f"Model optimisation stopped without a feasible solution "
+                             f"({results.solver.termination_condition}).")
+        elif self._log_parser is not None and not self.__is_loaded_solution(self._log_parser.incumbent):
+            # CBC can write a blank solution file when it stops on a limit, although its log reports an incumbent
+            raise ValueError(f"Model optimisation returned a solution that differs from the solver's incumbent "
+                             f"{self._log_parser.incumbent} ({results.solver.termination_condition}).")
 
+        self.gap = self.__achieved_gap(results)
+        if self._log_parser is not None:
+            self.statistics.update(self._log_parser.statistics)
+        self.statistics.update(queue_seconds=self.queue_seconds, threads=self.threads)
+        self._logger.info(f"[ModelSolver] Solver statistics: {self.statistics}, log: {self.log_path}.")
         self.model.optimised = True
 
+    def __is_loaded_solution(self, objective_value, tolerance=1e-4):
+        """
+        Whether the objective of the values loaded into the model matches the given objective value. The tolerance is
+        relative, as CBC logs objective values with 6 significant digits, and the sign is ignored, as CBC versions
+        before 2.10.2 log maximisation objectives negated.
+        """
+        objective = next(self.model.component_data_objects(pyo.Objective, active=True))
+        loaded_value = pyo.value(objective, exception=False)
+        if loaded_value is None:
+            return False
+        return abs(abs(loaded_value) - abs(objective_value)) <= tolerance * max(1.0, abs(objective_value))
+
+    def __achieved_gap(self, results):
+        """Relative gap of the returned solution, from the solver log when available."""
+        if self._log_parser is not None and self._log_parser.gap is not None:
+            return self._log_parser.gap
+        upper_bound, lower_bound = results.problem.upper_bound, results.problem.lower_bound
+        if upper_bound is None or lower_bound is None or abs(upper_bound) == float('inf') or \
+                abs(lower_bound) == float('inf'):
+            return None
+        return relative_gap(upper_bound, lower_bound)
+
+    def _run_solver_command(self, opt, command):
+        """
+        Replacement for the shell solver's `_execute_command`, which runs the solver process to completion. The
+        process is polled instead, and terminated as soon as the job is cancelled or its deadline (plus a grace
+        period for the solver to stop at its own time limit) has passed. Its output is written to a per-run log file
+        and parsed for progress events and statistics on a separate thread as it is written.
+        """
+        start_time = time.time()
+        process = subprocess.Popen(
+            command.cmd,
+            stdin=subprocess.PIPE if 'script' in command else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=command.env,
+            cwd=command.cwd if 'cwd' in command else None,
+            universal_newlines=True,
+        )
+
+        log_lines = []
+        log_parser = self._log_parser = CbcLogParser()
+        self.log_path = self.__new_log_path()
+
+        def read_output():
+            log_file = open(self.log_path, 'w') if self.log_path is not None else None
+            try:
+                for line in process.stdout:
+                    handle_line(line, log_file)
+            finally:
+                if log_file is not None:
+                    log_file.close()
+
+        def handle_line(line, log_file):
+            log_lines.append(line)
+            if log_file is not None:
+                log_file.write(line)
+            if opt._tee:
+                sys.stdout.write(line)
+            progress = log_parser.parse_line(line)
+            if progress is not None and self.progress_callback is not None:
+                try:
+                    self.progress_callback(progress)
+                except Exception as error:
+                    # Keep draining the output, the solver blocks once the pipe is full
+                    self._logger.warning(f"[ModelSolver] Progress callback failed: {error}")
+
+        reader = threading.Thread(target=read_output, name='SolverOutputReader', daemon=True)
+        reader.start()
+        if 'script' in command:
+            process.stdin.write(command.script)
+            process.stdin.close()
+
+        try:
+            while True:
+                try:
+                    process.wait(timeout=Config.SOLVE_SCHEDULER['POLL_INTERVAL_SECONDS'])
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                if self.cancel_token is not None and \
+                        self.cancel_token.is_cancelled(grace_seconds=Config.SOLVE_SCHEDULER['DEADLINE_GRACE_SECONDS']):
+                    self._logger.warning(f"[ModelSolver] Terminating solver process {process.pid}: "
+                                         f"{self.cancel_token.reason}.")
+                    self.__terminate(process)
+                    self.__remove_solver_files(opt)
+                    raise SolveCancelled(f"Solve {self.cancel_token.reason}.", reason=self.cancel_token.reason)
+        finally:
+            if process.poll() is None:
+                self.__terminate(process)
+
+        reader.join()
+        opt._last_solve_time = time.time() - start_time
+        return [process.returncode, ''.join(log_lines)]
+
+    @staticmethod
+    def __new_log_path():
+        """Path of a new per-run solver log in SOLVER_LOG_DIR, removing the oldest logs beyond MAX_SOLVER_LOG_FILES."""
+        log_dir = Config.OPTIMISATION_MODEL_CONFIG['SOLVER_LOG_DIR']
+        if log_dir is None:
+            return None
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+        log_paths = sorted(Path(log_dir).glob('*.log'), key=lambda path: path.name)  # Oldest first
+        n_excess_logs = len(log_paths) + 1 - Config.OPTIMISATION_MODEL_CONFIG['MAX_SOLVER_LOG_FILES']
+        for log_path in log_paths[:max(0, n_excess_logs)]:
+            try:
+                log_path.unlink()
+            except OSError:
+                pass
+        run_id = Tracer.current_trace_id() or 'run'
+        return Path(log_dir, f"{datetime.now():%Y%m%d-%H%M%S}_{run_id}_{uuid.uuid4().hex[:8]}.log")
+
+    @staticmethod
+    def __terminate(process):
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    @staticmethod
+    def __remove_solver_files(opt):
+        # opt.solve() skips its own cleanup (_postsolve) when the solver is interrupted
+        for file_path in list(opt._problem_files or []) + [opt._soln_file, opt._log_file]:
+            if file_path is not None and os.path.exists(file_path):
+                os.remove(file_path)
+        TempfileManager.pop(remove=True)
+
 
 if __name__ == "__main__":
     
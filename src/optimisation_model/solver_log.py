@@ -0,0 +1,221 @@
+"""
+Parsing of CBC's log output.
+
+CbcLogParser is fed the solver output line by line while CBC runs. It turns the progress lines into events holding
+the incumbent objective, best bound, gap and nodes explored so far, e.g.:
+
+Cbc0012I Integer solution of 1234.5 found by feasibility pump after 0 iterations and 0 nodes (0.12 seconds)
+Cbc0004I Integer solution of 1200 found after 345 iterations and 12 nodes (1.23 seconds)
+Cbc0010I After 100 nodes, 12 on tree, 1200 best solution, best possible 1150.5 (3.45 seconds)
+Cbc0001I Search completed - best objective 1190, took 5678 iterations and 90 nodes (12.34 seconds)
+
+and collects the run statistics (presolve reductions, root bound, cuts, nodes, time to first incumbent, final gap and
+solver time) from the rest of the log, see `CbcLogParser.statistics`.
+"""
+
+import re
+
+_NUMBER = r'(-?[\d.]+(?:e[+-]?\d+)?)'
+NO_SOLUTION_OBJECTIVE = 1e50  # Placeholder objective CBC reports while (or when finishing) without a solution
+
+INCUMBENT_PATTERN = re.compile(
+    r'Cbc00(?:04|12|16)I Integer solution of ' + _NUMBER + r' found.*?after \d+ iterations and (\d+) nodes '
+    r'\(([\d.]+) seconds\)'
+)
+PROGRESS_PATTERN = re.compile(
+    r'Cbc0010I After (\d+) nodes, \d+ on tree, ' + _NUMBER + r' best solution, best possible ' + _NUMBER +
+    r' \(([\d.]+) seconds\)'
+)
+COMPLETED_PATTERN = re.compile(
+    r'Cbc0001I Search completed - best objective ' + _NUMBER + r', took (\d+) iterations and (\d+) nodes '
+    r'\(([\d.]+) seconds\)'
+)
+PARTIAL_SEARCH_PATTERN = re.compile(
+    r'Cbc0005I Partial search - best objective ' + _NUMBER + r' \(best possible ' + _NUMBER + r'\), took (\d+) '
+    r'iterations and (\d+) nodes \(([\d.]+) seconds\)'
+)
+ROOT_BOUND_PATTERN = re.compile(r'Continuous objective value is ' + _NUMBER + r' - ([\d.]+) seconds')
+GAP_EXIT_PATTERN = re.compile(r'Cbc0011I Exiting as integer gap of ' + _NUMBER)
+
+# Statistics only
+PRESOLVE_PATTERN = re.compile(r'^Presolve (\d+) \((-?\d+)\) rows, (\d+) \((-?\d+)\) columns')
+PREPROCESSED_PATTERN = re.compile(r'Cgl0004I processed model has (\d+) rows, (\d+) columns \((\d+) integer')
+TIGHTENED_PATTERN = re.compile(r'Cgl0003I (\d+) fixed, (\d+) tightened bounds')
+ROOT_CUTS_PATTERN = re.compile(
+    r'Cbc0013I At root node, (\d+) cuts changed objective from ' + _NUMBER + r' to ' + _NUMBER + r' in (\d+) passes'
+)
+CUT_GENERATOR_PATTERN = re.compile(r'Cbc0014I Cut generator \d+ \((\w+)\) - (\d+) row cuts')
+RESULT_PATTERN = re.compile(r'^Result - (.+?)\s*$')
+SUMMARY_OBJECTIVE_PATTERN = re.compile(r'^Objective value:\s+' + _NUMBER)
+SUMMARY_BOUND_PATTERN = re.compile(r'^Lower bound:\s+' + _NUMBER)
+SUMMARY_GAP_PATTERN = re.compile(r'^Gap:\s+' + _NUMBER)
+SUMMARY_TIME_PATTERN = re.compile(r'^Time \(Wallclock seconds\):\s+' + _NUMBER)
+
+
+def relative_gap(incumbent, bound):
+    if incumbent is None or bound is None:
+        return None
+    return abs(incumbent - bound) / max(1e-10, abs(incumbent))
+
+
+class CbcLogParser:
+
+    def __init__(self):
+        self.incumbent = None
+        self.bound = None
+        self.gap = None
+        self.nodes = 0
+        self.seconds = 0.0
+        self._absolute_gap_at_exit = None
+        self._statistics = {}
+        self._cuts_by_generator = {}
+
+    @property
+    def statistics(self):
+        """
+        Run statistics parsed so far: presolve reductions (presolve_rows_removed, presolve_columns_removed,
+        preprocessed_rows, preprocessed_columns, preprocessed_integers, fixed_columns, tightened_bounds), root bounds
+        (root_lp_bound, root_bound_after_cuts, root_cuts, root_cut_passes), cuts_generated, nodes, iterations,
+        n_incumbents, seconds_to_first_incumbent, objective, bound, gap, result and solver_seconds. Statistics that
+        did not appear in the log are left out.
+        """
+        statistics = dict(self._statistics, nodes=self.nodes)
+        if self._cuts_by_generator:
+            statistics['cuts_generated'] = sum(self._cuts_by_generator.values())
+        for key, value in [('objective', self.incumbent), ('bound', self.bound), ('gap', self.gap)]:
+            if value is not None:
+                statistics[key] = value
+        return statistics
+
+    def parse_line(self, line):
+        """
+        Update the solver state from one log line.
+
+        Args:
+            line (str): CBC log line.
+
+        Returns:
+            dict: Progress event ('incumbent', 'progress', 'completed' or 'root_bound') with the current incumbent,
+                bound, gap, nodes and solver seconds, or None if the line holds no progress information.
+        """
+        match = INCUMBENT_PATTERN.search(line)
+        if match:
+            self.incumbent = float(match.group(1))
+            self.nodes, self.seconds = int(match.group(2)), float(match.group(3))
+            self.gap = relative_gap(self.incumbent, self.bound)
+            self._statistics['n_incumbents'] = self._statistics.get('n_incumbents', 0) + 1
+            self._statistics.setdefault('seconds_to_first_incumbent', self.seconds)
+            return self._event('incumbent')
+
+        match = PROGRESS_PATTERN.search(line)
+        if match:
+            self.nodes = int(match.group(1))
+            self.incumbent, self.bound = float(match.group(2)), float(match.group(3))
+            self.seconds = float(match.group(4))
+            # CBC reports a huge placeholder as incumbent until a solution is found
+            if abs(self.incumbent) >= NO_SOLUTION_OBJECTIVE:
+                self.incumbent = None
+            self.gap = relative_gap(self.incumbent, self.bound)
+            return self._event('progress')
+
+        match = COMPLETED_PATTERN.search(line)
+        if match:
+            self.incumbent = float(match.group(1))
+            self._statistics['iterations'] = int(match.group(2))
+            self.nodes, self.seconds = int(match.group(3)), float(match.group(4))
+            if self._absolute_gap_at_exit is None:  # Search completed without stopping early, i.e. proven optimal
+                self.bound, self.gap = self.incumbent, 0.0
+            else:
+                self.gap = self._absolute_gap_at_exit / max(1e-10, abs(self.incumbent))
+            return self._event('completed')
+
+        match = PARTIAL_SEARCH_PATTERN.search(line)
+        if match:
+            self.incumbent, self.bound = float(match.group(1)), float(match.group(2))
+            if abs(self.incumbent) >= NO_SOLUTION_OBJECTIVE:
+                self.incumbent = None
+            self._statistics['iterations'] = int(match.group(3))
+            self.nodes, self.seconds = int(match.group(4)), float(match.group(5))
+            self.gap = relative_gap(self.incumbent, self.bound)
+            return self._event('completed')
+
+        match = ROOT_BOUND_PATTERN.search(line)
+        if match:
+            self.bound, self.seconds = float(match.group(1)), float(match.group(2))
+            self.gap = relative_gap(self.incumbent, self.bound)
+            self._statistics['root_lp_bound'] = self.bound
+            return self._event('root_bound')
+
+        self._parse_statistics(line)
+        return None
+
+    def _parse_statistics(self, line):
+        match = CUT_GENERATOR_PATTERN.search(line)
+        if match:
+            # Reported per generator after the root node and again at the end, the last report counts
+            self._cuts_by_generator[match.group(1)] = int(match.group(2))
+            return
+
+        match = GAP_EXIT_PATTERN.search(line)
+        if match:
+            self._absolute_gap_at_exit = float(match.group(1))
+            return
+
+        match = ROOT_CUTS_PATTERN.search(line)
+        if match:
+            self._statistics.update(root_cuts=int(match.group(1)), root_bound_after_cuts=float(match.group(3)),
+                                    root_cut_passes=int(match.group(4)))
+            return
+
+        match = PRESOLVE_PATTERN.search(line)
+        if match:
+            self._statistics.update(presolve_rows_removed=-int(match.group(2)),
+                                    presolve_columns_removed=-int(match.group(4)))
+            return
+
+        match = PREPROCESSED_PATTERN.search(line)
+        if match:
+            self._statistics.update(preprocessed_rows=int(match.group(1)), preprocessed_columns=int(match.group(2)),
+                                    preprocessed_integers=int(match.group(3)))
+            return
+
+        match = TIGHTENED_PATTERN.search(line)
+        if match:
+            self._statistics.update(fixed_columns=int(match.group(1)), tightened_bounds=int(match.group(2)))
+            return
+
+        # Result summary
+        match = RESULT_PATTERN.search(line)
+        if match:
+            self._statistics['result'] = match.group(1)
+            return
+
+        match = SUMMARY_OBJECTIVE_PATTERN.search(line)
+        if match:
+            # The placeholder means CBC returned no solution, even if it reported incumbents during the search
+            self.incumbent = float(match.group(1)) if abs(float(match.group(1))) < NO_SOLUTION_OBJECTIVE else None
+            return
+
+        match = SUMMARY_BOUND_PATTERN.search(line)
+        if match:
+            self.bound = float(match.group(1))
+            return
+
+        match = SUMMARY_GAP_PATTERN.search(line)
+        if match:
+            self.gap = abs(float(match.group(1))) if self.incumbent is not None else None
+            return
+
+        match = SUMMARY_TIME_PATTERN.search(line)
+        if match:
+            self._statistics['solver_seconds'] = float(match.group(1))
+
+    def _event(self, event_type):
+        return {
+            'event': event_type,
+            'seconds': self.seconds,
+            'incumbent': self.incumbent,
+            'bound': self.bound,
+            'gap': self.gap,
+            'nodes': self.nodes,
+        }
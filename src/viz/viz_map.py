@@ -44,7 +44,7 @@ def viz_warehouse_selection(
         name='Warehouse Locations',
         lat=selected_warehouses_df['Latitude'],
         lon=selected_warehouses_df['Longitude'],
-        text="<b>" + selected_warehouses_df['Warehouse Location'] + "</b><br>Capacity: " +
+        text="<b>" + selected_warehouses_df['Warehouse Location'].astype(str) + "</b><br>Capacity: " +
              selected_warehouses_df['Area (sqft)'].map(lambda x: '{:,.0f}'.format(x)) + " sqft <br>Monthly Cost: RM " +
              selected_warehouses_df['Cost (RM/month)'].map(lambda x: '{:,.2f}'.format(x)) + " /month",
         marker=go.scattermapbox.Marker(
@@ -57,7 +57,7 @@ def viz_warehouse_selection(
         name='(Unselected) Warehouse Locations',
         lat=unselected_warehouses_df['Latitude'],
         lon=unselected_warehouses_df['Longitude'],
-        text="<b>" + unselected_warehouses_df['Warehouse Location'] + "</b><br>Capacity: " +
+        text="<b>" + unselected_warehouses_df['Warehouse Location'].astype(str) + "</b><br>Capacity: " +
              unselected_warehouses_df['Area (sqft)'].map(lambda x: '{:,.0f}'.format(x)) + " sqft <br>Monthly Cost: RM " +
              unselected_warehouses_df['Cost (RM/month)'].map(lambda x: '{:,.2f}'.format(x)) + " /month",
         marker=go.scattermapbox.Marker(
@@ -71,7 +71,7 @@ def viz_warehouse_selection(
         name='Townships',
         lat=townships_df['Latitude'],
         lon=townships_df['Longitude'],
-        text="<b>" + townships_df['Township'] + "</b><br>Demand: " +
+        text="<b>" + townships_df['Township'].astype(str) + "</b><br>Demand: " +
              townships_df['Demand'].map(lambda x: '{:,.0f}'.format(x)),
         marker=go.scattermapbox.Marker(
             size=15, color='#FF8C00', opacity=0.75, allowoverlap=True
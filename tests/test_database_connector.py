@@ -0,0 +1,81 @@
+"""
+DatabaseConnector bulk writer, round trips through SQLite as a local stand-in database.
+"""
+
+import pandas as pd
+import pytest
+from src.data_connectors.DatabaseFileConnector import DatabaseConnector
+
+
+@pytest.fixture(params=[None, 'main', 'other'], ids=['default_schema', 'main_schema', 'attached_schema'])
+def connector(request, tmp_path):
+    connector = DatabaseConnector(host=None, port=None, username=None, password=None,
+                                  database=str(tmp_path / 'test.sqlite'), db_type='sqlite', schema_name=request.param)
+    if request.param == 'other':
+        # A second database attached as a non-default schema, as with a postgresql/mssql schema
+        from sqlalchemy import event
+        create_engine = connector._create_engine
+
+        def create_engine_with_attached_schema(**kwargs):
+            engine_conn = create_engine(**kwargs)
+            event.listen(engine_conn, 'connect', lambda dbapi_conn, _: dbapi_conn.execute(
+                f"ATTACH DATABASE '{tmp_path / 'other.sqlite'}' AS other"))
+            return engine_conn
+
+        connector._create_engine = create_engine_with_attached_schema
+    return connector
+
+
+def _table_names(connector):
+    from sqlalchemy import inspect
+    engine_conn = connector._create_engine()
+    try:
+        return inspect(engine_conn).get_table_names(schema=connector.schema_name)
+    finally:
+        engine_conn.dispose()
+
+
+def test_bulk_save_replace_with_staging_table(connector):
+    first_df = pd.DataFrame({'Township': ['Ampang', 'Kajang'], 'Demand': [1.5, 2.5]})
+    second_df = pd.DataFrame({'Township': ['Cheras', 'Rawang', 'Meru'], 'Demand': [3.0, 4.0, 5.0]})
+
+    assert connector.save(first_df, 'demand', bulk=True, use_staging_table=True)['rows'] == 2
+    assert connector.save(second_df, 'demand', bulk=True, use_staging_table=True)['rows'] == 3
+
+    pd.testing.assert_frame_equal(connector.load('demand'), second_df)
+    assert _table_names(connector) == ['demand']  # The staging table was swapped in, not left behind
+
+
+def test_bulk_save_replace_leaves_other_schemas(connector, tmp_path):
+    other_connector = DatabaseConnector(host=None, port=None, username=None, password=None,
+                                        database=str(tmp_path / 'test.sqlite'), db_type='sqlite')
+    other_df = pd.DataFrame({'Township': ['Ampang'], 'Demand': [1.0]})
+    other_connector.save(other_df, 'demand', bulk=True)
+    data_df = pd.DataFrame({'Township': ['Cheras', 'Rawang'], 'Demand': [3.0, 4.0]})
+
+    connector.save(data_df, 'demand', bulk=True, use_staging_table=True)
+    connector.save(data_df, 'demand', bulk=True, use_staging_table=True)
+
+    pd.testing.assert_frame_equal(connector.load('demand'), data_df)
+    if connector.schema_name == 'other':
+        pd.testing.assert_frame_equal(other_connector.load('demand'), other_df)
+
+
+def test_bulk_save_append(connector):
+    first_df = pd.DataFrame({'Township': ['Ampang', 'Kajang'], 'Demand': [1.5, 2.5]})
+    second_df = pd.DataFrame({'Township': ['Cheras'], 'Demand': [3.0]})
+
+    connector.save(first_df, 'demand', bulk=True, use_staging_table=True)
+    connector.save(second_df, 'demand', if_exist_do='append', bulk=True, use_staging_table=True)
+
+    expected_df = pd.concat([first_df, second_df], ignore_index=True)
+    pd.testing.assert_frame_equal(connector.load('demand'), expected_df)
+    assert _table_names(connector) == ['demand']
+
+
+def test_bulk_save_batches_within_sqlite_variable_limit(connector):
+    data_df = pd.DataFrame({f'column_{i}': range(500) for i in range(10)})
+
+    connector.save(data_df, 'wide', bulk=True, batch_size=10_000)
+
+    pd.testing.assert_frame_equal(connector.load('wide'), data_df)
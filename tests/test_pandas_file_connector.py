@@ -0,0 +1,41 @@
+"""
+PandasFileConnector loading of feather files and directories of feather files (Arrow datasets).
+"""
+
+import pandas as pd
+import pytest
+from src.data_connectors.PandasFileConnector import FeatherFileConnector
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def feather_dir(tmp_path):
+    pd.DataFrame({'Township': ['Ampang', 'Kajang'], 'Demand': [1.5, 2.5]}).to_feather(tmp_path / 'part-0.feather')
+    pd.DataFrame({'Township': ['Cheras', 'Rawang'], 'Demand': [3.0, 4.0]}).to_feather(tmp_path / 'part-1.feather')
+    return tmp_path
+
+
+def _sorted(data_df):
+    return data_df.sort_values('Township').reset_index(drop=True)
+
+
+def test_load_directory(feather_dir):
+    data_df = FeatherFileConnector.load(feather_dir)
+    assert _sorted(data_df)['Township'].tolist() == ['Ampang', 'Cheras', 'Kajang', 'Rawang']
+
+
+def test_load_directory_columns(feather_dir):
+    data_df = FeatherFileConnector.load(feather_dir, columns=['Township'])
+    assert list(data_df.columns) == ['Township']
+    assert len(data_df) == 4
+
+
+def test_load_directory_filters(feather_dir):
+    data_df = FeatherFileConnector.load(feather_dir, columns=['Township'], filters=[('Demand', '>', 2.0)])
+    assert _sorted(data_df)['Township'].tolist() == ['Cheras', 'Kajang', 'Rawang']
+
+
+def test_load_file(feather_dir):
+    data_df = FeatherFileConnector.load(feather_dir / 'part-0.feather', filters=[('Township', '==', 'Kajang')])
+    assert data_df['Demand'].tolist() == [2.5]